@@ -33,6 +33,89 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'diaryvault.com', 'www.diaryvault.com
 
 # API Keys
 GROK_API_KEY = os.getenv('GROK_API_KEY')
+# Point at a local stub server in tests/benchmarks
+GROQ_API_BASE_URL = os.getenv('GROQ_API_BASE_URL', 'https://api.groq.com/openai/v1')
+LLM_HTTP_POOL_SIZE = int(os.getenv('LLM_HTTP_POOL_SIZE', '20'))  # Keep-alive connections per process
+
+# Circuit breaker around the LLM provider (state shared through the cache)
+LLM_CIRCUIT_BREAKER = {
+    'window_seconds': 60,        # Rolling window for error and slow-call rates
+    'bucket_seconds': 10,
+    'min_calls': 10,             # Calls in the window before the rates count
+    'error_rate': 0.5,
+    'slow_call_seconds': 20,
+    'slow_rate': 0.5,
+    'open_seconds': 30,          # First open period; doubles on failed probes
+    'max_open_seconds': 300,
+    'probe_timeout': 60,         # Lock on the single half-open probe
+    'timeout_min_samples': 20,   # Successful calls before timeouts adapt
+    'timeout_multiplier': 3,     # Adaptive timeout = p95 latency x multiplier
+    'timeout_floor': 5,
+}
+
+# Outbound LLM rate limits, shared by all workers through Redis when configured
+LLM_RATE_LIMITS = {
+    'requests_per_minute': int(os.getenv('LLM_REQUESTS_PER_MINUTE', '30')),
+    'tokens_per_minute': int(os.getenv('LLM_TOKENS_PER_MINUTE', '12000')),
+    'interactive_reserve': 0.3,        # Share of each bucket background calls may not use
+    'interactive_max_wait': 10,        # Seconds an interactive call waits for capacity
+    'background_max_wait': 2,          # ...after which a background task is rescheduled
+    'background_queues': ('ai_tasks',),
+    'background_max_deferrals': 20,    # Rate-limit reschedules before a task gives up
+    'max_block_seconds': 60,           # Cap on a provider 429 Retry-After pause
+}
+
+# USD per million tokens (input, output), for AIGenerationLog.cost
+LLM_PRICING = {
+    'llama-3.3-70b-versatile': (0.59, 0.79),
+    'llama3-70b-8192': (0.59, 0.79),
+    'llama-3.1-8b-instant': (0.05, 0.08),
+    'llama3-8b-8192': (0.05, 0.08),
+}
+
+# AIGenerationLog rows are queued in-process and written in batches off the request path
+AI_LOG_BUFFER = {
+    'enabled': os.getenv('AI_LOG_BUFFER_ENABLED', 'True') == 'True',
+    'batch_size': 50,            # Flush as soon as this many rows are waiting
+    'flush_seconds': 5,          # ...or this long after the oldest was queued
+    'max_pending': 5000,         # Oldest rows are dropped beyond this if the DB falls behind
+    'compress_over': 2000,       # Prompts/outputs longer than this (chars) are stored compressed
+}
+
+# AI response cache: TTL in seconds per call site policy
+AI_CACHE_TTLS = {
+    'default': 60 * 60,
+    'journal_entry': 60 * 60 * 24,
+    'title': 60 * 60 * 24,
+    'summary': 60 * 60 * 24 * 7,
+    'insights': 60 * 60 * 24,
+    'chapter_introduction': 60 * 60 * 24 * 30,
+    'reflection_questions': 60 * 60 * 24 * 30,
+    'readers_guide': 60 * 60 * 24 * 30,
+    'marketability': 60 * 60 * 24 * 7,
+    'marketing_copy': 60 * 60 * 24 * 7,
+    'journal_structure': 60 * 60 * 24 * 7,
+    'thematic_connections': 60 * 60 * 24 * 7,
+    'biography_summary': 60 * 60 * 24 * 90,  # Keyed on the summarized entries' content
+}
+AI_CACHE_LOCAL_TTL = 300  # In-process LRU keeps entries at most 5 minutes
+AI_CACHE_LOCAL_MAX_ENTRIES = 512
+
+# Batched entry summaries: prompt budget and output allowance per entry (fits an 8k context)
+AI_SUMMARY_BATCH_INPUT_TOKENS = 3000
+AI_SUMMARY_BATCH_MAX_ENTRIES = 8
+AI_SUMMARY_TOKENS_PER_ENTRY = 350
+AI_SUMMARY_TASK_CHUNK = 40  # Entries per summarize_entries_batch task
+
+# Token budgets for the entry section of packed prompts (PromptBuilder)
+AI_PROMPT_BUDGETS = {
+    'insights': 2500,
+    'journal_analysis': 3000,
+    'biography_quarter': 2000,   # Entries of one quarter in a map call
+    'biography_reduce': 5000,    # All period summaries in the final call
+}
+AI_PROMPT_CANDIDATE_LIMIT = 1000  # Most recent entries ranked for a prompt
+AI_BIOGRAPHY_MAP_WORKERS = int(os.getenv('AI_BIOGRAPHY_MAP_WORKERS', '4'))  # Parallel quarter summaries
 
 # Application definition
 INSTALLED_APPS = [
@@ -105,6 +188,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+ASGI_APPLICATION = 'core.asgi.application'  # Streaming views (SSE) need the ASGI entry point
 
 SITE_ID = 1
 
@@ -168,6 +252,12 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # File Upload Configuration
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5MB
+ENTRY_IMPORT_MAX_BYTES = 200 * 1024 * 1024  # 200MB cap for bulk entry imports (streamed to disk)
+USER_EXPORT_RETENTION_DAYS = 7  # Data export files are deleted after a week
+
+# Image derivatives (longest side in pixels) generated in the background for uploads
+IMAGE_DERIVATIVE_SIZES = {'thumbnail': 320, 'medium': 1280}
+IMAGE_DERIVATIVE_QUALITY = 82
 
 # Custom adapters for auto-username generation
 ACCOUNT_ADAPTER = 'diary.adapters.CustomAccountAdapter'
@@ -386,6 +476,8 @@ API_QUOTAS = {
 # Celery Configuration
 CELERY_BROKER_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+# Opt-in inline task execution for local development without a broker or worker
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_EAGER') == '1'
 
 # Celery task configuration
 CELERY_ACCEPT_CONTENT = ['json']
@@ -399,8 +491,15 @@ CELERY_TASK_ROUTES = {
     'diary.tasks.generate_insights_async': {'queue': 'ai_tasks'},
     'diary.tasks.generate_biography_async': {'queue': 'ai_tasks'},
     'diary.tasks.generate_entry_summary_async': {'queue': 'ai_tasks'},
+    'diary.tasks.summarize_entries_batch': {'queue': 'ai_tasks'},
+    'diary.tasks.summarize_user_backlog': {'queue': 'ai_tasks'},
     'diary.tasks.update_journal_analytics': {'queue': 'analytics'},
+    'diary.tasks.refresh_related_entries': {'queue': 'analytics'},
+    'diary.tasks.rebuild_related_entries': {'queue': 'analytics'},
     'diary.tasks.cleanup_old_ai_logs': {'queue': 'maintenance'},
+    'diary.tasks.cleanup_expired_exports': {'queue': 'maintenance'},
+    'diary.tasks.backup_user_data': {'queue': 'maintenance'},
+    'diary.tasks.generate_user_export': {'queue': 'maintenance'},
 }
 
 # Task time limits
@@ -441,6 +540,14 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'diary.tasks.cleanup_old_ai_logs',
         'schedule': crontab(minute=0, hour=2),  # Daily at 2 AM
     },
+    'reconcile-tag-usage-counts': {
+        'task': 'diary.tasks.update_tag_usage_counts',
+        'schedule': crontab(minute=30, hour=3),  # Daily at 3:30 AM
+    },
+    'rebuild-related-entries': {
+        'task': 'diary.tasks.rebuild_related_entries',
+        'schedule': crontab(minute=0, hour=4),  # Daily at 4 AM
+    },
     'update-marketplace-stats': {
         'task': 'diary.tasks.update_marketplace_stats',
         'schedule': crontab(minute=0),  # Every hour
@@ -449,6 +556,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'diary.tasks.generate_daily_insights_digest',
         'schedule': crontab(minute=30, hour=9),  # 9:30 AM daily
     },
+    'cleanup-expired-exports': {
+        'task': 'diary.tasks.cleanup_expired_exports',
+        'schedule': crontab(minute=45, hour=2),  # Daily at 2:45 AM
+    },
     'cleanup-expired-caches': {
         'task': 'diary.tasks.cleanup_expired_caches',
         'schedule': crontab(minute=15, hour='*/4'),  # Every 4 hours
@@ -257,8 +257,11 @@ try:
     class AIGenerationLogAdmin(admin.ModelAdmin):
         list_display = ('user', 'generation_type', 'success', 'generation_time', 'created_at')
         list_filter = ('generation_type', 'success', 'created_at')
-        readonly_fields = ('created_at', 'generation_time', 'token_count', 'cost')
-        search_fields = ('user__username', 'input_prompt', 'generated_content')
+        readonly_fields = ('created_at', 'generation_time', 'token_count', 'cost', 'prompt_text', 'content_text')
+        # Long prompts/outputs are stored compressed; show the decoded text instead
+        exclude = ('input_prompt', 'generated_content')
+        # Compressed rows can't be matched with LIKE, so the text columns are not searchable
+        search_fields = ('user__username',)
         
 except ImportError:
     # Compilation models not available yet
@@ -1,11 +1,13 @@
 from django.apps import AppConfig
 
 class DiaryConfig(AppConfig):
+    default = True  # Two configs live in this module; make sure this one is picked for 'diary'
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'diary'
 
     def ready(self):
         import diary.signals  # Import signals when app is ready
+        import diary.cache  # Registers cache invalidation receivers
 
 class Web3authConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -19,7 +19,7 @@ class CacheKeys:
     USER_INSIGHTS = "user_insights_{user_id}"
     USER_STATS = "user_stats_{user_id}"
     USER_DASHBOARD = "dashboard_{user_id}"
-    USER_WRITING_STREAK = "writing_streak_{user_id}"
+    USER_ACTIVITY_MAP = "activity_map_{user_id}"
     USER_ENTRIES_COUNT = "user_entries_count_{user_id}"
     USER_MOOD_DISTRIBUTION = "user_mood_dist_{user_id}"
 
@@ -36,6 +36,11 @@ class CacheKeys:
     JOURNAL_SIMILAR = "journal_similar_{journal_id}"
     JOURNAL_REVIEWS = "journal_reviews_{journal_id}"
 
+    # Background job status
+    IMPORT_JOB = "import_job_{job_id}"
+    SUMMARY_JOB = "summary_job_{job_id}"
+    SUMMARY_JOB_ENTRY = "summary_job_entry_{entry_id}"
+
     # Global caches
     POPULAR_TAGS = "popular_tags"
     GLOBAL_STATS = "global_stats"
@@ -100,32 +105,24 @@ class CacheService:
         stats = cache.get(cache_key)
 
         if stats is None:
-            from .models import Entry
-
-            # Calculate comprehensive stats
-            entries = Entry.objects.filter(user=user)
-            entry_data = entries.aggregate(
-                total_entries=Count('id'),
-                total_words=Sum('word_count'),
-                avg_words=Avg('word_count'),
-                avg_mood_rating=Avg('mood_rating'),
-                first_entry=Min('created_at'),
-                last_entry=Max('created_at')
-            )
-
-            # Calculate additional stats
+            from .models import Entry, UserWritingStats
+
+            # Totals come from the incrementally maintained rollup row
+            writing_stats = UserWritingStats.for_user(user)
+
             stats = {
-                'total_entries': entry_data['total_entries'] or 0,
-                'total_words': entry_data['total_words'] or 0,
-                'avg_words_per_entry': int(entry_data['avg_words'] or 0),
-                'avg_mood_rating': round(entry_data['avg_mood_rating'] or 0, 1),
-                'first_entry_date': entry_data['first_entry'],
-                'last_entry_date': entry_data['last_entry'],
+                'total_entries': writing_stats.entry_count,
+                'total_words': writing_stats.total_words,
+                'avg_words_per_entry': writing_stats.avg_words_per_entry,
+                'avg_mood_rating': writing_stats.avg_mood_rating,
+                'first_entry_date': writing_stats.first_entry_at,
+                'last_entry_date': writing_stats.last_entry_at,
                 'writing_streak': CacheService._calculate_writing_streak(user),
-                'entries_this_month': entries.filter(
-                    created_at__gte=timezone.now().replace(day=1)
+                'entries_this_month': Entry.objects.filter(
+                    user=user,
+                    created_at__gte=timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
                 ).count(),
-                'most_used_mood': CacheService._get_most_used_mood(user),
+                'most_used_mood': writing_stats.dominant_mood,
                 'favorite_tags': CacheService._get_favorite_tags(user),
             }
 
@@ -140,8 +137,7 @@ class CacheService:
         cache_key = CacheKeys.USER_STATS.format(user_id=user.id)
         cache.delete(cache_key)
 
-        # Also invalidate related caches
-        cache.delete(CacheKeys.USER_WRITING_STREAK.format(user_id=user.id))
+        # Also invalidate related caches (the activity map is write-through, not invalidated)
         cache.delete(CacheKeys.USER_ENTRIES_COUNT.format(user_id=user.id))
         cache.delete(CacheKeys.USER_MOOD_DISTRIBUTION.format(user_id=user.id))
 
@@ -303,60 +299,34 @@ class CacheService:
         cache.delete(cache_key)
         logger.debug(f"Invalidated dashboard cache for user {user.id}")
 
-    # Helper methods
     @staticmethod
-    def _calculate_writing_streak(user):
-        """Calculate writing streak (cached separately for performance)"""
-        cache_key = CacheKeys.USER_WRITING_STREAK.format(user_id=user.id)
-        streak = cache.get(cache_key)
-
-        if streak is None:
-            from .models import Entry
-
-            # Get distinct entry dates for the user
-            entry_dates = Entry.objects.filter(user=user).values_list(
-                'created_at__date', flat=True
-            ).distinct().order_by('-created_at__date')
-
-            if not entry_dates:
-                streak = 0
-            else:
-                today = timezone.now().date()
-                yesterday = today - timedelta(days=1)
-
-                # Check if user wrote today or yesterday
-                if entry_dates[0] not in [today, yesterday]:
-                    streak = 0
-                else:
-                    streak = 1
-                    current_date = entry_dates[0]
-
-                    # Count consecutive days
-                    for entry_date in entry_dates[1:]:
-                        expected_date = current_date - timedelta(days=1)
-                        if entry_date == expected_date:
-                            streak += 1
-                            current_date = entry_date
-                        else:
-                            break
-
-            cache.set(cache_key, streak, CacheService.TIMEOUT_SHORT)
-
-        return streak
+    def get_activity_map(user):
+        """Get the user's daily activity bitmap, mirrored in the cache"""
+        cache_key = CacheKeys.USER_ACTIVITY_MAP.format(user_id=user.id)
+        activity = cache.get(cache_key)
 
-    @staticmethod
-    def _get_most_used_mood(user):
-        """Get user's most frequently used mood"""
-        from .models import Entry
-        from django.db.models import Count
+        if activity is None:
+            from .models import UserActivityMap
+
+            activity = UserActivityMap.objects.filter(user=user).first()
+            if activity is None:
+                activity = UserActivityMap.rebuild(user.id)
+            CacheService.store_activity_map(activity)
 
-        mood_data = Entry.objects.filter(
-            user=user, mood__isnull=False
-        ).values('mood').annotate(
-            count=Count('mood')
-        ).order_by('-count').first()
+        return activity
 
-        return mood_data['mood'] if mood_data else None
+    @staticmethod
+    def store_activity_map(activity):
+        """Write an updated activity bitmap through to the cache mirror"""
+        cache_key = CacheKeys.USER_ACTIVITY_MAP.format(user_id=activity.user_id)
+        activity.bits = bytes(activity.bits or b'')  # Postgres hands back memoryview, which won't pickle
+        cache.set(cache_key, activity, CacheService.TIMEOUT_VERY_LONG)
+
+    # Helper methods
+    @staticmethod
+    def _calculate_writing_streak(user):
+        """Current writing streak, answered from the activity bitmap"""
+        return CacheService.get_activity_map(user).current_streak()
 
     @staticmethod
     def _get_favorite_tags(user):
@@ -374,27 +344,10 @@ class CacheService:
 
     @staticmethod
     def _get_time_periods(user):
-        """Get time periods for user's entries"""
+        """Get the five most recent time periods for user's entries"""
         from .models import Entry
 
-        entries = Entry.objects.filter(user=user)
-        time_periods = {}
-
-        for entry in entries:
-            period = entry.get_time_period()
-            if period not in time_periods:
-                time_periods[period] = {
-                    'period': period,
-                    'count': 0,
-                    'first_entry': None
-                }
-
-            time_periods[period]['count'] += 1
-            if (time_periods[period]['first_entry'] is None or
-                entry.created_at < time_periods[period]['first_entry'].created_at):
-                time_periods[period]['first_entry'] = entry
-
-        return sorted(time_periods.values(), key=lambda x: x['period'], reverse=True)[:5]
+        return Entry.time_period_buckets(user, with_first_entries=True)[:5]
 
 # Signal handlers for cache invalidation
 @receiver(post_save, sender='diary.Entry')
@@ -70,6 +70,24 @@ app.conf.beat_schedule = {
         'schedule': crontab(minute=30, hour=9),  # 9:30 AM daily
     },
 
+    # Correct any drift in tag usage counters (normally maintained by signals)
+    'reconcile-tag-usage-counts': {
+        'task': 'diary.tasks.update_tag_usage_counts',
+        'schedule': crontab(minute=30, hour=3),  # 3:30 AM daily
+    },
+
+    # Full related-entries rebuild corrects IDF drift from incremental refreshes
+    'rebuild-related-entries': {
+        'task': 'diary.tasks.rebuild_related_entries',
+        'schedule': crontab(minute=0, hour=4),  # 4 AM daily
+    },
+
+    # Delete user data exports past their retention period
+    'cleanup-expired-exports': {
+        'task': 'diary.tasks.cleanup_expired_exports',
+        'schedule': crontab(minute=45, hour=2),  # 2:45 AM daily
+    },
+
     # Clean up expired cache entries
     'cleanup-expired-caches': {
         'task': 'diary.tasks.cleanup_expired_caches',
@@ -94,10 +112,14 @@ app.conf.update(
         'diary.tasks.generate_insights_async': {'queue': 'ai_tasks'},
         'diary.tasks.generate_biography_async': {'queue': 'ai_tasks'},
         'diary.tasks.generate_entry_summary_async': {'queue': 'ai_tasks'},
+        'diary.tasks.summarize_entries_batch': {'queue': 'ai_tasks'},
+        'diary.tasks.summarize_user_backlog': {'queue': 'ai_tasks'},
         
         # Analytics Tasks
         'diary.tasks.update_journal_analytics': {'queue': 'analytics'},
         'diary.tasks.update_marketplace_stats': {'queue': 'analytics'},
+        'diary.tasks.refresh_related_entries': {'queue': 'analytics'},
+        'diary.tasks.rebuild_related_entries': {'queue': 'analytics'},
         
         # Web3 Authentication Tasks
         'web3auth.celery_tasks.cleanup_expired_nonces': {'queue': 'web3_maintenance'},
@@ -107,6 +129,10 @@ app.conf.update(
         # Maintenance Tasks
         'diary.tasks.cleanup_old_ai_logs': {'queue': 'maintenance'},
         'diary.tasks.cleanup_expired_caches': {'queue': 'maintenance'},
+        'diary.tasks.update_tag_usage_counts': {'queue': 'maintenance'},
+        'diary.tasks.cleanup_expired_exports': {'queue': 'maintenance'},
+        'diary.tasks.backup_user_data': {'queue': 'maintenance'},
+        'diary.tasks.generate_user_export': {'queue': 'maintenance'},
     },
 
     # Task time limits
@@ -253,17 +253,8 @@ class EntryForm(forms.ModelForm):
             # Combine manual and auto tags (manual tags take priority)
             all_tags = set(manual_tags + auto_tags)
 
-            # Clear existing tags
-            entry.tags.clear()
-
-            # Add each tag, creating new ones as needed
-            for tag_name in all_tags:
-                if tag_name:  # Skip empty tags
-                    tag, created = Tag.objects.get_or_create(
-                        name=tag_name.lower(),  # Normalize to lowercase
-                        user=user
-                    )
-                    entry.tags.add(tag)
+            # Replace existing tags, creating new ones as needed in one batch
+            entry.tags.set(Tag.resolve_names(user, all_tags))
 
         return entry
 
@@ -0,0 +1,244 @@
+import itertools
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from diary.models import Entry, JournalCompilationSession
+from diary.services.ai_log_buffer import get_ai_log_buffer
+from diary.services.llm_client import get_llm_client, reset_llm_client
+from diary.tasks import generate_insights_async, process_journal_compilation
+from diary.utils.groq_stub import GroqStubServer
+
+BENCHMARK_USERNAME = 'ai_benchmark'
+
+SCENARIOS = ('demo', 'chat', 'compilation', 'insights')
+
+VOCABULARY = (
+    "morning coffee walk park rain sunshine work meeting project deadline friend family dinner "
+    "movie book music run gym yoga sleep dream travel train airport beach mountain hike garden "
+    "birthday party gift letter phone call anxious happy tired excited grateful calm stress"
+).split()
+
+
+def percentile(timings, share):
+    """Nearest-rank percentile of a sorted list"""
+    return timings[max(0, min(len(timings) - 1, int(round(share * len(timings))) - 1))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the AI endpoints and tasks at set concurrency levels against a Groq stub "
+        "and report throughput and latency percentiles"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"Comma-separated, from: {', '.join(SCENARIOS)}")
+        parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated worker counts")
+        parser.add_argument('--requests', type=int, default=40, help="Timed operations per scenario and level")
+        parser.add_argument('--entries', type=int, default=60, help="Entries per benchmark user")
+        parser.add_argument('--base-url', default=None,
+                            help="Use this API instead of starting a stub (e.g. a separate groq_stub)")
+        parser.add_argument('--latency', default='lognormal:0.8:0.5', help="Stub latency spec")
+        parser.add_argument('--tokens-per-second', type=float, default=250.0)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--error-statuses', default='500,503')
+        parser.add_argument('--replay', default=None, help="Cassette for the stub to replay")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--respect-rate-limits', action='store_true',
+                            help="Keep LLM_RATE_LIMITS (by default they are lifted to measure the app itself)")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the benchmark users afterwards")
+
+    def handle(self, *args, **options):
+        scenarios = [name for name in options['scenarios'].split(',') if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        levels = [int(level) for level in options['concurrency'].split(',') if level]
+        self.rng = random.Random(options['seed'])
+        self.nonce = itertools.count()
+
+        stub = None
+        base_url = options['base_url']
+        if not base_url:
+            stub = GroqStubServer(
+                latency=options['latency'],
+                tokens_per_second=options['tokens_per_second'],
+                error_rate=options['error_rate'],
+                error_statuses=[int(status) for status in options['error_statuses'].split(',') if status],
+                mode='replay' if options['replay'] else 'synthetic',
+                cassette=options['replay'],
+                seed=options['seed'],
+            ).start()
+            base_url = stub.base_url
+
+        overrides = {'GROQ_API_BASE_URL': base_url}
+        if not options['respect_rate_limits']:
+            overrides['LLM_RATE_LIMITS'] = {
+                **settings.LLM_RATE_LIMITS, 'requests_per_minute': 1_000_000, 'tokens_per_minute': 1_000_000_000,
+            }
+
+        self.users = self._users(max(levels), options['entries'])
+        self.stdout.write(
+            f"API: {base_url}{' (stub, ' + options['latency'] + ')' if stub else ''}, "
+            f"{len(self.users)} users x {options['entries']} entries"
+        )
+        try:
+            with override_settings(**overrides):
+                # The shared client holds the base URL and limiter config
+                reset_llm_client()
+                self.stdout.write(
+                    f"{'scenario':<12} {'workers':>7} {'ops':>5} {'errors':>6} {'ops/s':>7} "
+                    f"{'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"
+                )
+                for scenario in scenarios:
+                    for level in levels:
+                        self._run(scenario, level, options['requests'])
+                self.stdout.write(f"Circuit breaker: {get_llm_client().breaker.state()}")
+        finally:
+            reset_llm_client()
+            get_ai_log_buffer().flush()
+            if stub is not None:
+                self.stdout.write(f"Stub counters: {stub.snapshot()}")
+                stub.stop()
+
+        if options['cleanup']:
+            get_user_model().objects.filter(username__startswith=BENCHMARK_USERNAME).delete()
+            self.stdout.write("Removed benchmark users")
+
+    # ------------------------------------------------------------------
+    # Runs
+    # ------------------------------------------------------------------
+
+    def _run(self, scenario, level, count):
+        """Run count operations on level workers, after level untimed warm-up operations"""
+        operation = getattr(self, f'_op_{scenario}')
+        local = threading.local()
+        worker_ids = itertools.count()
+
+        def timed(_):
+            if not hasattr(local, 'worker'):
+                # Each thread keeps its own user, client and database connection
+                local.worker = next(worker_ids)
+                local.user = self.users[local.worker]
+                local.client = Client(HTTP_HOST='localhost')
+                local.client.force_login(local.user)
+            started = time.perf_counter()
+            try:
+                prepared = self._prepare(scenario, local.user)
+                started = time.perf_counter()
+                ok = operation(local, prepared)
+            except Exception as e:
+                self.stderr.write(f"{scenario}: {e.__class__.__name__}: {e}")
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            close_old_connections()
+            return elapsed, ok
+
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            list(pool.map(timed, range(level)))
+            started = time.perf_counter()
+            results = list(pool.map(timed, range(count)))
+            elapsed = time.perf_counter() - started
+
+        timings = sorted(timing for timing, _ in results)
+        errors = sum(1 for _, ok in results if not ok)
+        self.stdout.write(
+            f"{scenario:<12} {level:>7} {count:>5} {errors:>6} {count / elapsed:>7.2f} "
+            f"{percentile(timings, 0.50):>7.0f}ms {percentile(timings, 0.95):>7.0f}ms "
+            f"{percentile(timings, 0.99):>7.0f}ms {timings[-1]:>7.0f}ms"
+        )
+
+    def _prepare(self, scenario, user):
+        """Untimed setup for one operation"""
+        if scenario == 'compilation':
+            session = JournalCompilationSession.objects.create(
+                user=user,
+                compilation_method=self.rng.choice(['ai', 'thematic']),
+                journal_type=self.rng.choice([choice for choice, _ in JournalCompilationSession.JOURNAL_TYPES]),
+            )
+            ids = list(Entry.objects.filter(user=user).values_list('id', flat=True))
+            session.selected_entries.set(self.rng.sample(ids, min(len(ids), 30)))
+            return session
+        if scenario == 'insights':
+            # Insights are incremental; a new entry gives every run something to analyze
+            return self._entries(user, 1)[0]
+        return None
+
+    def _text(self, words=60):
+        # A nonce keeps every prompt distinct, so no response comes from the AI caches
+        return f"{' '.join(self.rng.choices(VOCABULARY, k=words))} ({next(self.nonce)})"
+
+    # ------------------------------------------------------------------
+    # Operations: each returns whether it succeeded
+    # ------------------------------------------------------------------
+
+    def _op_demo(self, local, prepared):
+        response = local.client.post(
+            reverse('demo_journal'), json.dumps({'journal_content': self._text()}), content_type='application/json'
+        )
+        return response.status_code == 200
+
+    def _op_chat(self, local, prepared):
+        # Two earlier user turns take the view down its entry-writing path instead of a canned reply
+        response = local.client.post(reverse('chat_with_ai'), json.dumps({
+            'message': self._text(25),
+            'conversation_history': [
+                {'role': 'user', 'content': self._text(20)},
+                {'role': 'assistant', 'content': 'How did that make you feel?'},
+                {'role': 'user', 'content': self._text(20)},
+            ],
+            'chat_mode': 'daily-reflection',
+        }), content_type='application/json')
+        return response.status_code == 200 and response.json().get('type') == 'journal_entry'
+
+    def _op_compilation(self, local, session):
+        process_journal_compilation(str(session.session_id))
+        session.refresh_from_db(fields=['status'])
+        return session.status == 'ready'
+
+    def _op_insights(self, local, entry):
+        result = generate_insights_async.apply(args=(local.user.id,))
+        return result.successful() and str(result.result).startswith('Analyzed')
+
+    # ------------------------------------------------------------------
+    # Data
+    # ------------------------------------------------------------------
+
+    def _users(self, count, entries):
+        User = get_user_model()
+        users = []
+        for index in range(count):
+            user, created = User.objects.get_or_create(username=f"{BENCHMARK_USERNAME}_{index}")
+            if created:
+                self._entries(user, entries)
+            users.append(user)
+        return users
+
+    def _entries(self, user, count):
+        """Bulk insert entries, bypassing per-entry signals"""
+        moods = [choice for choice, _ in Entry.MOOD_CHOICES]
+        now = timezone.now()
+        entries = []
+        for i in range(count):
+            content = self._text(self.rng.randint(40, 160))
+            entries.append(Entry(
+                user=user,
+                title=' '.join(self.rng.choices(VOCABULARY, k=4)).capitalize(),
+                content=content,
+                word_count=len(content.split()),
+                mood=self.rng.choice(moods),
+                created_at=now - timedelta(hours=(count - 1 - i) * 20),
+            ))
+        return Entry.objects.bulk_create(entries)
@@ -0,0 +1,103 @@
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from diary.models import Entry, Tag
+from diary.services.export_service import ExportService
+
+BENCHMARK_USERNAME = 'export_benchmark'
+
+VOCABULARY = (
+    "morning coffee walk park rain sunshine work meeting project deadline friend family dinner "
+    "movie book music run gym yoga sleep dream travel train airport beach mountain hike garden "
+    "birthday party gift letter phone call anxious happy tired excited grateful calm stress"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Export a synthetic diary and report Python heap use as the export progresses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100_000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--format', choices=['ndjson', 'zip'], default='ndjson')
+        parser.add_argument('--sample-every', type=int, default=10_000, help="Entries between memory samples")
+        parser.add_argument('--skip-load', action='store_true', help="Reuse previously loaded entries")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the benchmark user afterwards")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+
+        if not options['skip_load']:
+            self._load(user, options['entries'], options['batch_size'])
+
+        # Sample the heap at a fixed entry interval through the progress hook
+        samples = []
+
+        def progress(counts):
+            current, peak = tracemalloc.get_traced_memory()
+            samples.append((counts.get('entry', 0), current, peak, time.perf_counter() - started))
+
+        writer = ExportService.write_zip if options['format'] == 'zip' else ExportService.write_ndjson
+        tracemalloc.start()
+        started = time.perf_counter()
+        with tempfile.TemporaryFile() as temporary:
+            summary = writer(temporary, user, progress=progress, progress_every=options['sample_every'])
+            size = temporary.tell()
+        elapsed = time.perf_counter() - started
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(f"{'entries':>10} {'heap':>10} {'peak':>10} {'elapsed':>9}")
+        for entries, sample_current, sample_peak, sample_elapsed in samples:
+            self.stdout.write(
+                f"{entries:>10} {sample_current / 2**20:>8.1f}MB {sample_peak / 2**20:>8.1f}MB {sample_elapsed:>8.1f}s"
+            )
+        self.stdout.write(
+            f"Exported {summary['entries']} entries ({size / 2**20:.1f}MB) in {elapsed:.1f}s, "
+            f"peak heap {peak / 2**20:.1f}MB"
+        )
+
+        if options['cleanup']:
+            user.delete()
+            self.stdout.write("Removed benchmark user")
+
+    def _load(self, user, count, batch_size):
+        """Bulk insert entries with a few tags each, bypassing per-entry signals"""
+        rng = random.Random(42)
+        moods = [choice for choice, _ in Entry.MOOD_CHOICES]
+        tags = Tag.resolve_names(user, VOCABULARY[:12])
+        tag_ids = [tag.id for tag in tags]
+        Link = Entry.tags.through
+        now = timezone.now()
+
+        for offset in range(0, count, batch_size):
+            batch = []
+            for i in range(offset, min(offset + batch_size, count)):
+                words = rng.choices(VOCABULARY, k=rng.randint(40, 200))
+                batch.append(Entry(
+                    user=user,
+                    title=' '.join(rng.choices(VOCABULARY, k=4)).capitalize(),
+                    content=' '.join(words),
+                    word_count=len(words),
+                    mood=rng.choice(moods),
+                    created_at=now - timedelta(minutes=i * 7),
+                ))
+            created = Entry.objects.bulk_create(batch)
+            ids = [entry.id for entry in created]
+            if not all(ids):
+                ids = list(Entry.objects.filter(user=user).order_by('-id').values_list('id', flat=True)[:len(batch)])
+            Link.objects.bulk_create([
+                Link(entry_id=entry_id, tag_id=tag_id)
+                for entry_id in ids
+                for tag_id in rng.sample(tag_ids, 2)
+            ])
+            self.stdout.write(f"Loaded {offset + len(batch)}/{count} entries", ending='\r')
+        self.stdout.write("")
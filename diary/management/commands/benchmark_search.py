@@ -0,0 +1,95 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from diary.models import Entry
+from diary.services.search_service import SearchService
+
+BENCHMARK_USERNAME = 'search_benchmark'
+
+VOCABULARY = (
+    "morning coffee walk park rain sunshine work meeting project deadline friend family dinner "
+    "movie book music run gym yoga sleep dream travel train airport beach mountain hike garden "
+    "birthday party gift letter phone call anxious happy tired excited grateful calm stress "
+    "learning python guitar piano painting cooking recipe bread market city river bridge night"
+).split()
+
+QUERIES = ['coffee', 'rain walk', 'project deadline', 'birthday party gift', 'guit', 'mountain hike friend']
+
+
+class Command(BaseCommand):
+    help = "Load synthetic entries for a benchmark user and report search latency percentiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--runs', type=int, default=50, help="Timed runs per query")
+        parser.add_argument('--skip-load', action='store_true', help="Reuse previously loaded entries")
+        parser.add_argument('--cleanup', action='store_true', help="Delete the benchmark user afterwards")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+
+        # Index DDL up front, so loaded documents are indexed as they are inserted
+        SearchService.create_index()
+        if not options['skip_load']:
+            self._load(user, options['entries'], options['batch_size'])
+
+        self.stdout.write(f"Backend: {SearchService.get_backend().__class__.__name__}, "
+                          f"{Entry.objects.filter(user=user).count()} entries")
+
+        for query in QUERIES:
+            for label, filters in (('', {}), (' +mood', {'mood': 'happy'})):
+                timings = []
+                for _ in range(options['runs']):
+                    started = time.perf_counter()
+                    total = SearchService.search(user, query, **filters)['total']
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                self.stdout.write(
+                    f"{query + label:<28} hits={total:<8} p50={statistics.median(timings):7.2f}ms "
+                    f"p95={p95:7.2f}ms max={timings[-1]:7.2f}ms"
+                )
+
+        if options['cleanup']:
+            user.delete()
+            self.stdout.write("Removed benchmark user")
+
+    def _load(self, user, count, batch_size):
+        """Bulk insert entries (bypassing per-entry signals) and index them in batches"""
+        rng = random.Random(42)
+        moods = [choice for choice, _ in Entry.MOOD_CHOICES]
+        now = timezone.now()
+        started = time.perf_counter()
+
+        for offset in range(0, count, batch_size):
+            batch = []
+            for i in range(offset, min(offset + batch_size, count)):
+                words = rng.choices(VOCABULARY, k=rng.randint(40, 200))
+                batch.append(Entry(
+                    user=user,
+                    title=' '.join(rng.choices(VOCABULARY, k=4)).capitalize(),
+                    content=' '.join(words),
+                    word_count=len(words),
+                    mood=rng.choice(moods),
+                    created_at=now - timedelta(minutes=i * 7),
+                ))
+            with transaction.atomic():
+                created = Entry.objects.bulk_create(batch)
+                ids = [entry.id for entry in created]
+                if not all(ids):
+                    ids = list(Entry.objects.filter(user=user).order_by('-id')
+                               .values_list('id', flat=True)[:len(batch)])
+                SearchService.index_entries(ids)
+            self.stdout.write(f"Loaded {offset + len(batch)}/{count} entries", ending='\r')
+
+        SearchService.get_backend().rebuild()
+        self.stdout.write(f"\nLoaded {count} entries in {time.perf_counter() - started:.1f}s")
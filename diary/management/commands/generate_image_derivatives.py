@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from diary.services.image_service import IMAGE_MODELS, ImageService
+from diary.tasks import generate_image_derivatives
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails and image metadata for uploads that don't have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=IMAGE_MODELS, action='append',
+                            help="Limit to one model (repeatable); defaults to all image models")
+        parser.add_argument('--queue', action='store_true', help="Queue Celery tasks instead of processing inline")
+
+    def handle(self, *args, **options):
+        for model_label in options['model'] or IMAGE_MODELS:
+            pending = ImageService.pending(model_label).values_list('pk', flat=True)
+            processed = unavailable = 0
+            for pk in pending.iterator():
+                if options['queue']:
+                    generate_image_derivatives.delay(model_label, pk)
+                elif not ImageService.generate_for(model_label, pk):
+                    unavailable += 1
+                processed += 1
+            self.stdout.write(f"{model_label}: {processed} processed, {unavailable} missing or unreadable")
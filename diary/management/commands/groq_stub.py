@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diary.utils.groq_stub import MODES, GroqStubServer
+
+
+class Command(BaseCommand):
+    help = "Run a local Groq-compatible chat completions server (synthetic, record or replay)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--mode', choices=MODES, default='synthetic')
+        parser.add_argument('--cassette', help="JSONL file to record to or replay from")
+        parser.add_argument('--upstream', default=None,
+                            help="API to record from (default: GROQ_API_BASE_URL)")
+        parser.add_argument('--latency', default='lognormal:0.8:0.5',
+                            help="fixed:S, uniform:A:B, lognormal:MEDIAN:SIGMA or recorded (replay)")
+        parser.add_argument('--tokens-per-second', type=float, default=250.0)
+        parser.add_argument('--reply-words', type=int, default=150, help="Length of synthetic prose replies")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests to fail (0-1)")
+        parser.add_argument('--error-statuses', default='500,503', help="Comma-separated statuses to fail with")
+        parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After seconds sent with 429s")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        upstream = options['upstream'] or settings.GROQ_API_BASE_URL
+        try:
+            server = GroqStubServer(
+                host=options['host'],
+                port=options['port'],
+                latency=options['latency'],
+                tokens_per_second=options['tokens_per_second'],
+                reply_words=options['reply_words'],
+                error_rate=options['error_rate'],
+                error_statuses=[int(status) for status in options['error_statuses'].split(',') if status],
+                retry_after=options['retry_after'],
+                mode=options['mode'],
+                cassette=options['cassette'],
+                upstream=upstream,
+                api_key=settings.GROK_API_KEY,
+                seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"Groq stub ({options['mode']}) listening; set GROQ_API_BASE_URL={server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stopped. Counters: {server.snapshot()}")
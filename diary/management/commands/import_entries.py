@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from diary.services.import_service import DEFAULT_BATCH_SIZE, FORMATS, ImportService
+
+
+class Command(BaseCommand):
+    help = "Bulk import entries for a user from an NDJSON, CSV or Day One JSON export"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist")
+
+        try:
+            fmt = ImportService.detect_format(options['path'], options['format'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        def progress(result):
+            self.stdout.write(f"Imported {result['imported']} / processed {result['processed']}", ending='\r')
+
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = ImportService.import_stream(user, stream, fmt, options['batch_size'], progress)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write('')
+        for error in result['errors']:
+            self.stderr.write(f"  record {error['record']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['imported']} entries ({result['skipped']} skipped of {result['processed']})"
+        ))
@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from diary.services.search_service import SearchService
+
+
+class Command(BaseCommand):
+    help = "Create the full-text search index (DDL; run on deploy) and backfill search documents for existing entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only reindex entries of this username")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            User = get_user_model()
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        indexed = SearchService.rebuild_index(user=user, batch_size=options['batch_size'])
+        backend = SearchService.get_backend().__class__.__name__
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} entries ({backend})"))
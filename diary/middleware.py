@@ -156,12 +156,7 @@ class PendingEntryMiddleware:
                             tags = auto_generate_tags(pending_entry.get('content'), pending_entry.get('mood'))
 
                         if tags:
-                            for tag_name in tags:
-                                tag, created = Tag.objects.get_or_create(
-                                    name=tag_name.lower().strip(),
-                                    user=request.user
-                                )
-                                entry.tags.add(tag)
+                            entry.tags.add(*Tag.resolve_names(request.user, tags))
 
                         # Redirect to the created entry
                         logger.info(f"Created pending entry for user {request.user.username}")
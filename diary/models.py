@@ -1,9 +1,60 @@
+import base64
+import re
 import uuid
-from django.db import models
+import zlib
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Greatest, TruncQuarter
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import AbstractUser, User
 
+class ImageDerivativesMixin(models.Model):
+    """
+    Thumbnail/medium derivatives and metadata for a model's uploaded image,
+    generated in the background by ImageService. List and detail views read
+    these columns instead of touching storage per image.
+    """
+    SOURCE_IMAGE_FIELD = None  # Name of the ImageField the derivatives are built from
+
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_size = models.BigIntegerField(null=True, blank=True, editable=False)
+    image_available = models.BooleanField(null=True, editable=False)  # None until processed
+    thumbnail = models.ImageField(upload_to='derivatives/thumbnails/%Y/%m/', blank=True, editable=False)
+    medium_image = models.ImageField(upload_to='derivatives/medium/%Y/%m/', blank=True, editable=False)
+    derivatives_source = models.CharField(max_length=255, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def source_image(self):
+        return getattr(self, self.SOURCE_IMAGE_FIELD)
+
+    @property
+    def needs_derivatives(self):
+        """True when the source image changed since derivatives were last generated"""
+        source = self.source_image
+        return (source.name or '') != self.derivatives_source
+
+    def derivative_url(self, size='medium'):
+        """URL of a derivative, falling back to the original until it has been generated"""
+        derivative = self.thumbnail if size == 'thumbnail' else self.medium_image
+        if derivative:
+            return derivative.url
+        source = self.source_image
+        return source.url if source else None
+
+    @property
+    def thumbnail_url(self):
+        return self.derivative_url('thumbnail')
+
+    @property
+    def medium_url(self):
+        return self.derivative_url('medium')
+
 class Tag(models.Model):
     name = models.CharField(max_length=50)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tags')
@@ -36,6 +87,51 @@ class Tag(models.Model):
         self.usage_count = self.entries.count()
         self.save(update_fields=['usage_count'])
 
+    @classmethod
+    def normalize_name(cls, name):
+        """Canonical form of a tag name (lowercase, trimmed); None if unusable"""
+        if not isinstance(name, str):
+            return None
+        name = name.lower().strip()[:cls._meta.get_field('name').max_length]
+        return name or None
+
+    @classmethod
+    def resolve_names(cls, user, names):
+        """
+        Get or create a user's tags by name in bulk: one SELECT, plus one
+        INSERT and one SELECT only when some names are new.
+        """
+        wanted = {name for name in map(cls.normalize_name, names) if name}
+        if not wanted:
+            return []
+        tags = {tag.name: tag for tag in cls.objects.filter(user=user, name__in=wanted)}
+        missing = wanted - tags.keys()
+        if missing:
+            # ignore_conflicts covers a concurrent request creating the same tag
+            cls.objects.bulk_create([cls(user=user, name=name) for name in missing], ignore_conflicts=True)
+            tags.update((tag.name, tag) for tag in cls.objects.filter(user=user, name__in=missing))
+        return list(tags.values())
+
+    @classmethod
+    def apply_usage_delta(cls, tag_ids, delta):
+        """Shift usage_count of many tags in one UPDATE (clamped at zero)"""
+        tag_ids = list(tag_ids)
+        if not tag_ids or not delta:
+            return 0
+        count = models.F('usage_count') + delta
+        if delta < 0:
+            count = Greatest(count, 0)
+        return cls.objects.filter(pk__in=tag_ids).update(usage_count=count)
+
+    @classmethod
+    def reconcile_usage_counts(cls):
+        """Correct drifted usage counts with a single set-based UPDATE; returns rows fixed"""
+        actual = Coalesce(models.Subquery(
+            Entry.tags.through.objects.filter(tag_id=models.OuterRef('pk'))
+            .order_by().values('tag_id').annotate(total=models.Count('*')).values('total')
+        ), 0)
+        return cls.objects.annotate(actual=actual).exclude(usage_count=models.F('actual')).update(usage_count=actual)
+
     def __str__(self):
         return self.name
 
@@ -115,24 +211,74 @@ class Entry(models.Model):
             self.word_count = len(self.content.split())
         super().save(*args, **kwargs)
 
-        # Update tag usage counts (with error handling)
-        try:
-            for tag in self.tags.all():
-                if hasattr(tag, 'update_usage_count'):
-                    tag.update_usage_count()
-        except Exception:
-            # Skip tag updates if there are issues (e.g., during migrations)
-            pass
-
     def __str__(self):
         return self.title
 
     def get_time_period(self):
         """Return the quarter and year of this entry for book organization"""
-        date = self.created_at
+        date = timezone.localtime(self.created_at) if timezone.is_aware(self.created_at) else self.created_at
         quarter = (date.month - 1) // 3 + 1
         return f"Q{quarter} {date.year}"
 
+    @staticmethod
+    def period_bounds(period):
+        """Return the [start, end) datetimes of a "Q{n} {year}" period, or None if malformed"""
+        match = re.match(r'^Q([1-4]) (\d{4})$', (period or '').strip())
+        if not match:
+            return None
+
+        quarter, year = int(match.group(1)), int(match.group(2))
+        start = datetime(year, 3 * (quarter - 1) + 1, 1)
+        end = datetime(year + 1, 1, 1) if quarter == 4 else datetime(year, 3 * quarter + 1, 1)
+        if settings.USE_TZ:
+            start, end = timezone.make_aware(start), timezone.make_aware(end)
+        return start, end
+
+    @classmethod
+    def for_period(cls, user, period):
+        """Entries in one time period as an indexed (user, created_at) range query"""
+        bounds = cls.period_bounds(period)
+        if bounds is None:
+            return cls.objects.none()
+        return cls.objects.filter(user=user, created_at__gte=bounds[0], created_at__lt=bounds[1])
+
+    @classmethod
+    def time_period_buckets(cls, user, with_first_entries=False):
+        """
+        Quarter buckets for a user's entries, most recent first. Counts come from
+        a single GROUP BY on the truncated date; first-entry ids from one lookup.
+        """
+        buckets = list(
+            cls.objects.filter(user=user)
+            .annotate(bucket=TruncQuarter('created_at'))
+            .values('bucket')
+            .annotate(count=models.Count('id'), first_at=models.Min('created_at'))
+            .order_by('-bucket')
+        )
+
+        first_ids = {}
+        first_entries = cls.objects.filter(
+            user=user, created_at__in=[bucket['first_at'] for bucket in buckets]
+        ).order_by('id').values_list('created_at', 'id')
+        for created_at, entry_id in first_entries:
+            first_ids.setdefault(created_at, entry_id)
+
+        periods = []
+        for bucket in buckets:
+            start = bucket['bucket']
+            periods.append({
+                'period': f"Q{(start.month - 1) // 3 + 1} {start.year}",
+                'count': bucket['count'],
+                'first_entry_id': first_ids.get(bucket['first_at']),
+            })
+
+        if with_first_entries:
+            entries_by_id = cls.objects.in_bulk([p['first_entry_id'] for p in periods if p['first_entry_id']])
+            for period in periods:
+                period['first_entry'] = entries_by_id.get(period['first_entry_id'])
+
+        return periods
+
     def get_month_year(self):
         """Return month and year format for display"""
         return self.created_at.strftime("%b %Y")
@@ -178,7 +324,7 @@ class Entry(models.Model):
 
         # Engagement factor (10 points)
         try:
-            if hasattr(self, 'photos') and self.photos.exists():
+            if self.has_media():
                 score += 5
         except Exception:
             pass
@@ -207,10 +353,14 @@ class Entry(models.Model):
 
     def has_media(self):
         """Check if entry has any associated media"""
-        try:
-            return hasattr(self, 'photos') and self.photos.exists()
-        except Exception:
-            return False
+        return self.cover_photo is not None
+
+    @property
+    def cover_photo(self):
+        """First photo of the entry; uses prefetched photos instead of querying per entry"""
+        if self._state.adding:
+            return None
+        return min(self.photos.all(), key=lambda photo: photo.pk, default=None)
 
     def get_mood_emoji(self):
         """Get emoji representation of mood"""
@@ -240,6 +390,380 @@ class SummaryVersion(models.Model):
     def __str__(self):
         return f"Summary version for {self.entry.title} - {self.created_at}"
 
+class UserWritingStats(models.Model):
+    """Per-user rollup of writing statistics, kept current by entry signals"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='writing_stats')
+    entry_count = models.PositiveIntegerField(default=0)
+    total_words = models.PositiveIntegerField(default=0)
+    mood_counts = models.JSONField(default=dict, blank=True)
+    mood_rating_total = models.PositiveIntegerField(default=0)
+    mood_rating_count = models.PositiveIntegerField(default=0)
+    first_entry_at = models.DateTimeField(null=True, blank=True)
+    last_entry_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'User Writing Stats'
+        verbose_name_plural = 'User Writing Stats'
+
+    def __str__(self):
+        return f"Writing stats for {self.user.username}"
+
+    @property
+    def avg_words_per_entry(self):
+        return self.total_words // self.entry_count if self.entry_count else 0
+
+    @property
+    def avg_mood_rating(self):
+        if not self.mood_rating_count:
+            return 0
+        return round(self.mood_rating_total / self.mood_rating_count, 1)
+
+    @property
+    def dominant_mood(self):
+        if not self.mood_counts:
+            return None
+        return max(self.mood_counts.items(), key=lambda x: x[1])[0]
+
+    @classmethod
+    def for_user(cls, user):
+        """Return the user's rollup row, building it from their entries on first access"""
+        stats = cls.objects.filter(user=user).first()
+        if stats is None:
+            stats = cls.rebuild(user.id)
+        return stats
+
+    @classmethod
+    def rebuild(cls, user_id):
+        """Recompute the rollup from scratch (backfill and drift repair)"""
+        entries = Entry.objects.filter(user_id=user_id)
+        totals = entries.aggregate(
+            entry_count=models.Count('id'),
+            total_words=models.Sum('word_count'),
+            mood_rating_total=models.Sum('mood_rating'),
+            mood_rating_count=models.Count('mood_rating'),
+            first_entry_at=models.Min('created_at'),
+            last_entry_at=models.Max('created_at'),
+        )
+        mood_counts = dict(
+            entries.exclude(mood__isnull=True).exclude(mood='')
+            .values_list('mood').annotate(count=models.Count('id'))
+        )
+
+        stats, _ = cls.objects.update_or_create(
+            user_id=user_id,
+            defaults={
+                'entry_count': totals['entry_count'] or 0,
+                'total_words': totals['total_words'] or 0,
+                'mood_rating_total': totals['mood_rating_total'] or 0,
+                'mood_rating_count': totals['mood_rating_count'] or 0,
+                'mood_counts': mood_counts,
+                'first_entry_at': totals['first_entry_at'],
+                'last_entry_at': totals['last_entry_at'],
+            }
+        )
+        return stats
+
+    @classmethod
+    def apply_delta(cls, user_id, entries=0, words=0, rating_total=0, rating_count=0,
+                    moods_added=(), moods_removed=(), added_at=None, removed_at=None):
+        """
+        Apply an incremental change to a user's rollup. Counters are updated
+        with F() expressions; the mood map and date bounds are adjusted under
+        a row lock. A missing row is built from entries instead (lazy backfill).
+        """
+        with transaction.atomic():
+            stats = cls.objects.select_for_update().filter(user_id=user_id).first()
+            if stats is None:
+                # Skip deletes so cascades from a user delete don't recreate the row
+                return cls.rebuild(user_id) if entries >= 0 else None
+
+            mood_counts = dict(stats.mood_counts or {})
+            for mood in moods_removed:
+                if mood and mood in mood_counts:
+                    mood_counts[mood] -= 1
+                    if mood_counts[mood] <= 0:
+                        del mood_counts[mood]
+            for mood in moods_added:
+                if mood:
+                    mood_counts[mood] = mood_counts.get(mood, 0) + 1
+
+            first_entry_at, last_entry_at = stats.first_entry_at, stats.last_entry_at
+            if removed_at is not None and removed_at in (first_entry_at, last_entry_at):
+                # A boundary entry moved or went away - re-read both bounds from the index
+                bounds = Entry.objects.filter(user_id=user_id).aggregate(
+                    first=models.Min('created_at'), last=models.Max('created_at')
+                )
+                first_entry_at, last_entry_at = bounds['first'], bounds['last']
+            elif added_at is not None:
+                first_entry_at = min(first_entry_at, added_at) if first_entry_at else added_at
+                last_entry_at = max(last_entry_at, added_at) if last_entry_at else added_at
+
+            cls.objects.filter(pk=stats.pk).update(
+                entry_count=models.F('entry_count') + entries,
+                total_words=models.F('total_words') + words,
+                mood_rating_total=models.F('mood_rating_total') + rating_total,
+                mood_rating_count=models.F('mood_rating_count') + rating_count,
+                mood_counts=mood_counts,
+                first_entry_at=first_entry_at,
+                last_entry_at=last_entry_at,
+                updated_at=timezone.now(),
+            )
+        return stats
+
+class UserActivityMap(models.Model):
+    """
+    Daily writing activity as a bitmap: bit i is set when the user wrote on
+    origin + i days. Streaks and heatmaps are answered with bit operations.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='activity_map')
+    origin = models.DateField(null=True, blank=True)
+    bits = models.BinaryField(default=b'')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'User Activity Map'
+
+    def __str__(self):
+        return f"Activity map for {self.user.username}"
+
+    @staticmethod
+    def day_of(moment):
+        """Calendar day of a timestamp in the active timezone (matches created_at__date)"""
+        if timezone.is_aware(moment):
+            moment = timezone.localtime(moment)
+        return moment.date()
+
+    @property
+    def value(self):
+        return int.from_bytes(bytes(self.bits or b''), 'little')
+
+    def _store(self, value):
+        self.bits = value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+    def _index(self, day):
+        return (day - self.origin).days if self.origin else None
+
+    def is_active(self, day):
+        index = self._index(day)
+        return index is not None and index >= 0 and bool(self.value >> index & 1)
+
+    def current_streak(self, today=None):
+        """Consecutive active days ending today, or yesterday if today has no entry yet"""
+        if not self.origin:
+            return 0
+        today = today or timezone.localdate()
+        value = self.value
+        end = self._index(today)
+        if end < 0:
+            return 0
+        if not value >> end & 1:
+            end -= 1
+            if end < 0 or not value >> end & 1:
+                return 0
+
+        # Highest unset bit at or below `end` marks where the run started
+        gaps = ~value & ((1 << (end + 1)) - 1)
+        return end + 1 if not gaps else end - (gaps.bit_length() - 1)
+
+    def longest_streak(self):
+        """Length of the longest run of set bits"""
+        value = self.value
+        longest = 0
+        while value:
+            value &= value << 1
+            longest += 1
+        return longest
+
+    def heatmap(self, days=365, today=None):
+        """Active flags for the trailing window of days, oldest first"""
+        today = today or timezone.localdate()
+        start = today - timedelta(days=days - 1)
+        if not self.origin:
+            return [{'date': start + timedelta(days=i), 'active': False} for i in range(days)]
+
+        offset = self._index(start)
+        value = self.value
+        window = value >> offset if offset >= 0 else value << -offset
+        return [
+            {'date': start + timedelta(days=i), 'active': bool(window >> i & 1)}
+            for i in range(days)
+        ]
+
+    @classmethod
+    def rebuild(cls, user_id):
+        """Recompute the bitmap from the user's distinct entry days"""
+        days = sorted({
+            cls.day_of(created_at)
+            for created_at in Entry.objects.filter(user_id=user_id).values_list('created_at', flat=True)
+        })
+        activity = cls(user_id=user_id, origin=days[0] if days else None)
+        value = 0
+        for day in days:
+            value |= 1 << activity._index(day)
+        activity._store(value)
+
+        obj, _ = cls.objects.update_or_create(
+            user_id=user_id, defaults={'origin': activity.origin, 'bits': activity.bits}
+        )
+        return obj
+
+    @classmethod
+    def set_days(cls, user_id, days):
+        """Mark many days active under one row lock (bulk imports)"""
+        days = sorted(set(days))
+        if not days:
+            return None
+        with transaction.atomic():
+            activity = cls.objects.select_for_update().filter(user_id=user_id).first()
+            if activity is None:
+                return cls.rebuild(user_id)
+
+            value = activity.value
+            if activity.origin is None:
+                activity.origin, value = days[0], 0
+            elif days[0] < activity.origin:
+                value <<= (activity.origin - days[0]).days
+                activity.origin = days[0]
+            for day in days:
+                value |= 1 << activity._index(day)
+
+            activity._store(value)
+            activity.save(update_fields=['origin', 'bits', 'updated_at'])
+        return activity
+
+    @classmethod
+    def set_day(cls, user_id, day, active=True):
+        """Flip one day's bit under a row lock, re-basing the origin if needed"""
+        with transaction.atomic():
+            activity = cls.objects.select_for_update().filter(user_id=user_id).first()
+            if activity is None:
+                return cls.rebuild(user_id) if active else None
+
+            value = activity.value
+            if active:
+                if activity.origin is None:
+                    activity.origin, value = day, 0
+                elif day < activity.origin:
+                    value <<= (activity.origin - day).days
+                    activity.origin = day
+                value |= 1 << activity._index(day)
+            else:
+                index = activity._index(day)
+                if index is None or index < 0:
+                    return activity
+                value &= ~(1 << index)
+                if not value:
+                    activity.origin = None
+
+            activity._store(value)
+            activity.save(update_fields=['origin', 'bits', 'updated_at'])
+        return activity
+
+class EntrySearchDocument(models.Model):
+    """
+    Denormalized search text for an entry. The full-text index itself (Postgres
+    tsvector + GIN, or SQLite FTS5) is built over this table by SearchService.
+    """
+    entry = models.OneToOneField(Entry, on_delete=models.CASCADE, related_name='search_document')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_documents')
+    title = models.CharField(max_length=200, blank=True)
+    body = models.TextField(blank=True)
+    summary = models.TextField(blank=True)
+    tags = models.TextField(blank=True)  # Space-separated tag names
+
+    # Filter columns copied from the entry so searches don't need a join
+    mood = models.CharField(max_length=50, blank=True, null=True)
+    created_at = models.DateTimeField()
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Entry Search Document'
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['user', 'mood']),
+        ]
+
+    def __str__(self):
+        return f"Search document for entry {self.entry_id}"
+
+class RelatedEntry(models.Model):
+    """
+    Precomputed top-k neighbour of an entry (TF-IDF content similarity blended
+    with tag co-occurrence), maintained by SimilarityService.
+    """
+    entry = models.ForeignKey(Entry, on_delete=models.CASCADE, related_name='neighbours')
+    related = models.ForeignKey(Entry, on_delete=models.CASCADE, related_name='neighbour_of')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['entry', 'rank']
+        verbose_name_plural = 'related entries'
+        constraints = [
+            models.UniqueConstraint(fields=['entry', 'related'], name='unique_related_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['entry', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.entry_id} -> {self.related_id} ({self.score:.3f})"
+
+class UserDataExport(models.Model):
+    """
+    A user data export written to file storage by ExportService. The file is
+    served through an unguessable token; incremental exports only contain
+    what changed after `since`.
+    """
+
+    FORMAT_CHOICES = [
+        ('ndjson', 'NDJSON'),
+        ('zip', 'Zip archive with photos'),
+    ]
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='data_exports')
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    export_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='ndjson')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+
+    since = models.DateTimeField(null=True, blank=True)  # Set for incremental exports
+    file = models.FileField(upload_to='exports/%Y/%m/', blank=True)
+    size = models.BigIntegerField(default=0)
+    entry_count = models.PositiveIntegerField(default=0)
+    photo_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'status', 'created_at']),
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_export_format_display()} export for {self.user.username} ({self.status})"
+
+    @property
+    def is_incremental(self):
+        return self.since is not None
+
+    @classmethod
+    def last_completed(cls, user):
+        """Most recent finished export still on storage, the baseline for incremental exports"""
+        return cls.objects.filter(user=user, status='completed').exclude(file='').order_by('-created_at').first()
+
 class UserInsight(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='insights')
     insight_type = models.CharField(max_length=50, choices=[
@@ -293,6 +817,27 @@ class UserInsight(models.Model):
             ),
         ]
 
+class UserInsightState(models.Model):
+    """
+    Rolling analysis behind a user's insights. Each incremental run sends the
+    model only the entries after last_entry_id together with this compact
+    state, then folds the result back in.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='insight_state')
+    last_entry_id = models.PositiveBigIntegerField(default=0)
+    last_entry_at = models.DateTimeField(null=True, blank=True)
+    summary = models.TextField(blank=True)
+    themes = models.JSONField(default=list, blank=True)  # [{'name': ..., 'description': ...}]
+    mood_trajectory = models.JSONField(default=list, blank=True)  # One point per run, oldest first
+    entries_analyzed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'User Insight State'
+
+    def __str__(self):
+        return f"Insight state for {self.user.username}"
+
 class AnalyticsEvent(models.Model):
     """Track user interactions for better insights"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='analytics_events')
@@ -565,6 +1110,8 @@ class AIGenerationLog(models.Model):
         ('connections', 'Thematic Connections'),
         ('guide', 'Reader\'s Guide'),
         ('marketing', 'Marketing Copy'),
+        ('insights', 'Insights'),
+        ('biography', 'Biography'),
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -590,6 +1137,9 @@ class AIGenerationLog(models.Model):
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Long prompts and outputs are stored as this prefix + base64 of zlib data
+    COMPRESSED_PREFIX = 'zlib:'
+
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'AI Generation Log'
@@ -598,6 +1148,32 @@ class AIGenerationLog(models.Model):
     def __str__(self):
         return f"{self.get_generation_type_display()} for {self.user.username}"
 
+    @classmethod
+    def pack_text(cls, text, compress_over):
+        """Stored form of a prompt or output: compressed when longer than compress_over chars"""
+        text = text or ''
+        if len(text) <= compress_over:
+            return text
+        packed = cls.COMPRESSED_PREFIX + base64.b64encode(zlib.compress(text.encode('utf-8'), 6)).decode('ascii')
+        return packed if len(packed) < len(text) else text
+
+    @classmethod
+    def unpack_text(cls, value):
+        if not value or not value.startswith(cls.COMPRESSED_PREFIX):
+            return value
+        try:
+            return zlib.decompress(base64.b64decode(value[len(cls.COMPRESSED_PREFIX):])).decode('utf-8')
+        except (ValueError, zlib.error):
+            return value
+
+    @property
+    def prompt_text(self):
+        return self.unpack_text(self.input_prompt)
+
+    @property
+    def content_text(self):
+        return self.unpack_text(self.generated_content)
+
 # ========================================================================
 # MARKETPLACE-SPECIFIC MODELS (ENHANCED)
 # ========================================================================
@@ -612,8 +1188,9 @@ class JournalTag(models.Model):
     def __str__(self):
         return self.name
 
-class Journal(models.Model):
+class Journal(ImageDerivativesMixin):
     """Model representing a curated journal that can be published to the marketplace"""
+    SOURCE_IMAGE_FIELD = 'cover_image'
 
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -745,9 +1322,16 @@ class Journal(models.Model):
 
     @property
     def cover_image_url(self):
-        """Get cover image URL with fallback"""
+        """Get cover image URL (medium derivative) with fallback"""
         if self.cover_image:
-            return self.cover_image.url
+            return self.medium_url
+        return '/static/images/default-journal-cover.jpg'  # Fallback image
+
+    @property
+    def cover_thumbnail_url(self):
+        """Cover image sized for cards and lists"""
+        if self.cover_image:
+            return self.thumbnail_url
         return '/static/images/default-journal-cover.jpg'  # Fallback image
 
     def get_image_filter_display_name(self):
@@ -1034,8 +1618,10 @@ class UserFollowing(models.Model):
     def __str__(self):
         return f"{self.user.username} follows {self.followed_user.username}"
 
-class EntryPhoto(models.Model):
+class EntryPhoto(ImageDerivativesMixin):
     """Model for photos attached to journal entries"""
+    SOURCE_IMAGE_FIELD = 'photo'
+
     entry = models.ForeignKey(Entry, on_delete=models.CASCADE, related_name='photos')
     photo = models.ImageField(upload_to='entry_photos/%Y/%m/%d/')
     caption = models.CharField(max_length=255, blank=True)
@@ -1061,7 +1647,9 @@ class EntryTag(models.Model):
     class Meta:
         ordering = ['name']
 
-class UserProfile(models.Model):
+class UserProfile(ImageDerivativesMixin):
+    SOURCE_IMAGE_FIELD = 'profile_picture'
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     profile_picture = models.ImageField(
         upload_to='profile_pictures/',
@@ -1081,8 +1669,8 @@ class UserProfile(models.Model):
         return f"{self.user.username}'s Profile"
 
     def get_profile_picture_url(self):
-        if self.profile_picture and hasattr(self.profile_picture, 'url'):
-            return self.profile_picture.url
+        if self.profile_picture:
+            return self.thumbnail_url
         return '/static/images/default-avatar.png'  # Fallback image
 
     class Meta:
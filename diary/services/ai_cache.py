@@ -0,0 +1,341 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_VERSION = 1
+WHITESPACE_RE = re.compile(r'\s+')
+STATS_KEY = "ai_cache_stats_{policy}_{counter}"
+COUNTERS = ('hits', 'local_hits', 'misses', 'stores', 'coalesced')
+# Counters are pushed to the shared cache in batches so local hits stay free of network calls
+STATS_FLUSH_EVENTS = 50
+STATS_FLUSH_SECONDS = 10
+# Single-flight: the leader's lock outlives its request deadline by this much
+LOCK_GRACE_SECONDS = 5
+POLL_INITIAL = 0.05
+POLL_MAX = 0.5
+
+
+def normalize_prompt(text: str) -> str:
+    """Canonical prompt text: Unicode NFC, case-folded, whitespace collapsed"""
+    text = unicodedata.normalize('NFC', text or '')
+    return WHITESPACE_RE.sub(' ', text).strip().casefold()
+
+
+class _LocalLRU:
+    """Small thread-safe in-process LRU with per-item expiry"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class AIResponseCache:
+    """
+    Cache for LLM completions, keyed on the model, the normalized messages
+    and the sampling parameters. Lookups go to an in-process LRU first and
+    then to the shared cache (Redis in production); each call site names a
+    policy that picks its TTL from settings.AI_CACHE_TTLS. Cache outages
+    are treated as misses so they never break generation.
+    """
+
+    _local = _LocalLRU(settings.AI_CACHE_LOCAL_MAX_ENTRIES)
+    _counts = {}
+    _pending = {}
+    _last_flush = time.monotonic()
+    _counts_lock = threading.Lock()
+
+    @staticmethod
+    def ttl_for(policy: str) -> int:
+        ttls = settings.AI_CACHE_TTLS
+        return ttls.get(policy, ttls['default'])
+
+    @staticmethod
+    def make_key(payload: Dict) -> str:
+        """Key for a chat completion payload (model, messages, temperature, max_tokens)"""
+        canonical = json.dumps([
+            payload.get('model'),
+            [[message.get('role'), normalize_prompt(message.get('content'))] for message in payload.get('messages', [])],
+            round(float(payload.get('temperature', 0)), 3),
+            payload.get('max_tokens'),
+        ], separators=(',', ':'), ensure_ascii=False)
+        digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+        return f"ai_response_v{KEY_VERSION}_{digest}"
+
+    @staticmethod
+    def _count(policy: str, counter: str):
+        cls = AIResponseCache
+        with cls._counts_lock:
+            per_policy = cls._counts.setdefault(policy, dict.fromkeys(COUNTERS, 0))
+            per_policy[counter] += 1
+            cls._pending[(policy, counter)] = cls._pending.get((policy, counter), 0) + 1
+            due = (sum(cls._pending.values()) >= STATS_FLUSH_EVENTS or
+                   time.monotonic() - cls._last_flush > STATS_FLUSH_SECONDS)
+            if due:
+                batch, cls._pending, cls._last_flush = cls._pending, {}, time.monotonic()
+        if due:
+            cls._flush(batch)
+
+    @staticmethod
+    def _flush(batch):
+        # Cluster-wide counters live in the shared cache; losing a batch is harmless
+        for (policy, counter), delta in batch.items():
+            key = STATS_KEY.format(policy=policy, counter=counter)
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                cache.add(key, delta, None)
+            except Exception:
+                return
+
+    @staticmethod
+    def flush_stats():
+        """Push this process's unsent counters to the shared cache"""
+        cls = AIResponseCache
+        with cls._counts_lock:
+            batch, cls._pending, cls._last_flush = cls._pending, {}, time.monotonic()
+        cls._flush(batch)
+
+    @staticmethod
+    def get(policy: str, payload: Dict) -> Optional[str]:
+        key = AIResponseCache.make_key(payload)
+        value = AIResponseCache._local.get(key)
+        if value is not None:
+            AIResponseCache._count(policy, 'local_hits')
+            return value
+
+        try:
+            value = cache.get(key)
+        except Exception as e:
+            logger.warning(f"AI cache read failed ({policy}): {e}")
+            value = None
+
+        if value is None:
+            AIResponseCache._count(policy, 'misses')
+            return None
+
+        AIResponseCache._local.set(key, value, min(AIResponseCache.ttl_for(policy), settings.AI_CACHE_LOCAL_TTL))
+        AIResponseCache._count(policy, 'hits')
+        return value
+
+    @staticmethod
+    def set(policy: str, payload: Dict, value: str):
+        if not value:
+            return
+        key = AIResponseCache.make_key(payload)
+        ttl = AIResponseCache.ttl_for(policy)
+        AIResponseCache._local.set(key, value, min(ttl, settings.AI_CACHE_LOCAL_TTL))
+        try:
+            cache.set(key, value, ttl)
+        except Exception as e:
+            logger.warning(f"AI cache write failed ({policy}): {e}")
+        AIResponseCache._count(policy, 'stores')
+
+    @staticmethod
+    def stats(policies=None) -> Dict[str, Dict[str, int]]:
+        """Cluster-wide hit/miss counters per policy, with the hit ratio"""
+        policies = policies or list(settings.AI_CACHE_TTLS)
+        keys = {
+            (policy, counter): STATS_KEY.format(policy=policy, counter=counter)
+            for policy in policies for counter in COUNTERS
+        }
+        try:
+            values = cache.get_many(list(keys.values()))
+        except Exception:
+            values = {}
+
+        report = {}
+        for policy in policies:
+            counts = {counter: int(values.get(keys[(policy, counter)], 0)) for counter in COUNTERS}
+            lookups = counts['hits'] + counts['local_hits'] + counts['misses']
+            counts['hit_ratio'] = round((counts['hits'] + counts['local_hits']) / lookups, 3) if lookups else 0.0
+            report[policy] = counts
+        return report
+
+    @staticmethod
+    def local_stats() -> Dict[str, Dict[str, int]]:
+        """Counters of this process only"""
+        with AIResponseCache._counts_lock:
+            return {policy: dict(counts) for policy, counts in AIResponseCache._counts.items()}
+
+    @staticmethod
+    def clear_local():
+        AIResponseCache._local.clear()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent AI requests across the cluster.
+
+    The first caller for a response key takes a short-lived lock in the
+    shared cache and calls the API; everyone else waits for the response to
+    land in AIResponseCache. Waiters in the same process are woken by an
+    event, others poll with backoff. A waiter gives up after its own request
+    deadline, or takes over if the leader released the lock without a
+    result, so a failed or stuck leader never blocks callers for longer than
+    an uncoalesced call would have.
+    """
+
+    _inflight = {}
+    _inflight_lock = threading.Lock()
+
+    @staticmethod
+    def _acquire(key: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            if cache.add(f"{key}_lock", token, int(ttl) + 1):
+                return token
+        except Exception as e:
+            # No shared cache: every caller leads, which is the uncoalesced behavior
+            logger.warning(f"Single-flight lock unavailable: {e}")
+            return token
+        return None
+
+    @staticmethod
+    def _release(key: str, token: str):
+        try:
+            if cache.get(f"{key}_lock") == token:
+                cache.delete(f"{key}_lock")
+        except Exception:
+            pass
+
+    @staticmethod
+    def _locked(key: str) -> bool:
+        try:
+            return cache.get(f"{key}_lock") is not None
+        except Exception:
+            return False
+
+    @staticmethod
+    def _shared_value(key: str) -> Optional[str]:
+        try:
+            return cache.get(key)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _lead(policy: str, payload: Dict, key: str, token: str, compute: Callable[[], str]) -> str:
+        with SingleFlight._inflight_lock:
+            event = SingleFlight._inflight.setdefault(key, threading.Event())
+        try:
+            value = compute()
+            AIResponseCache.set(policy, payload, value)
+            return value
+        finally:
+            SingleFlight._release(key, token)
+            with SingleFlight._inflight_lock:
+                SingleFlight._inflight.pop(key, None)
+            event.set()
+
+    @staticmethod
+    def run(policy: str, payload: Dict, compute: Callable[[], str], timeout: float) -> str:
+        """Cached response for payload, computing it at most once cluster-wide"""
+        cached = AIResponseCache.get(policy, payload)
+        if cached is not None:
+            return cached
+
+        key = AIResponseCache.make_key(payload)
+        deadline = time.monotonic() + timeout
+        delay = POLL_INITIAL
+        while True:
+            token = SingleFlight._acquire(key, timeout + LOCK_GRACE_SECONDS)
+            if token:
+                return SingleFlight._lead(policy, payload, key, token, compute)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Single-flight wait expired ({policy}); calling the API directly")
+                break
+            with SingleFlight._inflight_lock:
+                event = SingleFlight._inflight.get(key)
+            if event is not None:
+                event.wait(remaining)
+            else:
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, POLL_MAX)
+
+            value = SingleFlight._shared_value(key)
+            if value is not None:
+                AIResponseCache._count(policy, 'coalesced')
+                return value
+            if SingleFlight._locked(key):
+                continue
+            # Leader finished without a result; loop to take over
+
+        value = compute()
+        AIResponseCache.set(policy, payload, value)
+        return value
+
+    @staticmethod
+    async def arun(policy: str, payload: Dict, compute, timeout: float) -> str:
+        """Async variant of run(); compute is a coroutine function"""
+        cached = await asyncio.to_thread(AIResponseCache.get, policy, payload)
+        if cached is not None:
+            return cached
+
+        key = AIResponseCache.make_key(payload)
+        deadline = time.monotonic() + timeout
+        delay = POLL_INITIAL
+        while True:
+            token = await asyncio.to_thread(SingleFlight._acquire, key, timeout + LOCK_GRACE_SECONDS)
+            if token:
+                try:
+                    value = await compute()
+                    await asyncio.to_thread(AIResponseCache.set, policy, payload, value)
+                    return value
+                finally:
+                    await asyncio.to_thread(SingleFlight._release, key, token)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Single-flight wait expired ({policy}); calling the API directly")
+                break
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, POLL_MAX)
+
+            value = await asyncio.to_thread(SingleFlight._shared_value, key)
+            if value is not None:
+                AIResponseCache._count(policy, 'coalesced')
+                return value
+            if await asyncio.to_thread(SingleFlight._locked, key):
+                continue
+
+        value = await compute()
+        await asyncio.to_thread(AIResponseCache.set, policy, payload, value)
+        return value
@@ -0,0 +1,133 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class AILogBuffer:
+    """
+    In-process sink for AIGenerationLog rows.
+
+    Callers queue a row and return immediately; a daemon thread writes
+    queued rows with one bulk_create once batch_size rows are waiting or
+    flush_seconds after the oldest was queued, and again at interpreter
+    exit. Long prompts and outputs are compressed before they are stored.
+    If the database falls behind, the oldest rows beyond max_pending are
+    dropped rather than letting the queue grow without bound.
+    """
+
+    def __init__(self):
+        self.config = settings.AI_LOG_BUFFER
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        self.dropped = 0
+        self.written = 0
+
+    def add(self, **fields):
+        """Queue one AIGenerationLog row (model field values)"""
+        AIGenerationLog = apps.get_model('diary', 'AIGenerationLog')
+        compress_over = self.config['compress_over']
+        fields['input_prompt'] = AIGenerationLog.pack_text(fields.get('input_prompt'), compress_over)
+        fields['generated_content'] = AIGenerationLog.pack_text(fields.get('generated_content'), compress_over)
+
+        if not self.config['enabled']:
+            self._write([fields])
+            return
+
+        self._ensure_thread()
+        with self._lock:
+            self._pending.append((time.monotonic(), fields))
+            while len(self._pending) > self.config['max_pending']:
+                self._pending.popleft()
+                self.dropped += 1
+            # Wake the writer to start the flush_seconds clock, or to write a full batch
+            wake = len(self._pending) == 1 or len(self._pending) >= self.config['batch_size']
+        if wake:
+            self._wake.set()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _take(self) -> List[Dict]:
+        with self._lock:
+            rows = [fields for _, fields in self._pending]
+            self._pending.clear()
+        return rows
+
+    def _write(self, rows: List[Dict]):
+        AIGenerationLog = apps.get_model('diary', 'AIGenerationLog')
+        try:
+            AIGenerationLog.objects.bulk_create([AIGenerationLog(**fields) for fields in rows], batch_size=500)
+            self.written += len(rows)
+        except Exception as e:
+            logger.error(f"Error writing {len(rows)} AI generation logs: {e}")
+
+    def flush(self) -> int:
+        """Write everything queued now; returns the number of rows taken"""
+        rows = self._take()
+        if rows:
+            self._write(rows)
+        return len(rows)
+
+    # ------------------------------------------------------------------
+    # Background writer
+    # ------------------------------------------------------------------
+
+    def _ensure_thread(self):
+        # A forked worker (gunicorn/celery prefork) inherits the object but not the thread
+        pid = os.getpid()
+        if self._thread is not None and self._thread_pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != pid or not self._thread.is_alive():
+                if self._thread_pid not in (None, pid):
+                    # Rows queued before the fork are the parent's to write
+                    self._pending.clear()
+                self._thread = threading.Thread(target=self._run, name='ai-log-writer', daemon=True)
+                self._thread_pid = pid
+                self._thread.start()
+
+    def _due(self) -> float:
+        """Seconds until the oldest queued row must be written (None when empty)"""
+        with self._lock:
+            if not self._pending:
+                return None
+            oldest = self._pending[0][0]
+        return max(0.0, oldest + self.config['flush_seconds'] - time.monotonic())
+
+    def _run(self):
+        while True:
+            wait = self._due()
+            if wait is None or (wait > 0 and self.pending() < self.config['batch_size']):
+                self._wake.wait(wait)
+                self._wake.clear()
+                continue
+            close_old_connections()
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_ai_log_buffer() -> AILogBuffer:
+    """The process-wide log buffer"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = AILogBuffer()
+                atexit.register(_buffer.flush)
+    return _buffer
@@ -1,8 +1,9 @@
 import json
 import logging
 import time
-import requests
+from collections import Counter
 from datetime import datetime, timedelta
+from decimal import Decimal
 from requests.exceptions import Timeout, ConnectionError, RequestException
 from typing import List, Dict, Any, Optional
 from django.contrib.auth.models import User
@@ -10,11 +11,27 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from django.conf import settings
 from django.apps import apps
+from django.db import transaction
 
 from ..utils.ai_helpers import generate_ai_content, generate_ai_content_personalized
+from .llm_client import get_llm_client, track_usage
+from .ai_log_buffer import get_ai_log_buffer
+from .rate_limiter import RateLimitExceeded
+from .analytics_engine import EntryAnalytics
+from .biography_service import BiographyService, STANDARD_CHAPTERS
+from .chapter_clustering import ChapterClusteringService
+from .prompt_builder import PromptBuilder, estimate_tokens, truncate_to_tokens
+from .search_service import SearchService
 
 logger = logging.getLogger(__name__)
 
+# Entry fields read when packing entries into prompts
+PROMPT_ENTRY_FIELDS = ('id', 'title', 'content', 'created_at', 'mood', 'mood_rating')
+# Incremental insights: insight types the model maintains and how much state it carries
+INCREMENTAL_INSIGHT_TYPES = ('pattern', 'suggestion', 'mood_analysis')
+INSIGHT_THEME_LIMIT = 8
+MOOD_TRAJECTORY_POINTS = 12
+
 class AIService:
     """
     Service class for AI integration features
@@ -27,17 +44,13 @@ class AIService:
     """
 
     @staticmethod
-    def generate_entry_summary(entry):
-        """Generate a summary for a diary entry"""
+    def generate_entry_summary(entry, raise_errors=False):
+        """
+        Generate a summary for a diary entry. API errors give a fallback
+        message, or propagate with raise_errors (background jobs that report
+        retrying/failed instead of storing the fallback).
+        """
         try:
-            # Store previous summary as a version if it exists
-            if entry.summary:
-                SummaryVersion = apps.get_model('diary', 'SummaryVersion')
-                SummaryVersion.objects.create(
-                    entry=entry,
-                    summary=entry.summary
-                )
-
             # Get response from Groq
             prompt = f"""
             Analyze this diary entry and provide a thoughtful summary with insights about the person's feelings,
@@ -50,19 +63,223 @@ class AIService:
             Format your response as a brief summary (2-3 paragraphs) focused on psychological insights.
             """
 
-            summary = AIService._get_groq_response(prompt)
+            summary = AIService._get_groq_response(prompt, cache_as='summary')
+
+            with transaction.atomic():
+                # Store previous summary as a version if it exists
+                if entry.summary:
+                    SummaryVersion = apps.get_model('diary', 'SummaryVersion')
+                    SummaryVersion.objects.create(
+                        entry=entry,
+                        summary=entry.summary
+                    )
 
-            # Update the entry with new summary
-            entry.summary = summary
-            entry.summary_generated_at = timezone.now()
-            entry.save()
+                # Update the entry with new summary
+                entry.summary = summary
+                entry.summary_generated_at = timezone.now()
+                entry.save(update_fields=['summary', 'summary_generated_at'])
 
             return summary
 
+        except RateLimitExceeded:
+            # Background callers reschedule instead of storing a fallback
+            raise
         except Exception as e:
             logger.error(f"Error generating summary: {str(e)}")
+            if raise_errors:
+                raise
             return "Unable to generate summary at this time."
 
+    # ------------------------------------------------------------------
+    # Prompt assembly and usage logging
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _prompt_candidates(user):
+        """Recent entries considered for a packed prompt, with only the fields prompts read"""
+        Entry = apps.get_model('diary', 'Entry')
+        return (Entry.objects.filter(user=user).order_by('-created_at')
+                .only(*PROMPT_ENTRY_FIELDS)[:settings.AI_PROMPT_CANDIDATE_LIMIT])
+
+    @staticmethod
+    def _entry_sample(entry, content) -> Dict:
+        sample = {
+            'date': entry.created_at.strftime('%Y-%m-%d'),
+            'title': entry.title,
+            'content': content,
+        }
+        if entry.mood:
+            sample['mood'] = entry.mood
+        tags = ", ".join(tag.name for tag in entry.tags.all())
+        if tags:
+            sample['tags'] = tags
+        return sample
+
+    @staticmethod
+    def _log_generation(user, generation_type, prompt, content, generation_time, metadata, success=True,
+                        usage=None):
+        """
+        Queue an AIGenerationLog row for an AI call. Tokens and cost come
+        from the API usage collected by track_usage() when the call reached
+        the API, otherwise (cache hit, no tracker) tokens are estimated.
+        """
+        if not getattr(user, 'is_authenticated', False):
+            return
+        try:
+            if usage is not None and usage.calls:
+                token_count = usage.total_tokens
+                generation_metadata = {
+                    'prompt_tokens': usage.prompt_tokens,
+                    'completion_tokens': usage.completion_tokens,
+                    'api_calls': usage.calls,
+                    'models': sorted(usage.models),
+                    'usage_source': 'api',
+                }
+            else:
+                completion_tokens = estimate_tokens(content)
+                token_count = metadata.get('prompt_tokens', 0) + completion_tokens
+                generation_metadata = {'completion_tokens': completion_tokens, 'usage_source': 'estimate'}
+
+            get_ai_log_buffer().add(
+                user=user,
+                generation_type=generation_type,
+                input_prompt=prompt,
+                input_metadata=metadata,
+                generated_content=content or '',
+                generation_metadata=generation_metadata,
+                success=success,
+                generation_time=round(generation_time, 3),
+                token_count=token_count,
+                cost=Decimal(str(round(usage.cost, 4))) if usage is not None and usage.calls else Decimal('0'),
+            )
+        except Exception as e:
+            logger.error(f"Error logging AI generation: {str(e)}")
+
+    # ------------------------------------------------------------------
+    # Batched summaries
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _summary_batches(entries, max_entries: int) -> List[List]:
+        """Group entries so each prompt stays within the summary batch token budget"""
+        budget = settings.AI_SUMMARY_BATCH_INPUT_TOKENS
+        batches, current, used = [], [], 0
+        for entry in entries:
+            cost = estimate_tokens(entry.title) + estimate_tokens(entry.content) + 20
+            if current and (used + cost > budget or len(current) >= max_entries):
+                batches.append(current)
+                current, used = [], 0
+            current.append(entry)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    @staticmethod
+    def _batch_summary_prompt(entries) -> str:
+        # An entry that alone exceeds the budget is cut rather than sent on its own
+        max_tokens = settings.AI_SUMMARY_BATCH_INPUT_TOKENS
+        blocks = []
+        for index, entry in enumerate(entries, 1):
+            blocks.append(
+                f"[E{index}]\nTitle: {entry.title}\n"
+                f"Date: {entry.created_at.strftime('%Y-%m-%d')}\n"
+                f"Content: {truncate_to_tokens(entry.content or '', max_tokens)}"
+            )
+        return f"""
+            Analyze each of the following diary entries separately and provide a thoughtful summary with
+            insights about the person's feelings, motivations, and patterns. Identify any notable themes or
+            emotional states. Each summary should be 2-3 short paragraphs focused on psychological insights.
+
+            {chr(10).join(blocks)}
+
+            Respond with JSON only, in this exact format, with one item per entry:
+            {{"summaries": [{{"id": "E1", "summary": "..."}}]}}
+            """
+
+    @staticmethod
+    def _parse_batch_summaries(response: str, entries) -> Dict[int, str]:
+        """Map entry id -> summary from a batch response, skipping anything unusable"""
+        try:
+            data = json.loads(AIService.extract_json_from_text(response))
+        except (TypeError, ValueError):
+            logger.warning("Batch summary response was not valid JSON")
+            return {}
+
+        items = data.get('summaries', []) if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return {}
+        summaries = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            label = str(item.get('id', '')).strip().upper().lstrip('[').rstrip(']')
+            summary = item.get('summary')
+            if not label.startswith('E') or not label[1:].isdigit() or not isinstance(summary, str):
+                continue
+            index = int(label[1:]) - 1
+            if 0 <= index < len(entries) and summary.strip():
+                summaries[entries[index].id] = summary.strip()
+        return summaries
+
+    @staticmethod
+    def generate_entry_summaries(entries) -> Dict[int, str]:
+        """
+        Summarize many entries with one API call per batch instead of one per
+        entry. Entries the model skipped or garbled get one more pass in
+        smaller batches; whatever still fails is simply absent from the
+        returned {entry_id: summary} dict so callers can retry just those.
+        """
+        Entry = apps.get_model('diary', 'Entry')
+        SummaryVersion = apps.get_model('diary', 'SummaryVersion')
+
+        entries = list(entries)
+        summaries = {}
+        pending = entries
+        deferred = None
+        max_entries = settings.AI_SUMMARY_BATCH_MAX_ENTRIES
+        for attempt in range(2):
+            if not pending or deferred:
+                break
+            # The retry pass uses smaller batches so one bad entry cannot sink its neighbours again
+            batch_size = max_entries if attempt == 0 else max(1, max_entries // 2)
+            for batch in AIService._summary_batches(pending, batch_size):
+                tokens = settings.AI_SUMMARY_TOKENS_PER_ENTRY * len(batch)
+                try:
+                    response = AIService._get_groq_response(AIService._batch_summary_prompt(batch), max_tokens=tokens)
+                except RateLimitExceeded as e:
+                    # Out of capacity: keep what is done and let the caller reschedule the rest
+                    deferred = e
+                    break
+                except Exception as e:
+                    logger.error(f"Error generating batch summary for {len(batch)} entries: {str(e)}")
+                    continue
+                summaries.update(AIService._parse_batch_summaries(response, batch))
+            pending = [entry for entry in pending if entry.id not in summaries]
+
+        if not summaries:
+            if deferred:
+                raise deferred
+            return summaries
+
+        now = timezone.now()
+        summarized = [entry for entry in entries if entry.id in summaries]
+        versions = [SummaryVersion(entry=entry, summary=entry.summary) for entry in summarized if entry.summary]
+        for entry in summarized:
+            entry.summary = summaries[entry.id]
+            entry.summary_generated_at = now
+
+        with transaction.atomic():
+            SummaryVersion.objects.bulk_create(versions)
+            Entry.objects.bulk_update(summarized, ['summary', 'summary_generated_at'])
+        # bulk_update skips the post_save search indexing
+        SearchService.index_entries([entry.id for entry in summarized])
+
+        logger.info(f"Summarized {len(summarized)} of {len(entries)} entries in batch mode")
+        if deferred:
+            raise deferred
+        return summaries
+
     @staticmethod
     def extract_json_from_text(text):
         """Extract JSON from text that might contain backticks and explanatory text"""
@@ -92,16 +309,23 @@ class AIService:
             UserInsight = apps.get_model('diary', 'UserInsight')
 
             if entries is None:
-                entries = Entry.objects.filter(user=user).order_by('-created_at')[:20]
-
-            if not entries:
+                entries = AIService._prompt_candidates(user)
+
+            # Pack the most telling entries into the prompt budget
+            packed = PromptBuilder.pack_entries(
+                entries,
+                budget=settings.AI_PROMPT_BUDGETS['insights'],
+                render=lambda entry, content: (
+                    f"Title: {entry.title}\nDate: {entry.created_at.strftime('%Y-%m-%d')}\nContent: {content}"
+                ),
+                max_entry_tokens=120,
+            )
+            if not packed['entries']:
                 return []
 
-            # Prepare entry data
-            entry_data = "\n\n".join([
-                f"Entry {i+1}:\nTitle: {entry.title}\nDate: {entry.created_at.strftime('%Y-%m-%d')}\nContent: {entry.content[:200]}..."
-                for i, entry in enumerate(entries)
-            ])
+            entry_data = "\n\n".join(
+                f"Entry {i+1}:\n{block}" for i, block in enumerate(packed['blocks'])
+            )
 
             prompt = f"""
             Based on these diary entries, identify patterns, make observations about mood trends,
@@ -126,7 +350,13 @@ class AIService:
             }}
             """
 
-            response = AIService._get_groq_response(prompt)
+            started = time.time()
+            with track_usage() as usage:
+                response = AIService._get_groq_response(prompt, cache_as='insights')
+            AIService._log_generation(
+                user, 'insights', prompt, response, time.time() - started,
+                PromptBuilder.usage_metadata(packed, prompt), usage=usage
+            )
 
             # Parse JSON response
             try:
@@ -180,50 +410,183 @@ class AIService:
             logger.error(f"Error generating insights: {str(e)}")
             return []
 
+    # ------------------------------------------------------------------
+    # Incremental insights
+    # ------------------------------------------------------------------
+
     @staticmethod
-    def generate_biography(user, time_period_start=None, time_period_end=None):
-        """Generate a biography based on a user's diary entries"""
-        try:
-            Entry = apps.get_model('diary', 'Entry')
-            Biography = apps.get_model('diary', 'Biography')
+    def _mood_point(entries) -> Dict:
+        """Mood trajectory point for the entries of one incremental run"""
+        ratings = [entry.mood_rating for entry in entries if entry.mood_rating]
+        moods = Counter(entry.mood for entry in entries if entry.mood)
+        return {
+            'through': max(entry.created_at for entry in entries).strftime('%Y-%m-%d'),
+            'entries': len(entries),
+            'avg_rating': round(sum(ratings) / len(ratings), 1) if ratings else None,
+            'moods': dict(moods.most_common(3)),
+        }
 
-            # Get entries for the specified time period
-            entries = Entry.objects.filter(user=user)
-            if time_period_start:
-                entries = entries.filter(created_at__date__gte=time_period_start)
-            if time_period_end:
-                entries = entries.filter(created_at__date__lte=time_period_end)
+    @staticmethod
+    def update_insights(user) -> Dict[str, int]:
+        """
+        Fold the entries written since the last run into the user's insight
+        state and upsert their insights.
 
-            entries = entries.order_by('created_at')
+        Only the new entries and the compact state (running summary, themes,
+        mood trajectory and current insight titles) go to the model, so the
+        cost of a run follows new writing rather than journal size. Insights
+        are updated in place by type and title; ones the model retires are
+        removed. Errors propagate and leave the state untouched, so a retry
+        covers the same entries.
 
-            if not entries:
-                return None
+        Returns:
+            dict: new_entries, created, updated, retired
+        """
+        Entry = apps.get_model('diary', 'Entry')
+        UserInsight = apps.get_model('diary', 'UserInsight')
+        UserInsightState = apps.get_model('diary', 'UserInsightState')
+
+        state, _ = UserInsightState.objects.get_or_create(user=user)
+        new_entries = list(
+            Entry.objects.filter(user=user, id__gt=state.last_entry_id)
+            .order_by('-created_at').only(*PROMPT_ENTRY_FIELDS)[:settings.AI_PROMPT_CANDIDATE_LIMIT]
+        )
+        result = {'new_entries': len(new_entries), 'created': 0, 'updated': 0, 'retired': 0}
+        if not new_entries:
+            return result
+
+        packed = PromptBuilder.pack_entries(
+            new_entries,
+            budget=settings.AI_PROMPT_BUDGETS['insights'],
+            render=lambda entry, content: (
+                f"Title: {entry.title}\nDate: {entry.created_at.strftime('%Y-%m-%d')}\n"
+                f"Mood: {entry.mood or 'unknown'}\nContent: {content}"
+            ),
+            max_entry_tokens=120,
+        )
+        existing = list(UserInsight.objects.filter(user=user, insight_type__in=INCREMENTAL_INSIGHT_TYPES))
+        state_json = json.dumps({
+            'summary': state.summary,
+            'themes': state.themes,
+            'mood_trajectory': state.mood_trajectory[-6:] + [AIService._mood_point(new_entries)],
+            'current_insights': [{'type': i.insight_type, 'title': i.title} for i in existing],
+            # Local pre-analysis of all new entries, including those left out of the prompt
+            'new_entries_analysis': EntryAnalytics.from_entries(new_entries).prompt_summary(),
+        }, ensure_ascii=False)
+        entry_data = "\n\n".join(packed['blocks'])
+
+        prompt = f"""
+        You maintain a running analysis of a person's diary. Here is the analysis so far
+        (empty on the first run), as JSON:
+
+        {state_json}
+
+        These are the entries written since then ({len(new_entries)} new, the most telling shown):
+
+        {entry_data}
+
+        Update the analysis with the new entries. Keep what still holds, revise what changed.
+        When an existing insight still applies, reuse its exact title so it is updated in place.
+
+        Format your response as JSON with the following structure:
+        {{
+            "summary": "Updated 3-5 sentence summary of the journal so far",
+            "themes": [{{"name": "Theme", "description": "One sentence"}}],
+            "patterns": [{{"title": "Pattern title", "description": "Description of pattern"}}],
+            "suggestions": [{{"title": "Suggestion title", "description": "Description of suggestion"}}],
+            "mood_analysis": {{"title": "Mood Analysis", "description": "Overall mood analysis"}},
+            "retire": ["Titles of current insights that no longer apply"]
+        }}
+        At most {INSIGHT_THEME_LIMIT} themes.
+        """
+
+        started = time.time()
+        # Not cached: a malformed reply would be replayed on every retry, and the prompt carries saved state
+        with track_usage() as usage:
+            response = AIService._get_groq_response(prompt)
+        metadata = PromptBuilder.usage_metadata(packed, prompt)
+        metadata.update(incremental=True, new_entries=len(new_entries))
+        AIService._log_generation(user, 'insights', prompt, response, time.time() - started, metadata, usage=usage)
+
+        data = json.loads(AIService.extract_json_from_text(response))
+
+        by_key = {(insight.insight_type, insight.title.casefold()): insight for insight in existing}
+        mood_insight = next((i for i in existing if i.insight_type == 'mood_analysis'), None)
+        now = timezone.now()
+        to_create, to_update = [], {}
+
+        proposed = [('pattern', item) for item in data.get('patterns') or []]
+        proposed += [('suggestion', item) for item in data.get('suggestions') or []]
+        if data.get('mood_analysis'):
+            proposed.append(('mood_analysis', data['mood_analysis']))
+
+        for insight_type, item in proposed:
+            title = (item.get('title') or '').strip()[:200]
+            content = item.get('description') or item.get('content') or ''
+            if not title:
+                continue
+            # One mood analysis per user, whatever the model titles it
+            insight = mood_insight if insight_type == 'mood_analysis' else by_key.get((insight_type, title.casefold()))
+            if insight is None:
+                to_create.append(UserInsight(user=user, title=title, content=content, insight_type=insight_type))
+            elif insight.id not in to_update:
+                insight.title, insight.content, insight.updated_at = title, content, now
+                to_update[insight.id] = insight
+
+        retire = {str(title).casefold() for title in data.get('retire') or []}
+        retired_ids = [
+            insight.id for insight in existing
+            if insight.title.casefold() in retire and insight.id not in to_update
+        ]
+
+        with transaction.atomic():
+            UserInsight.objects.bulk_create(to_create)
+            UserInsight.objects.bulk_update(to_update.values(), ['title', 'content', 'updated_at'])
+            if retired_ids:
+                UserInsight.objects.filter(id__in=retired_ids).delete()
 
-            # Prepare entry data
-            entry_data = "\n\n".join([
-                f"Entry {i+1}:\nTitle: {entry.title}\nDate: {entry.created_at.strftime('%Y-%m-%d')}\nContent: {entry.content[:500]}..."
-                for i, entry in enumerate(entries[:30])  # Limit to 30 entries to avoid token limits
-            ])
+            state.summary = data.get('summary') or state.summary
+            state.themes = (data.get('themes') or state.themes)[:INSIGHT_THEME_LIMIT]
+            state.mood_trajectory = (state.mood_trajectory + [AIService._mood_point(new_entries)])[-MOOD_TRAJECTORY_POINTS:]
+            state.last_entry_id = max(entry.id for entry in new_entries)
+            state.last_entry_at = max(entry.created_at for entry in new_entries)
+            state.entries_analyzed += len(new_entries)
+            state.save()
+
+        result.update(created=len(to_create), updated=len(to_update), retired=len(retired_ids))
+        return result
+
+    @staticmethod
+    def generate_biography(user, time_period_start=None, time_period_end=None):
+        """Generate a biography based on a user's diary entries"""
+        try:
+            Biography = apps.get_model('diary', 'Biography')
 
             period_description = ""
             if time_period_start and time_period_end:
                 period_description = f"from {time_period_start.strftime('%B %Y')} to {time_period_end.strftime('%B %Y')}"
 
-            prompt = f"""
-            Write a cohesive, first-person biography based on these diary entries {period_description}.
+            instructions = f"""
+            Write it as a cohesive, first-person biography {period_description}.
             Craft a narrative that captures the person's experiences, growth, and significant events.
-            Use a personal, reflective tone as if the person is telling their own life story.
-
-            {entry_data}
-
-            Write the biography as a thoughtful, introspective personal narrative with natural transitions
-            between events and themes. Use the first person perspective. Make it emotionally resonant and
+            Use a personal, reflective tone as if the person is telling their own life story,
+            with natural transitions between events and themes. Make it emotionally resonant and
             capture the person's voice based on their diary entries.
 
             The biography should be divided into clear paragraphs and should be around 500-800 words.
             """
 
-            biography_content = AIService._get_groq_response(prompt)
+            # Quarter summaries are cached, so only changed periods reach the API again
+            started = time.time()
+            with track_usage() as usage:
+                result = BiographyService.build(user, time_period_start, time_period_end, instructions=instructions)
+            if result is None:
+                return None
+            biography_content = result['content']
+            AIService._log_generation(
+                user, 'biography', result['prompt'], biography_content, time.time() - started, result['metadata'],
+                usage=usage
+            )
 
             # Create or update biography
             biography, created = Biography.objects.update_or_create(
@@ -269,16 +632,18 @@ class AIService:
         from django.utils import timezone
         import time
         import json
-        import requests
         from django.conf import settings
         from requests.exceptions import RequestException
         import logging
 
         logger = logging.getLogger(__name__)
 
-        Entry = apps.get_model('diary', 'Entry')
-        UserInsight = apps.get_model('diary', 'UserInsight')
-        Biography = apps.get_model('diary', 'Biography')
+        # Biography and LifeChapter are optional; without them the text is only returned
+        try:
+            Biography = apps.get_model('diary', 'Biography')
+            has_biography = True
+        except LookupError:
+            has_biography = False
 
         # Try to get LifeChapter if it exists
         try:
@@ -291,43 +656,6 @@ class AIService:
         logger.info(f"Biography generation {request_id} started for user {user.username}")
 
         try:
-            # Get all entries for this user
-            entries = Entry.objects.filter(user=user).order_by('-created_at')
-
-            if not entries:
-                logger.warning(f"No journal entries found for user {user.username}")
-                return "Add more journal entries to generate your biography. Your life story will be crafted based on your journaling history."
-
-            # Get entry content samples (limit to prevent token overflow)
-            entry_samples = []
-            for entry in entries[:20]:  # Use up to 20 most recent entries
-                entry_sample = {
-                    'date': entry.created_at.strftime('%Y-%m-%d'),
-                    'title': entry.title,
-                    'content': entry.content[:300] + "..." if len(entry.content) > 300 else entry.content,
-                }
-
-                # Add mood if it exists
-                if hasattr(entry, 'mood') and entry.mood:
-                    entry_sample['mood'] = entry.mood
-
-                # Add tags if they exist
-                if hasattr(entry, 'tags'):
-                    try:
-                        entry_sample['tags'] = ", ".join([tag.name for tag in entry.tags.all()])
-                    except:
-                        pass
-
-                entry_samples.append(entry_sample)
-
-            # Get user insights if available
-            insights = UserInsight.objects.filter(user=user)
-            insight_texts = [f"{insight.title}: {insight.content}" for insight in insights]
-
-            # Format entries and insights as context for the API
-            entries_text = json.dumps(entry_samples, indent=2)
-            insights_text = "\n".join(insight_texts) if insight_texts else "No insights available yet."
-
             # Determine which chapter to generate
             chapter_content = ""
             if chapter and has_life_chapters:
@@ -358,68 +686,37 @@ class AIService:
                 This should be a cohesive section focusing specifically on this area of the user's life.
                 """
 
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {settings.GROK_API_KEY}',
-                'X-Request-ID': str(request_id)
-            }
-
-            prompt = f"""
-            Generate a thoughtful, biographical narrative based on the user's journal entries.
-
-            USER'S JOURNAL ENTRIES (sample):
-            {entries_text}
-
-            USER'S INSIGHTS:
-            {insights_text}
-
+            instructions = f"""
             {chapter_content}
 
             Guidelines:
             1. Write in third person, as if this is a biography about the person's life
             2. Maintain a respectful, reflective tone
-            3. Extract themes, patterns, and significant events from their entries
+            3. Extract themes, patterns, and significant events from the summaries
             4. Create a coherent narrative that captures their personality and experiences
-            5. Avoid inventing major life events not supported by the entries
-            6. Use elegant, thoughtful language appropriate for a biographical work
-            7. Organize content into meaningful paragraphs with good flow
-            8. Length should be approximately 800-1200 words
+            5. Use elegant, thoughtful language appropriate for a biographical work
+            6. Organize content into meaningful paragraphs with good flow
+            7. Length should be approximately 800-1200 words
             """
 
-            payload = {
-                'model': 'llama3-70b-8192',
-                'messages': [
-                    {'role': 'system', 'content': 'You are a skilled biographer who creates compelling life narratives based on journal entries.'},
-                    {'role': 'user', 'content': prompt}
-                ],
-                'temperature': 0.7,
-                'max_tokens': 1500
-            }
+            # Map-reduce over quarter summaries; a full biography comes back split into chapters
+            started = time.time()
+            with track_usage() as usage:
+                result = BiographyService.build(
+                    user, instructions=instructions, with_chapters=not chapter, max_tokens=2000
+                )
+            if result is None:
+                logger.warning(f"No journal entries found for user {user.username}")
+                return "Add more journal entries to generate your biography. Your life story will be crafted based on your journaling history."
 
-            start_time = time.time()
-            response = requests.post(
-                'https://api.groq.com/openai/v1/chat/completions',
-                headers=headers,
-                json=payload,
-                timeout=30  # Biography generation needs more time
+            biography_content = result['content']
+            AIService._log_generation(
+                user, 'biography', result['prompt'], biography_content, time.time() - started, result['metadata'],
+                usage=usage
             )
-            api_time = time.time() - start_time
 
-            logger.info(f"Biography generation {request_id} completed in {api_time:.2f}s with status {response.status_code}")
-
-            if response.status_code != 200:
-                logger.error(f"Biography generation {request_id} failed: {response.status_code} - {response.text}")
-                raise RequestException(f"API returned status code {response.status_code}")
-
-            response_data = response.json()
-
-            # Validate response structure
-            if 'choices' not in response_data or not response_data['choices']:
-                error_msg = f"Invalid API response structure: {response_data}"
-                logger.error(f"Biography generation {request_id}: {error_msg}")
-                raise ValueError(error_msg)
-
-            biography_content = response_data['choices'][0]['message']['content']
+            if not has_biography:
+                return biography_content
 
             # Store the generated biography or chapter
             if chapter:
@@ -458,35 +755,17 @@ class AIService:
                         time_period_end=timezone.now().date()
                     )
 
-                biography.content = biography_content
-                biography.save()
-
-                # Auto-classify biography into chapters
-                auto_chapters = AIService._auto_classify_biography_into_chapters(biography_content, user)
-
-                # If we already have chapters_data, merge with new data
-                if biography.chapters_data:
-                    chapters_data = biography.chapters_data
-                    for key, value in auto_chapters.items():
-                        chapters_data[key] = value
-                else:
-                    chapters_data = auto_chapters
+                # Chapters come from the reduce step; merge with existing chapters_data
+                chapters_data = biography.chapters_data or {}
+                chapters_data.update(result['chapters'])
 
+                biography.content = biography_content
                 biography.chapters_data = chapters_data
                 biography.save()
 
-                # If we have LifeChapter model and no chapters exist, create default ones based on the auto-classification
+                # If we have LifeChapter model and no chapters exist, create default ones based on the reduce step
                 if has_life_chapters and not LifeChapter.objects.filter(user=user).exists():
-                    standard_chapters = {
-                        "childhood": "Childhood",
-                        "education": "Education",
-                        "career": "Career",
-                        "relationships": "Relationships",
-                        "personal_growth": "Personal Growth",
-                        "recent_years": "Recent Years"
-                    }
-
-                    for key, title in standard_chapters.items():
+                    for key, title in STANDARD_CHAPTERS.items():
                         if key in chapters_data and chapters_data[key].get('content'):
                             # Create the chapter if it has content
                             LifeChapter.objects.create(
@@ -498,6 +777,8 @@ class AIService:
 
                 return biography_content
 
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Biography generation {request_id} error: {str(e)}", exc_info=True)
             if chapter:
@@ -505,158 +786,6 @@ class AIService:
             else:
                 return "Unable to generate your biography at this time. Please try again later."
 
-    @staticmethod
-    def _auto_classify_biography_into_chapters(biography_content, user):
-        """
-        Automatically classify a biography into standard chapters.
-        This uses AI to identify and separate content into appropriate life chapters.
-        """
-        # Import models here to avoid circular imports
-        from django.apps import apps
-        from django.utils import timezone
-        import json
-        import re
-        import time
-        import requests
-        from django.conf import settings
-
-        request_id = int(time.time() * 1000)
-        logger.info(f"Auto-classification {request_id} started for user {user.username}")
-
-        try:
-            # Standard chapter categories
-            standard_chapters = [
-                "Childhood",
-                "Education",
-                "Career",
-                "Relationships",
-                "Personal Growth",
-                "Recent Years"
-            ]
-
-            # Create prompt for classification
-            classification_prompt = f"""
-            I have a biography text that needs to be separated into the following chapters:
-
-            {', '.join(standard_chapters)}
-
-            Please read the biography and extract content relevant to each chapter.
-            For each chapter, return only the content that belongs to that specific chapter.
-
-            Format the response as JSON with the following structure:
-            {{
-                "childhood": {{ "content": "extracted content for childhood chapter here" }},
-                "education": {{ "content": "extracted content for education chapter here" }},
-                "career": {{ "content": "extracted content for career chapter here" }},
-                "relationships": {{ "content": "extracted content for relationships chapter here" }},
-                "personal_growth": {{ "content": "extracted content for personal growth chapter here" }},
-                "recent_years": {{ "content": "extracted content for recent years chapter here" }}
-            }}
-
-            Here is the biography to classify:
-
-            {biography_content}
-            """
-
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {settings.GROK_API_KEY}',
-                'X-Request-ID': str(request_id)
-            }
-
-            payload = {
-                'model': 'llama3-70b-8192',
-                'messages': [
-                    {'role': 'system', 'content': 'You are an expert at analyzing and organizing biographies into thematic chapters.'},
-                    {'role': 'user', 'content': classification_prompt}
-                ],
-                'temperature': 0.3,  # Lower temperature for more deterministic output
-                'max_tokens': 1500
-            }
-
-            start_time = time.time()
-            response = requests.post(
-                'https://api.groq.com/openai/v1/chat/completions',
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            api_time = time.time() - start_time
-
-            logger.info(f"Auto-classification {request_id} completed in {api_time:.2f}s with status {response.status_code}")
-
-            if response.status_code != 200:
-                logger.error(f"Auto-classification {request_id} failed: {response.status_code} - {response.text}")
-                return {}
-
-            response_data = response.json()
-
-            # Extract the JSON content from the response
-            content = response_data['choices'][0]['message']['content']
-
-            # Try to extract JSON from the response
-
-            # First try to extract JSON from code blocks
-            json_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', content)
-            if json_match:
-                json_str = json_match.group(1).strip()
-            else:
-                # If no code block, look for opening and closing braces
-                json_start = content.find('{')
-                json_end = content.rfind('}') + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_str = content[json_start:json_end]
-                else:
-                    # No JSON found
-                    logger.error(f"Auto-classification {request_id}: No JSON found in response")
-                    return {}
-
-            try:
-                chapters_data = json.loads(json_str)
-
-                # Ensure all keys are properly formatted
-                formatted_data = {}
-                for chapter in standard_chapters:
-                    key = chapter.lower().replace(' ', '_')
-                    normalized_key = key.replace('-', '_')
-
-                    # Check for various possible keys
-                    if key in chapters_data:
-                        formatted_data[key] = chapters_data[key]
-                    elif normalized_key in chapters_data:
-                        formatted_data[key] = chapters_data[normalized_key]
-                    elif chapter.lower() in chapters_data:
-                        formatted_data[key] = chapters_data[chapter.lower()]
-                    elif chapter in chapters_data:
-                        formatted_data[key] = chapters_data[chapter]
-
-                # Add timestamps to each chapter
-                current_time = timezone.now().isoformat()
-                for key in formatted_data:
-                    if isinstance(formatted_data[key], dict) and 'content' in formatted_data[key]:
-                        formatted_data[key]['last_updated'] = current_time
-                    else:
-                        # If it's not a dict with content (just text or wrong format), convert to proper format
-                        if isinstance(formatted_data[key], dict):
-                            content_value = formatted_data[key].get('content', str(formatted_data[key]))
-                        else:
-                            content_value = str(formatted_data[key])
-
-                        formatted_data[key] = {
-                            'content': content_value,
-                            'last_updated': current_time
-                        }
-
-                return formatted_data
-
-            except json.JSONDecodeError:
-                logger.error(f"Auto-classification {request_id}: JSON parsing error: {json_str}")
-                return {}
-
-        except Exception as e:
-            logger.error(f"Auto-classification {request_id} error: {str(e)}", exc_info=True)
-            return {}
-
     # ========================================================================
     # NEW METHODS FOR SMART JOURNAL COMPILER
     # ========================================================================
@@ -666,16 +795,22 @@ class AIService:
         """Generate AI-powered analysis of journal entries for compilation"""
 
         try:
-            # Prepare entry data for analysis
-            entry_data = []
-            for entry in entries[:50]:  # Limit to recent 50 entries
-                entry_data.append({
+            # Pack entries for analysis into the prompt budget
+            packed = PromptBuilder.pack_entries(
+                entries,
+                budget=settings.AI_PROMPT_BUDGETS['journal_analysis'],
+                render=lambda entry, content: json.dumps({
                     'title': entry.title,
-                    'content': entry.content[:500],  # First 500 chars
+                    'content': content,
                     'mood': entry.mood,
                     'date': entry.created_at.strftime('%Y-%m-%d'),
                     'tags': [tag.name for tag in entry.tags.all()]
-                })
+                }, indent=2),
+                max_entry_tokens=150,
+                weights={'recency': 0.2, 'mood': 0.4, 'length': 0.4},
+            )
+
+            entries_json = "[\n" + ",\n".join(packed['blocks']) + "\n]"
 
             analysis_prompt = f"""
 Analyze this collection of journal entries and provide insights about:
@@ -688,7 +823,7 @@ Analyze this collection of journal entries and provide insights about:
 6. Publication potential and market appeal
 
 Journal Entries Data:
-{json.dumps(entry_data[:10], indent=2)}
+{entries_json}
 
 Provide a comprehensive but concise analysis (300-400 words) that would help the author understand their journaling patterns and identify potential publication opportunities.
 
@@ -699,12 +834,19 @@ Focus on:
 - Potential reader appeal
 """
 
-            if user.is_authenticated:
-                response = generate_ai_content_personalized(analysis_prompt, user)
-            else:
-                response = generate_ai_content(analysis_prompt)
+            started = time.time()
+            with track_usage() as usage:
+                if user.is_authenticated:
+                    response = generate_ai_content_personalized(analysis_prompt, user)
+                else:
+                    response = generate_ai_content(analysis_prompt)
 
-            return response.get('entry', 'Analysis completed successfully')
+            analysis = response.get('entry', 'Analysis completed successfully')
+            AIService._log_generation(
+                user, 'analysis', analysis_prompt, analysis, time.time() - started,
+                PromptBuilder.usage_metadata(packed, analysis_prompt), success='error' not in response, usage=usage
+            )
+            return analysis
 
         except Exception as e:
             logger.error(f"Error generating journal analysis: {e}")
@@ -760,7 +902,7 @@ Make it compelling and marketable while staying authentic to the author's voice.
 The structure should feel natural and engaging for readers.
 """
 
-            response = AIService._get_groq_response(structure_prompt)
+            response = AIService._get_groq_response(structure_prompt, cache_as='journal_structure')
 
             # Parse AI response
             try:
@@ -771,7 +913,7 @@ The structure should feel natural and engaging for readers.
                 structure = AIService._create_fallback_structure(journal_type, analysis)
 
             # Validate and enhance structure
-            structure = AIService._validate_and_enhance_structure(structure, entries, analysis)
+            structure = AIService._validate_and_enhance_structure(structure, entries, analysis, compilation_method)
 
             return structure
 
@@ -835,7 +977,7 @@ The structure should feel natural and engaging for readers.
         return template
 
     @staticmethod
-    def _validate_and_enhance_structure(structure: Dict, entries, analysis: Dict) -> Dict:
+    def _validate_and_enhance_structure(structure: Dict, entries, analysis: Dict, compilation_method: str = 'ai') -> Dict:
         """Validate and enhance the AI-generated structure"""
 
         # Ensure required fields exist
@@ -857,21 +999,26 @@ The structure should feel natural and engaging for readers.
 
         # Assign entries to chapters
         entries_list = list(entries.order_by('created_at'))
-        entries_per_chapter = len(entries_list) // len(structure['chapters'])
 
-        for i, chapter in enumerate(structure['chapters']):
-            start_idx = i * entries_per_chapter
-            if i == len(structure['chapters']) - 1:  # Last chapter gets remaining entries
-                chapter_entries = entries_list[start_idx:]
-            else:
-                end_idx = start_idx + entries_per_chapter
-                chapter_entries = entries_list[start_idx:end_idx]
+        if compilation_method in ChapterClusteringService.TIME_WEIGHTS:
+            # By theme: each entry goes to the chapter its content is closest to
+            ChapterClusteringService.assign_to_structure(structure, entries_list, compilation_method)
+        else:
+            entries_per_chapter = len(entries_list) // len(structure['chapters'])
+
+            for i, chapter in enumerate(structure['chapters']):
+                start_idx = i * entries_per_chapter
+                if i == len(structure['chapters']) - 1:  # Last chapter gets remaining entries
+                    chapter_entries = entries_list[start_idx:]
+                else:
+                    end_idx = start_idx + entries_per_chapter
+                    chapter_entries = entries_list[start_idx:end_idx]
 
-            chapter['entry_ids'] = [entry.id for entry in chapter_entries]
-            chapter['entry_count'] = len(chapter_entries)
+                chapter['entry_ids'] = [entry.id for entry in chapter_entries]
+                chapter['entry_count'] = len(chapter_entries)
 
         # Add metadata
-        structure['compilation_method'] = 'ai'
+        structure['compilation_method'] = compilation_method
         structure['generated_at'] = timezone.now().isoformat()
         structure['total_entries'] = len(entries)
 
@@ -897,7 +1044,7 @@ The introduction should feel like the author is personally speaking to the reade
 drawing them into this part of their journey.
 """
 
-            response = AIService._get_groq_response(intro_prompt)
+            response = AIService._get_groq_response(intro_prompt, cache_as='chapter_introduction')
             return response
 
         except Exception as e:
@@ -923,7 +1070,7 @@ Format as a numbered list with brief explanations for each question.
 Make them meaningful and actionable.
 """
 
-            response = AIService._get_groq_response(questions_prompt)
+            response = AIService._get_groq_response(questions_prompt, cache_as='reflection_questions')
             return response
 
         except Exception as e:
@@ -992,7 +1139,7 @@ Keep it insightful but accessible, helping readers see the deeper patterns
 in the author's journey.
 """
 
-            response = AIService._get_groq_response(connections_prompt)
+            response = AIService._get_groq_response(connections_prompt, cache_as='thematic_connections')
             return response
 
         except Exception as e:
@@ -1022,7 +1169,7 @@ Keep it practical and encouraging (300-400 words).
 Make it feel like helpful advice from a friend.
 """
 
-            response = AIService._get_groq_response(guide_prompt)
+            response = AIService._get_groq_response(guide_prompt, cache_as='readers_guide')
             return response
 
         except Exception as e:
@@ -1083,7 +1230,7 @@ Provide analysis on:
 Be realistic but encouraging. Focus on what makes this collection unique.
 """
 
-            response = AIService._get_groq_response(marketability_prompt)
+            response = AIService._get_groq_response(marketability_prompt, cache_as='marketability')
 
             # Extract insights (simplified - you could use more sophisticated parsing)
             return {
@@ -1125,7 +1272,7 @@ Make it engaging and authentic while highlighting the unique value.
 Focus on emotional connection and reader benefits.
 """
 
-            response = AIService._get_groq_response(marketing_prompt)
+            response = AIService._get_groq_response(marketing_prompt, cache_as='marketing_copy')
 
             return {
                 'marketing_copy': response,
@@ -1204,7 +1351,7 @@ Focus on emotional connection and reader benefits.
             return False, "Could use more detail"
 
     @staticmethod
-    def _get_groq_response(prompt, model="llama3-70b-8192", temperature=0.7, max_tokens=1000):
+    def _get_groq_response(prompt, model="llama3-70b-8192", temperature=0.7, max_tokens=1000, cache_as=None):
         """
         Get a response from the Groq API
 
@@ -1213,57 +1360,23 @@ Focus on emotional connection and reader benefits.
             model (str): The model to use (default: llama3-70b-8192)
             temperature (float): Randomness parameter (default: 0.7)
             max_tokens (int): Maximum number of tokens to generate (default: 1000)
+            cache_as (str): AI_CACHE_TTLS policy to reuse identical responses under (default: no caching)
 
         Returns:
             str: The generated text response
         """
         try:
-            import requests
-            import time
-            from django.conf import settings
-
-            request_id = int(time.time() * 1000)
-
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {settings.GROK_API_KEY}',  # Using GROK_API_KEY from settings
-                'X-Request-ID': str(request_id)
-            }
-
-            payload = {
-                'model': model,
-                'messages': [
+            return get_llm_client().chat(
+                [
                     {'role': 'system', 'content': 'You are a helpful assistant.'},
                     {'role': 'user', 'content': prompt}
                 ],
-                'temperature': temperature,
-                'max_tokens': max_tokens
-            }
-
-            start_time = time.time()
-            response = requests.post(
-                'https://api.groq.com/openai/v1/chat/completions',
-                headers=headers,
-                json=payload,
-                timeout=30
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=30,
+                cache_as=cache_as,
             )
-            api_time = time.time() - start_time
-
-            logger.info(f"Groq API request {request_id} completed in {api_time:.2f}s with status {response.status_code}")
-
-            if response.status_code != 200:
-                logger.error(f"Groq API request {request_id} failed: {response.status_code} - {response.text}")
-                raise RequestException(f"API returned status code {response.status_code}")
-
-            response_data = response.json()
-
-            # Validate response structure
-            if 'choices' not in response_data or not response_data['choices']:
-                error_msg = f"Invalid API response structure: {response_data}"
-                logger.error(f"Groq API request {request_id}: {error_msg}")
-                raise ValueError(error_msg)
-
-            return response_data['choices'][0]['message']['content']
 
         except Exception as e:
             logger.error(f"Error in _get_groq_response: {str(e)}", exc_info=True)
@@ -0,0 +1,248 @@
+import logging
+import string
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from django.utils import timezone
+
+from ..utils.analytics import get_mood_emoji, mood_to_numeric_value
+
+logger = logging.getLogger(__name__)
+
+# Word lists for the writing-style scores. Words are matched as whole
+# (lower-cased, punctuation-stripped) tokens, so inflections are listed.
+LEXICONS = {
+    'casual': ('like', 'yeah', 'really', 'kinda', 'gonna', 'wanna'),
+    'formal': ('however', 'therefore', 'consequently', 'furthermore'),
+    'emotion': (
+        'feel', 'feels', 'feeling', 'feelings', 'felt', 'amazing', 'terrible', 'excited',
+        'sad', 'happy', 'frustrated',
+    ),
+}
+PUNCTUATION_TO_SPACE = str.maketrans({char: ' ' for char in string.punctuation + '“”‘’…'})
+ROLLING_DAYS = 7
+TREND_DAYS = 30
+
+
+class EntryAnalytics:
+    """
+    Local analytics over a set of journal entries.
+
+    Entries are tokenized once into per-entry NumPy arrays: word counts,
+    total word length, a boolean matrix of lexicon hits, mood codes and
+    timestamps. Distributions, trends,
+    rolling averages and writing-style scores are then single vectorized
+    passes over those arrays, so the insights page, the fallback insights
+    and AI prompt pre-analysis share one scan of the text.
+    """
+
+    def __init__(self, texts: List[str], moods: List[Optional[str]],
+                 timestamps: Optional[List] = None):
+        self.size = len(texts)
+
+        # Mood codes: index into self.mood_names, -1 for no mood
+        self.mood_names, codes = np.unique(np.array([mood or '' for mood in moods], dtype=str), return_inverse=True)
+        self.mood_codes = codes.astype(np.int64)
+        if self.size and self.mood_names[0] == '':
+            self.mood_names = self.mood_names[1:]
+            self.mood_codes -= 1
+        self.mood_values = np.array([mood_to_numeric_value(name) for name in self.mood_names], dtype=np.float64)
+
+        # Epoch seconds, NaN when unknown
+        timestamps = timestamps or [None] * self.size
+        self.timestamps = np.array(
+            [moment.timestamp() if moment else np.nan for moment in timestamps], dtype=np.float64
+        )
+
+        # One pass over the text. Per entry: word count, total word length and
+        # which lexicon terms occur (set intersection after punctuation is
+        # blanked out); everything after this works on the arrays.
+        self.terms = sorted({term for terms in LEXICONS.values() for term in terms})
+        term_index = {term: column for column, term in enumerate(self.terms)}
+        self.word_counts = np.zeros(self.size, dtype=np.int64)
+        self.word_chars = np.zeros(self.size, dtype=np.int64)
+        self.term_hits = np.zeros((self.size, len(self.terms)), dtype=bool)
+        hit_rows, hit_columns = [], []
+        for row, text in enumerate(texts):
+            lowered = (text or '').lower()
+            words = lowered.split()
+            self.word_counts[row] = len(words)
+            self.word_chars[row] = len(''.join(words))
+            for term in term_index.keys() & lowered.translate(PUNCTUATION_TO_SPACE).split():
+                hit_rows.append(row)
+                hit_columns.append(term_index[term])
+        self.term_hits[hit_rows, hit_columns] = True
+        self.lexicon_columns = {
+            name: np.array([term_index[term] for term in terms]) for name, terms in LEXICONS.items()
+        }
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_entries(cls, entries: Iterable) -> 'EntryAnalytics':
+        """From Entry objects (anything with content, mood and created_at)"""
+        entries = list(entries)
+        return cls(
+            [entry.content for entry in entries],
+            [entry.mood for entry in entries],
+            [entry.created_at for entry in entries],
+        )
+
+    @classmethod
+    def from_queryset(cls, entries, with_text: bool = True) -> 'EntryAnalytics':
+        """
+        From an Entry queryset, reading only the analysed columns in one
+        query. Without text only mood and time analytics are meaningful.
+        """
+        fields = ('content', 'mood', 'created_at') if with_text else ('mood', 'created_at')
+        rows = list(entries.order_by().values_list(*fields).iterator(chunk_size=2000))
+        if not with_text:
+            rows = [('',) + row for row in rows]
+        if not rows:
+            return cls([], [], [])
+        texts, moods, timestamps = (list(column) for column in zip(*rows))
+        return cls(texts, moods, timestamps)
+
+    @classmethod
+    def from_texts(cls, texts: List[str]) -> 'EntryAnalytics':
+        return cls(texts, [None] * len(texts))
+
+    # ------------------------------------------------------------------
+    # Moods
+    # ------------------------------------------------------------------
+
+    def mood_counts(self, mask=None) -> np.ndarray:
+        codes = self.mood_codes if mask is None else self.mood_codes[mask]
+        return np.bincount(codes[codes >= 0], minlength=len(self.mood_names))
+
+    def mood_distribution(self, mask=None) -> List[Dict]:
+        """Moods by frequency with their share of mood-tagged entries"""
+        counts = self.mood_counts(mask)
+        total = counts.sum()
+        if not total:
+            return []
+        # Most common first; ties keep first-seen order like Counter.most_common
+        first_seen = np.full(len(self.mood_names), self.size)
+        np.minimum.at(first_seen, self.mood_codes[self.mood_codes >= 0], np.flatnonzero(self.mood_codes >= 0))
+        order = np.lexsort((first_seen, -counts))
+        return [
+            {
+                'name': str(self.mood_names[code]),
+                'count': int(counts[code]),
+                'percentage': round(counts[code] / total * 100),
+                'emoji': get_mood_emoji(str(self.mood_names[code])),
+            }
+            for code in order if counts[code]
+        ]
+
+    def mood_scores(self) -> np.ndarray:
+        """Per-entry mood on the 1-10 chart scale (5 when no mood is set)"""
+        scores = np.full(self.size, 5.0)
+        tagged = self.mood_codes >= 0
+        scores[tagged] = self.mood_values[self.mood_codes[tagged]]
+        return scores
+
+    def mood_trends(self, days: int = TREND_DAYS, rolling_days: int = ROLLING_DAYS, now=None) -> List[Dict]:
+        """
+        Chart points for entries of the last `days` days, oldest first, each
+        with the mood and the rolling average over the preceding
+        `rolling_days` days.
+        """
+        now = (now or timezone.now()).timestamp()
+        recent = np.flatnonzero(self.timestamps >= now - days * 86400)
+        if not recent.size:
+            return []
+        recent = recent[np.argsort(self.timestamps[recent], kind='stable')]
+        times, scores = self.timestamps[recent], self.mood_scores()[recent]
+
+        # Rolling window by time: prefix sums over the sorted points
+        prefix = np.concatenate(([0.0], np.cumsum(scores)))
+        start = np.searchsorted(times, times - rolling_days * 86400, side='left')
+        end = np.arange(1, len(times) + 1)
+        averages = (prefix[end] - prefix[start]) / (end - start)
+
+        tz = timezone.get_current_timezone()
+        return [
+            {
+                'date': datetime.fromtimestamp(moment, tz).strftime('%Y-%m-%d'),
+                'mood': int(score) if score.is_integer() else float(score),
+                'average': round(float(average), 2),
+            }
+            for moment, score, average in zip(times, scores, averages)
+        ]
+
+    def mood_slope(self, days: int = TREND_DAYS, now=None) -> Optional[float]:
+        """Least-squares change in mood per week over the last `days` days"""
+        now = (now or timezone.now()).timestamp()
+        recent = (self.timestamps >= now - days * 86400) & (self.mood_codes >= 0)
+        if recent.sum() < 3 or np.ptp(self.timestamps[recent]) == 0:
+            return None
+        weeks = (self.timestamps[recent] - now) / (7 * 86400)
+        return round(float(np.polyfit(weeks, self.mood_scores()[recent], 1)[0]), 2)
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def total_words(self, mask=None) -> int:
+        return int(self.word_counts.sum() if mask is None else self.word_counts[mask].sum())
+
+    def average_words(self, mask=None) -> float:
+        counts = self.word_counts if mask is None else self.word_counts[mask]
+        return float(counts.mean()) if counts.size else 0.0
+
+    def recent_mask(self, count: int) -> np.ndarray:
+        """The `count` newest entries (by timestamp)"""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[np.argsort(-np.nan_to_num(self.timestamps, nan=-np.inf), kind='stable')[:count]] = True
+        return mask
+
+    def lexicon_presence(self, name: str, mask=None) -> int:
+        """How many distinct words of a lexicon appear in the (selected) text"""
+        hits = self.term_hits if mask is None else self.term_hits[mask]
+        return int(hits[:, self.lexicon_columns[name]].any(axis=0).sum())
+
+    def tone(self, mask=None) -> str:
+        casual = self.lexicon_presence('casual', mask)
+        formal = self.lexicon_presence('formal', mask)
+        if casual > formal:
+            return 'casual'
+        if formal > casual:
+            return 'formal'
+        return 'balanced'
+
+    def emotion_level(self, mask=None) -> str:
+        emotion = self.lexicon_presence('emotion', mask)
+        if emotion > 3:
+            return 'emotionally expressive'
+        if emotion > 1:
+            return 'moderately emotional'
+        return 'reserved'
+
+    def average_word_length(self, mask=None) -> float:
+        words = self.total_words(mask)
+        chars = self.word_chars.sum() if mask is None else self.word_chars[mask].sum()
+        return float(chars / words) if words else 0.0
+
+    def complexity(self, mask=None) -> str:
+        return 'complex vocabulary' if self.average_word_length(mask) > 5 else 'simple vocabulary'
+
+    # ------------------------------------------------------------------
+    # Prompt pre-analysis
+    # ------------------------------------------------------------------
+
+    def prompt_summary(self, now=None) -> Dict:
+        """Compact local analysis to send along with entries in AI prompts"""
+        return {
+            'entries': self.size,
+            'avg_words': round(self.average_words()),
+            'moods': {item['name']: item['count'] for item in self.mood_distribution()[:5]},
+            'mood_change_per_week': self.mood_slope(now=now),
+            'tone': self.tone(),
+            'emotion_level': self.emotion_level(),
+            'complexity': self.complexity(),
+        }
@@ -0,0 +1,341 @@
+import contextvars
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .ai_cache import AIResponseCache
+from .llm_client import get_llm_client
+from .prompt_builder import PromptBuilder, estimate_tokens
+from .rate_limiter import RateLimitExceeded
+
+logger = logging.getLogger(__name__)
+
+# Bump when the map prompts change so cached summaries are rebuilt
+SUMMARY_VERSION = 1
+SUMMARY_CACHE_KEY = "biography_summary_v{version}_{digest}"
+QUARTER_FIELDS = ('id', 'title', 'content', 'created_at', 'mood', 'mood_rating')
+# Consecutive summaries merged per condense call when the reduce prompt would be too long
+CONDENSE_GROUP = 4
+
+STANDARD_CHAPTERS = OrderedDict([
+    ('childhood', 'Childhood'),
+    ('education', 'Education'),
+    ('career', 'Career'),
+    ('relationships', 'Relationships'),
+    ('personal_growth', 'Personal Growth'),
+    ('recent_years', 'Recent Years'),
+])
+
+
+class BiographyService:
+    """
+    Map-reduce biography generation.
+
+    Map: a user's entries are grouped by calendar quarter and each quarter is
+    summarized on its own, in parallel on a bounded thread pool. Summaries
+    are cached under a hash of the quarter's entries, so after a new or
+    edited entry only that quarter is summarized again.
+
+    Reduce: the quarter summaries, oldest first, are written into the
+    biography (and its chapters) in one final call. When a long history
+    does not fit the reduce budget, runs of summaries are first condensed
+    into longer periods, which are cached the same way.
+    """
+
+    # ------------------------------------------------------------------
+    # Grouping and cache keys
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def quarter_of(moment) -> str:
+        moment = timezone.localtime(moment) if timezone.is_aware(moment) else moment
+        return f"{moment.year}-Q{(moment.month - 1) // 3 + 1}"
+
+    @staticmethod
+    def group_by_quarter(entries) -> "OrderedDict[str, list]":
+        """Entries (oldest first) grouped by quarter label, in order"""
+        quarters = OrderedDict()
+        for entry in entries:
+            quarters.setdefault(BiographyService.quarter_of(entry.created_at), []).append(entry)
+        return quarters
+
+    @staticmethod
+    def _digest(kind: str, parts) -> str:
+        canonical = json.dumps([kind, parts], separators=(',', ':'), ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def quarter_key(label: str, entries) -> str:
+        """Cache key from the content of a quarter's entries"""
+        digest = BiographyService._digest(label, [
+            [entry.id, entry.title, entry.content, entry.mood, entry.mood_rating] for entry in entries
+        ])
+        return SUMMARY_CACHE_KEY.format(version=SUMMARY_VERSION, digest=digest)
+
+    @staticmethod
+    def period_key(label: str, summaries: List[Tuple[str, str]]) -> str:
+        digest = BiographyService._digest(label, summaries)
+        return SUMMARY_CACHE_KEY.format(version=SUMMARY_VERSION, digest=digest)
+
+    # ------------------------------------------------------------------
+    # Map
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _summarize(prompt: str, label: str) -> str:
+        return get_llm_client().chat(
+            [
+                {'role': 'system', 'content': 'You help a biographer by condensing journals into factual period summaries.'},
+                {'role': 'user', 'content': prompt},
+            ],
+            temperature=0.3,
+            max_tokens=350,
+            timeout=30,
+            request_id=f"{int(time.time() * 1000)}-{label}",
+            label='Biography summary',
+        )
+
+    @staticmethod
+    def summarize_quarter(label: str, entries) -> str:
+        packed = PromptBuilder.pack_entries(
+            entries,
+            budget=settings.AI_PROMPT_BUDGETS['biography_quarter'],
+            render=lambda entry, content: (
+                f"Date: {entry.created_at.strftime('%Y-%m-%d')}\nTitle: {entry.title}\nContent: {content}"
+            ),
+            max_entry_tokens=160,
+            weights={'recency': 0.1, 'mood': 0.45, 'length': 0.45},
+        )
+        entry_data = "\n\n".join(packed['blocks'])
+        prompt = f"""
+        These are {len(entries)} journal entries from {label} (the most telling shown).
+
+        {entry_data}
+
+        Summarize this period of the writer's life in 120-200 words: key events, people,
+        places, feelings, decisions and changes. Use only what the entries say.
+        Write plain prose in the third person, without a heading.
+        """
+        return BiographyService._summarize(prompt, label)
+
+    @staticmethod
+    def condense(label: str, summaries: List[Tuple[str, str]]) -> str:
+        periods = "\n\n".join(f"{period}:\n{text}" for period, text in summaries)
+        prompt = f"""
+        These are summaries of consecutive periods of a person's life, covering {label}.
+
+        {periods}
+
+        Merge them into one summary of 150-250 words that keeps the most significant events,
+        people and changes in order. Write plain prose in the third person, without a heading.
+        """
+        return BiographyService._summarize(prompt, label)
+
+    @staticmethod
+    def _run_cached(jobs: List[Tuple[str, str, Callable[[], str]]], stats: Dict) -> Dict[str, str]:
+        """
+        Run (label, cache_key, compute) jobs, answering from the cache where
+        possible and computing the rest in parallel. Failed jobs are left out.
+        """
+        try:
+            cached = cache.get_many([key for _, key, _ in jobs])
+        except Exception as e:
+            logger.warning(f"Biography summary cache unavailable: {e}")
+            cached = {}
+
+        results = {label: cached[key] for label, key, _ in jobs if key in cached}
+        missing = [(label, key, compute) for label, key, compute in jobs if key not in cached]
+        stats['cached'] += len(results)
+        if not missing:
+            return results
+
+        workers = min(settings.AI_BIOGRAPHY_MAP_WORKERS, len(missing))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='biography-map') as pool:
+            # Each job runs in a copy of the caller's context so track_usage() sees its API calls
+            futures = [(label, key, pool.submit(contextvars.copy_context().run, compute)) for label, key, compute in missing]
+
+        fresh = {}
+        deferred = None
+        for label, key, future in futures:
+            try:
+                results[label] = fresh[key] = future.result()
+                stats['computed'] += 1
+            except RateLimitExceeded as e:
+                deferred = e
+                stats['failed'] += 1
+            except Exception as e:
+                logger.error(f"Biography summary for {label} failed: {e}")
+                stats['failed'] += 1
+        if fresh:
+            try:
+                cache.set_many(fresh, AIResponseCache.ttl_for('biography_summary'))
+            except Exception as e:
+                logger.warning(f"Could not cache biography summaries: {e}")
+        if deferred:
+            # Finished summaries are cached; a rescheduled run only redoes the rest
+            raise deferred
+        return results
+
+    @staticmethod
+    def map_quarters(entries, stats: Dict) -> List[Tuple[str, str]]:
+        """(quarter, summary) pairs in order, using cached summaries of unchanged quarters"""
+        quarters = BiographyService.group_by_quarter(entries)
+        stats['quarters'] = len(quarters)
+        jobs = [
+            (label, BiographyService.quarter_key(label, quarter_entries),
+             lambda label=label, quarter_entries=quarter_entries: BiographyService.summarize_quarter(label, quarter_entries))
+            for label, quarter_entries in quarters.items()
+        ]
+        results = BiographyService._run_cached(jobs, stats)
+        return [(label, results[label]) for label in quarters if label in results]
+
+    @staticmethod
+    def fit_budget(summaries: List[Tuple[str, str]], budget: int, stats: Dict) -> List[Tuple[str, str]]:
+        """Condense runs of summaries until all of them fit the reduce budget"""
+        while len(summaries) > 1 and sum(estimate_tokens(f"{p}: {t}") for p, t in summaries) > budget:
+            groups = [summaries[i:i + CONDENSE_GROUP] for i in range(0, len(summaries), CONDENSE_GROUP)]
+            jobs = []
+            for group in groups:
+                label = group[0][0] if len(group) == 1 else f"{group[0][0].split(' to ')[0]} to {group[-1][0].split(' to ')[-1]}"
+                jobs.append((label, BiographyService.period_key(label, group),
+                             lambda label=label, group=group: BiographyService.condense(label, group)))
+            results = BiographyService._run_cached(jobs, stats)
+            condensed = [(label, results[label]) for label, _, _ in jobs if label in results]
+            if not condensed:
+                break
+            summaries = condensed
+            stats['condense_rounds'] += 1
+        return summaries
+
+    # ------------------------------------------------------------------
+    # Reduce
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def parse_chapters(content: str) -> Dict[str, Dict]:
+        """Chapter texts from the reduce response, in chapters_data format"""
+        start, end = content.find('{'), content.rfind('}') + 1
+        if start < 0 or end <= start:
+            return {}
+        try:
+            data = json.loads(content[start:end])
+        except json.JSONDecodeError:
+            return {}
+        chapters = data.get('chapters', data) if isinstance(data, dict) else {}
+        if not isinstance(chapters, dict):
+            return {}
+
+        now = timezone.now().isoformat()
+        result = OrderedDict()
+        for key, title in STANDARD_CHAPTERS.items():
+            text = chapters.get(key) or chapters.get(title) or chapters.get(title.lower())
+            if isinstance(text, dict):
+                text = text.get('content')
+            if text and str(text).strip():
+                result[key] = {'title': title, 'content': str(text).strip(), 'last_updated': now}
+        return result
+
+    @staticmethod
+    def build(user, start=None, end=None, instructions: str = '', with_chapters: bool = False,
+              max_tokens: int = 1500) -> Optional[Dict]:
+        """
+        Run the pipeline for a user's entries between start and end (dates).
+
+        Args:
+            instructions: How to write the biography (voice, focus, length)
+            with_chapters: Ask for the biography split into STANDARD_CHAPTERS
+            max_tokens: Output allowance of the reduce call
+
+        Returns:
+            dict: content, chapters, prompt, metadata - or None without entries
+        """
+        Entry = apps.get_model('diary', 'Entry')
+        UserInsight = apps.get_model('diary', 'UserInsight')
+
+        entries = Entry.objects.filter(user=user)
+        if start:
+            entries = entries.filter(created_at__date__gte=start)
+        if end:
+            entries = entries.filter(created_at__date__lte=end)
+        entries = list(entries.order_by('created_at', 'id').only(*QUARTER_FIELDS))
+        if not entries:
+            return None
+
+        started = time.time()
+        stats = {'entries': len(entries), 'quarters': 0, 'cached': 0, 'computed': 0, 'failed': 0, 'condense_rounds': 0}
+        summaries = BiographyService.map_quarters(entries, stats)
+        if not summaries:
+            raise ValueError("No quarter of the journal could be summarized")
+        summaries = BiographyService.fit_budget(summaries, settings.AI_PROMPT_BUDGETS['biography_reduce'], stats)
+
+        insights = "\n".join(
+            f"{title}: {content}" for title, content in
+            UserInsight.objects.filter(user=user).values_list('title', 'content')[:10]
+        ) or "No insights available yet."
+        periods = "\n\n".join(f"{period}:\n{text}" for period, text in summaries)
+
+        chapter_format = json.dumps({'chapters': {key: f"{title} chapter text" for key, title in STANDARD_CHAPTERS.items()}})
+        chapter_output = f"""
+            Write the biography as chapters and respond with JSON only, in this format:
+            {chapter_format}
+            Each value is that chapter's part of the narrative in paragraphs; use "" for a
+            chapter the journal says nothing about. Read in order, the chapters form the whole biography.
+            """
+
+        def reduce(output):
+            prompt = f"""
+            Write a biography from these summaries of a person's journal, in chronological order.
+
+            PERIOD SUMMARIES:
+            {periods}
+
+            USER'S INSIGHTS:
+            {insights}
+
+            {instructions}
+
+            Avoid inventing major life events the summaries do not support.
+            {output}
+            """
+            content = get_llm_client().chat(
+                [
+                    {'role': 'system', 'content': 'You are a skilled biographer who creates compelling life narratives based on journal entries.'},
+                    {'role': 'user', 'content': prompt},
+                ],
+                temperature=0.7,
+                max_tokens=max_tokens,
+                timeout=60,
+                label='Biography reduce',
+            )
+            return prompt, content
+
+        chapters = {}
+        if with_chapters:
+            prompt, content = reduce(chapter_output)
+            chapters = BiographyService.parse_chapters(content)
+            if chapters:
+                content = "\n\n".join(chapter['content'] for chapter in chapters.values())
+            else:
+                # Truncated or empty JSON must not become the biography text
+                logger.warning(f"Biography chapters for user {user.id} could not be parsed; writing plain text")
+                stats['chapter_fallback'] = True
+        if not chapters:
+            prompt, content = reduce("Respond with the biography text only.")
+
+        stats['map_reduce_time'] = round(time.time() - started, 3)
+        metadata = {
+            'prompt_tokens': estimate_tokens(prompt),
+            'periods': len(summaries),
+            **stats,
+        }
+        logger.info(f"Biography for user {user.id}: {stats}")
+        return {'content': content, 'chapters': chapters, 'prompt': prompt, 'metadata': metadata}
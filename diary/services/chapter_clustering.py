@@ -0,0 +1,228 @@
+import logging
+import math
+import time
+from collections import Counter
+from typing import Dict, List, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from .similarity_service import SimilarityService
+
+logger = logging.getLogger(__name__)
+
+
+class ChapterClusteringService:
+    """
+    Assigns compilation entries to the chapters of a journal structure.
+
+    Entries are embedded as TF-IDF vectors over title, content and tags
+    (the same tokenizer as the related-entries index) and each chapter's
+    title, description and theme become a seed vector in that space. Every
+    entry goes to its closest chapter under a capacity limit, then chapter
+    centroids are pulled towards the entries they received and the
+    assignment is repeated, so a chapter whose wording barely matches the
+    journal still collects a coherent group. All scoring is sparse/NumPy
+    matrix work; no LLM call is made.
+    """
+
+    # Most entries a chapter may take, as a multiple of an even split
+    CAPACITY_SLACK = 1.5
+    REFINE_ROUNDS = 3
+    # Share of the chapter's own wording kept in its centroid while refining
+    SEED_WEIGHT = 0.5
+    # Pull towards the chapter's place in the book by entry date. AI
+    # structures are a progression; thematic ones only use it to break ties.
+    TIME_WEIGHTS = {'ai': 0.15, 'thematic': 0.02}
+    KEYWORDS = 5
+
+    @staticmethod
+    def entry_text(entry) -> str:
+        tags = ' '.join(tag.name for tag in entry.tags.all())
+        return f"{entry.title} {entry.content} {tags}"
+
+    @staticmethod
+    def chapter_text(chapter: Dict) -> str:
+        return ' '.join(str(chapter.get(field) or '') for field in ('title', 'description', 'theme'))
+
+    # ------------------------------------------------------------------
+    # Vectors
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _normalize_rows(matrix):
+        return SimilarityService._normalize_rows(sparse.csr_matrix(matrix)).tocsr()
+
+    @staticmethod
+    def vectorize(texts: Sequence[str], seeds: Sequence[str]):
+        """
+        TF-IDF matrices for the entry texts and the seed texts, with the
+        vocabulary and IDF taken from the entries.
+
+        Returns:
+            tuple: (entry_matrix, seed_matrix, vocabulary terms)
+        """
+        vocabulary = {}
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            for term, count in Counter(SimilarityService.tokenize(text)).items():
+                rows.append(row)
+                cols.append(vocabulary.setdefault(term, len(vocabulary)))
+                # Sublinear tf so one repeated word doesn't dominate an entry
+                values.append(1.0 + math.log(count))
+
+        n_cols = max(len(vocabulary), 1)
+        entries = sparse.csr_matrix((values, (rows, cols)), shape=(len(texts), n_cols), dtype=np.float64)
+        document_frequency = np.bincount(np.asarray(cols, dtype=np.int64), minlength=n_cols)
+        idf = sparse.diags(np.log((1 + len(texts)) / (1 + document_frequency)) + 1.0)
+
+        seed_rows, seed_cols, seed_values = [], [], []
+        for row, text in enumerate(seeds):
+            for term, count in Counter(SimilarityService.tokenize(text)).items():
+                if term in vocabulary:
+                    seed_rows.append(row)
+                    seed_cols.append(vocabulary[term])
+                    seed_values.append(1.0 + math.log(count))
+        seed_matrix = sparse.csr_matrix((seed_values, (seed_rows, seed_cols)), shape=(len(seeds), n_cols),
+                                        dtype=np.float64)
+
+        normalize = ChapterClusteringService._normalize_rows
+        return normalize(entries @ idf), normalize(seed_matrix @ idf), list(vocabulary)
+
+    # ------------------------------------------------------------------
+    # Assignment
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def balanced_assign(scores: np.ndarray, capacity: int) -> np.ndarray:
+        """
+        Chapter index per entry: each entry takes its best-scoring chapter
+        that still has room. Over-full chapters keep their strongest matches
+        and the rest move on to their next choice; every round fills at least
+        one chapter, so this ends within one round per chapter.
+        """
+        n, k = scores.shape
+        assignment = np.full(n, -1, dtype=np.int64)
+        room = np.full(k, capacity, dtype=np.int64)
+        scores = scores.astype(np.float64, copy=True)
+
+        while True:
+            pending = np.flatnonzero(assignment < 0)
+            if not pending.size:
+                break
+            scores[:, room == 0] = -np.inf
+            best = np.argmax(scores[pending], axis=1)
+            for chapter in np.unique(best):
+                candidates = pending[best == chapter]
+                if candidates.size > room[chapter]:
+                    strongest = np.argsort(-scores[candidates, chapter], kind='stable')[:room[chapter]]
+                    candidates = candidates[strongest]
+                assignment[candidates] = chapter
+                room[chapter] -= candidates.size
+        return assignment
+
+    @staticmethod
+    def assign(entries, chapters: List[Dict], method: str = 'ai') -> np.ndarray:
+        """Chapter index for each entry (entries ordered oldest first)"""
+        matrix, seeds, _ = ChapterClusteringService.vectorize(
+            [ChapterClusteringService.entry_text(entry) for entry in entries],
+            [ChapterClusteringService.chapter_text(chapter) for chapter in chapters],
+        )
+        return ChapterClusteringService.assign_vectors(matrix, seeds, method)
+
+    @staticmethod
+    def assign_vectors(matrix, seeds, method: str = 'ai') -> np.ndarray:
+        n, k = matrix.shape[0], seeds.shape[0]
+        if not n or k == 1:
+            return np.zeros(n, dtype=np.int64)
+
+        capacity = math.ceil(n / k * ChapterClusteringService.CAPACITY_SLACK)
+
+        # Position of each entry in the book against each chapter's position
+        position = np.arange(n) / max(n - 1, 1)
+        chapter_position = np.arange(k) / (k - 1)
+        time_prior = ChapterClusteringService.TIME_WEIGHTS.get(method, 0.0) * (
+            1.0 - np.abs(position[:, None] - chapter_position[None, :])
+        )
+
+        centroids = seeds
+        assignment = None
+        for _ in range(ChapterClusteringService.REFINE_ROUNDS + 1):
+            scores = (matrix @ centroids.T).toarray() + time_prior
+            updated = ChapterClusteringService.balanced_assign(scores, capacity)
+            if assignment is not None and np.array_equal(updated, assignment):
+                break
+            assignment = updated
+
+            membership = sparse.csr_matrix((np.ones(n), (assignment, np.arange(n))), shape=(k, n))
+            members = ChapterClusteringService._normalize_rows(membership @ matrix)
+            weight = ChapterClusteringService.SEED_WEIGHT
+            centroids = ChapterClusteringService._normalize_rows(weight * seeds + (1 - weight) * members)
+        return assignment
+
+    @staticmethod
+    def assign_to_structure(structure: Dict, entries, method: str = 'ai') -> Dict:
+        """Fill entry_ids, entry_count and keywords of each chapter in the structure"""
+        started = time.time()
+        entries = sorted(entries, key=lambda entry: (entry.created_at, entry.id))
+        chapters = structure['chapters']
+        matrix, seeds, terms = ChapterClusteringService.vectorize(
+            [ChapterClusteringService.entry_text(entry) for entry in entries],
+            [ChapterClusteringService.chapter_text(chapter) for chapter in chapters],
+        )
+        assignment = ChapterClusteringService.assign_vectors(matrix, seeds, method)
+
+        # Keywords: terms a chapter's entries use more than the compilation as a whole
+        overall = np.asarray(matrix.mean(axis=0)).ravel() if entries else np.zeros(0)
+        for index, chapter in enumerate(chapters):
+            rows = np.flatnonzero(assignment == index)
+            chapter['entry_ids'] = [entries[row].id for row in rows]
+            chapter['entry_count'] = len(rows)
+            chapter['keywords'] = []
+            if rows.size and terms:
+                lift = np.asarray(matrix[rows].mean(axis=0)).ravel() - overall
+                top = np.argsort(-lift, kind='stable')[:ChapterClusteringService.KEYWORDS]
+                chapter['keywords'] = [terms[column] for column in top if lift[column] > 0]
+
+        logger.info(f"Clustered {len(entries)} entries into {len(chapters)} chapters in {time.time() - started:.3f}s")
+        return structure
+
+    # ------------------------------------------------------------------
+    # Local analysis
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def top_terms(texts: Sequence[str], limit: int = None) -> List[Dict]:
+        """Terms carrying the most TF-IDF weight across the texts"""
+        limit = limit or ChapterClusteringService.KEYWORDS
+        if not texts:
+            return []
+        matrix, _, terms = ChapterClusteringService.vectorize(texts, [])
+        weights = np.asarray(matrix.sum(axis=0)).ravel()
+        if not terms:
+            return []
+        top = np.argsort(-weights, kind='stable')[:limit]
+        return [{'name': terms[column], 'weight': round(float(weights[column]), 3)} for column in top if weights[column] > 0]
+
+    @staticmethod
+    def analyze(entries) -> Dict:
+        """Compilation analysis from local statistics, in the shape structure generation expects"""
+        from .analytics_engine import EntryAnalytics
+
+        entries = sorted(entries, key=lambda entry: (entry.created_at, entry.id))
+        if not entries:
+            return {'entry_count': 0, 'themes': [], 'date_range': {}, 'mood_distribution': []}
+
+        analytics = EntryAnalytics.from_entries(entries)
+        return {
+            'entry_count': len(entries),
+            'themes': ChapterClusteringService.top_terms(
+                [ChapterClusteringService.entry_text(entry) for entry in entries], limit=10
+            ),
+            'date_range': {
+                'start': entries[0].created_at.date().isoformat(),
+                'end': entries[-1].created_at.date().isoformat(),
+            },
+            'mood_distribution': analytics.mood_distribution(),
+            'total_words': analytics.total_words(),
+        }
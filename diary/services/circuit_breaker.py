@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from requests.exceptions import RequestException
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('calls', 'failures', 'slow')
+
+
+class CircuitOpenError(RequestException):
+    """Raised instead of calling a provider whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for an upstream API, with its state in the shared cache
+    so every web and Celery worker sees the same circuit.
+
+    Calls are counted in short time buckets. When the failure rate or the
+    share of slow calls over the window crosses its threshold, the circuit
+    opens and calls fail immediately with CircuitOpenError, which callers
+    already handle like any other RequestException (fallback content). After
+    the open period one worker is let through as a half-open probe: success
+    closes the circuit, failure re-opens it for twice as long (capped).
+
+    It also derives per-endpoint timeouts from the p95 latency of recent
+    successful calls in this process, so a degrading provider releases
+    workers sooner than the callers' worst-case timeouts.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.config = settings.LLM_CIRCUIT_BREAKER
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, suffix) -> str:
+        return f"circuit_{self.name}_{suffix}"
+
+    def _bucket_keys(self, counter: str, now: float):
+        size = self.config['bucket_seconds']
+        current = int(now // size)
+        count = max(1, self.config['window_seconds'] // size)
+        return [self._key(f"{counter}_{bucket}") for bucket in range(current - count + 1, current + 1)]
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    def state(self) -> str:
+        """'closed', 'open' or 'half_open'"""
+        try:
+            opened = cache.get(self._key('open'))
+        except Exception:
+            return 'closed'
+        if not opened:
+            return 'closed'
+        return 'open' if time.time() < opened['until'] else 'half_open'
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError unless a call may go out now. Returns True
+        when the call is the half-open probe.
+        """
+        try:
+            opened = cache.get(self._key('open'))
+            if not opened:
+                return False
+            if time.time() >= opened['until'] and cache.add(self._key('probe'), 1, self.config['probe_timeout']):
+                logger.info(f"Circuit {self.name} half-open: sending probe request")
+                return True
+        except Exception as e:
+            # Without the shared cache there is no circuit; let calls through
+            logger.warning(f"Circuit {self.name} state unavailable: {e}")
+            return False
+        raise CircuitOpenError(f"Circuit {self.name} is open; skipping API call")
+
+    def release_probe(self):
+        """Give up the half-open probe slot of a call that was not sent"""
+        try:
+            cache.delete(self._key('probe'))
+        except Exception as e:
+            logger.warning(f"Could not release circuit {self.name} probe: {e}")
+
+    def _trip(self, reopen: bool = False):
+        try:
+            previous = cache.get(self._key('open')) or {}
+            seconds = self.config['open_seconds']
+            if reopen and previous:
+                seconds = min(previous['seconds'] * 2, self.config['max_open_seconds'])
+            # Keep the marker past the open period so the half-open state stays visible
+            cache.set(self._key('open'), {'until': time.time() + seconds, 'seconds': seconds},
+                      seconds + self.config['max_open_seconds'])
+            cache.delete(self._key('probe'))
+            logger.warning(f"Circuit {self.name} opened for {seconds}s")
+        except Exception as e:
+            logger.warning(f"Could not open circuit {self.name}: {e}")
+
+    def _close(self):
+        try:
+            now = time.time()
+            stale = [key for counter in COUNTERS for key in self._bucket_keys(counter, now)]
+            cache.delete_many([self._key('open'), self._key('probe'), *stale])
+            logger.info(f"Circuit {self.name} closed")
+        except Exception as e:
+            logger.warning(f"Could not close circuit {self.name}: {e}")
+
+    def _count(self, counters, now: float):
+        ttl = self.config['window_seconds'] + self.config['bucket_seconds']
+        for counter in counters:
+            key = self._bucket_keys(counter, now)[-1]
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, 1, ttl)
+
+    def _should_trip(self, now: float) -> bool:
+        keys = {counter: self._bucket_keys(counter, now) for counter in COUNTERS}
+        values = cache.get_many([key for bucket_keys in keys.values() for key in bucket_keys])
+        totals = {counter: sum(values.get(key, 0) for key in bucket_keys) for counter, bucket_keys in keys.items()}
+        if totals['calls'] < self.config['min_calls']:
+            return False
+        return (totals['failures'] / totals['calls'] >= self.config['error_rate'] or
+                totals['slow'] / totals['calls'] >= self.config['slow_rate'])
+
+    def record(self, endpoint: str, latency: float, failed: bool, probe: bool = False):
+        """Account for a finished call; may open or close the circuit"""
+        slow = latency >= self.config['slow_call_seconds']
+        if not failed:
+            with self._lock:
+                self._latencies.setdefault(endpoint, deque(maxlen=200)).append(latency)
+
+        if probe:
+            if failed or slow:
+                self._trip(reopen=True)
+            else:
+                self._close()
+            return
+
+        now = time.time()
+        try:
+            self._count(['calls'] + (['failures'] if failed else []) + (['slow'] if slow else []), now)
+            if (failed or slow) and self._should_trip(now):
+                self._trip()
+        except Exception as e:
+            logger.warning(f"Circuit {self.name} bookkeeping failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Adaptive timeouts
+    # ------------------------------------------------------------------
+
+    def p95(self, endpoint: str):
+        with self._lock:
+            samples = sorted(self._latencies.get(endpoint, ()))
+        if len(samples) < self.config['timeout_min_samples']:
+            return None
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def timeout_for(self, endpoint: str, requested: float) -> float:
+        """Caller's timeout, tightened to a multiple of the endpoint's recent p95"""
+        p95 = self.p95(endpoint)
+        if p95 is None:
+            return requested
+        adaptive = max(self.config['timeout_floor'], p95 * self.config['timeout_multiplier'])
+        return min(requested, adaptive)
@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+from typing import Callable, Dict, Iterator, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('ndjson', 'zip')
+EXPORT_VERSION = 1
+ENTRY_CHUNK_SIZE = 500
+PROGRESS_EVERY = 5000  # Entries between progress writes to the export record
+COPY_BUFFER_SIZE = 64 * 1024
+
+ENTRY_FIELDS = (
+    'id', 'title', 'content', 'summary', 'mood', 'mood_rating', 'energy_level',
+    'word_count', 'created_at', 'updated_at',
+)
+INSIGHT_FIELDS = ('insight_type', 'title', 'content', 'confidence_score', 'priority', 'created_at')
+JOURNAL_FIELDS = (
+    'id', 'title', 'description', 'is_published', 'price', 'date_published',
+    'journal_type', 'compilation_method', 'created_at', 'updated_at',
+)
+
+
+class ExportService:
+    """
+    Streaming user data export.
+
+    Records are pulled from the database with server-side iteration and
+    written one NDJSON line at a time to a temporary file, which is then
+    copied to file storage in chunks, so memory use does not grow with the
+    size of the diary. The zip format adds the entry photos, copied from
+    storage into the archive one file at a time.
+    """
+
+    # ------------------------------------------------------------------
+    # Records
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def photo_archive_path(entry_id, photo_id, name) -> str:
+        return f"photos/{entry_id}/{photo_id}_{os.path.basename(name)}"
+
+    @staticmethod
+    def _entries(user, since=None):
+        Entry = apps.get_model('diary', 'Entry')
+        EntryPhoto = apps.get_model('diary', 'EntryPhoto')
+        entries = Entry.objects.filter(user=user)
+        if since is not None:
+            # Adding a photo doesn't touch the entry, so check the photos too
+            new_photos = EntryPhoto.objects.filter(entry=OuterRef('pk'), uploaded_at__gte=since)
+            entries = entries.filter(Q(updated_at__gte=since) | Exists(new_photos))
+        return entries
+
+    @staticmethod
+    def _photos(user, since=None):
+        EntryPhoto = apps.get_model('diary', 'EntryPhoto')
+        photos = EntryPhoto.objects.filter(entry__user=user)
+        if since is not None:
+            photos = photos.filter(Q(entry__updated_at__gte=since) | Q(uploaded_at__gte=since))
+        return photos
+
+    @staticmethod
+    def iter_records(user, since=None, archive=False) -> Iterator[Dict]:
+        """
+        Every exported record in order: a manifest, the entries (with tag
+        names and photo references), insights and journals. With `archive`
+        photo paths point into the zip instead of at file storage.
+        """
+        Entry = apps.get_model('diary', 'Entry')
+        EntryPhoto = apps.get_model('diary', 'EntryPhoto')
+        UserInsight = apps.get_model('diary', 'UserInsight')
+        Journal = apps.get_model('diary', 'Journal')
+
+        yield {
+            'type': 'manifest',
+            'version': EXPORT_VERSION,
+            'username': user.username,
+            'email': user.email,
+            'date_joined': user.date_joined,
+            'generated_at': timezone.now(),
+            'incremental': since is not None,
+            'since': since,
+        }
+
+        rows = ExportService._entries(user, since).order_by('created_at', 'id').values(*ENTRY_FIELDS)
+        rows = rows.iterator(chunk_size=ENTRY_CHUNK_SIZE)
+        while True:
+            chunk = list(islice(rows, ENTRY_CHUNK_SIZE))
+            if not chunk:
+                break
+            # One tag query and one photo query per chunk, without building model instances
+            entry_ids = [row['id'] for row in chunk]
+            tags, photos = defaultdict(list), defaultdict(list)
+            for entry_id, name in Entry.tags.through.objects.filter(
+                entry_id__in=entry_ids
+            ).values_list('entry_id', 'tag__name'):
+                tags[entry_id].append(name)
+            for entry_id, photo_id, name, caption, uploaded_at in EntryPhoto.objects.filter(
+                entry_id__in=entry_ids
+            ).order_by('id').values_list('entry_id', 'id', 'photo', 'caption', 'uploaded_at'):
+                photos[entry_id].append({
+                    'path': ExportService.photo_archive_path(entry_id, photo_id, name) if archive else name,
+                    'caption': caption,
+                    'uploaded_at': uploaded_at,
+                })
+
+            for row in chunk:
+                yield {'type': 'entry', **row, 'tags': tags[row['id']], 'photos': photos[row['id']]}
+
+        insights = UserInsight.objects.filter(user=user)
+        if since is not None:
+            insights = insights.filter(created_at__gte=since)
+        for values in insights.order_by('created_at').values(*INSIGHT_FIELDS).iterator(chunk_size=ENTRY_CHUNK_SIZE):
+            yield {'type': 'insight', **values}
+
+        journals = Journal.objects.filter(author=user)
+        if since is not None:
+            journals = journals.filter(updated_at__gte=since)
+        for values in journals.order_by('created_at').values(*JOURNAL_FIELDS).iterator(chunk_size=ENTRY_CHUNK_SIZE):
+            yield {'type': 'journal', **values}
+
+    @staticmethod
+    def write_records(stream, records: Iterator[Dict], progress: Optional[Callable[[Dict], None]] = None,
+                      progress_every: int = PROGRESS_EVERY) -> Dict:
+        """Write records as NDJSON to a binary stream, ending with a summary line"""
+        counts = {}
+        for record in records:
+            stream.write(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8'))
+            stream.write(b'\n')
+            counts[record['type']] = counts.get(record['type'], 0) + 1
+            if progress and record['type'] == 'entry' and counts['entry'] % progress_every == 0:
+                progress(counts)
+
+        summary = {
+            'entries': counts.get('entry', 0),
+            'photos': 0,
+            'insights': counts.get('insight', 0),
+            'journals': counts.get('journal', 0),
+        }
+        stream.write(json.dumps({'type': 'summary', **summary}).encode('utf-8') + b'\n')
+        return summary
+
+    # ------------------------------------------------------------------
+    # Writers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def write_ndjson(stream, user, since=None, progress=None, progress_every=PROGRESS_EVERY) -> Dict:
+        return ExportService.write_records(stream, ExportService.iter_records(user, since), progress, progress_every)
+
+    @staticmethod
+    def write_zip(stream, user, since=None, progress=None, progress_every=PROGRESS_EVERY) -> Dict:
+        """
+        Zip archive with export.ndjson and a photos/ folder. Members are
+        streamed in, so neither the data file nor any photo is held in memory.
+        """
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            with archive.open('export.ndjson', 'w', force_zip64=True) as data:
+                summary = ExportService.write_records(
+                    data, ExportService.iter_records(user, since, archive=True), progress, progress_every
+                )
+
+            missing = 0
+            for photo in ExportService._photos(user, since).order_by('id').iterator(chunk_size=ENTRY_CHUNK_SIZE):
+                # Images are already compressed; store them as-is
+                path = ExportService.photo_archive_path(photo.entry_id, photo.id, photo.photo.name)
+                info = zipfile.ZipInfo(path, photo.uploaded_at.timetuple()[:6])
+                info.compress_type = zipfile.ZIP_STORED
+                try:
+                    with photo.photo.open('rb') as source, archive.open(info, 'w', force_zip64=True) as target:
+                        shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+                    summary['photos'] += 1
+                except (OSError, ValueError) as e:
+                    missing += 1
+                    logger.warning(f"Skipping missing photo {photo.id} in export for user {user.id}: {e}")
+            summary['missing_photos'] = missing
+        return summary
+
+    # ------------------------------------------------------------------
+    # Export records
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def create_export(user, export_format: str = 'ndjson', incremental: bool = False):
+        """Register a queued export; incremental exports start where the last finished one did"""
+        if export_format not in FORMATS:
+            raise ValueError(f"Unsupported export format: {export_format}")
+        UserDataExport = apps.get_model('diary', 'UserDataExport')
+
+        since = None
+        if incremental:
+            previous = UserDataExport.last_completed(user)
+            since = previous.created_at if previous else None
+        return UserDataExport.objects.create(user=user, export_format=export_format, since=since)
+
+    @staticmethod
+    def run_export(export_id):
+        """Write an export to a temporary file and move it to file storage"""
+        UserDataExport = apps.get_model('diary', 'UserDataExport')
+        export = UserDataExport.objects.select_related('user').get(pk=export_id)
+        export.status = 'running'
+        export.save(update_fields=['status'])
+
+        def progress(counts):
+            UserDataExport.objects.filter(pk=export.pk).update(entry_count=counts.get('entry', 0))
+
+        writer = ExportService.write_zip if export.export_format == 'zip' else ExportService.write_ndjson
+        extension = 'zip' if export.export_format == 'zip' else 'ndjson'
+
+        try:
+            with tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR) as temporary:
+                summary = writer(temporary, export.user, export.since, progress)
+                export.size = temporary.tell()
+                temporary.seek(0)
+
+                stamp = export.created_at.strftime('%Y%m%d')
+                name = f"diaryvault-{export.user.username}-{stamp}-{export.token.hex[:8]}.{extension}"
+                export.file.save(name, File(temporary, name=name), save=False)
+        except Exception as e:
+            export.status = 'failed'
+            export.error = str(e)
+            export.save(update_fields=['status', 'error'])
+            raise
+
+        export.status = 'completed'
+        export.entry_count = summary['entries']
+        export.photo_count = summary['photos']
+        export.completed_at = timezone.now()
+        export.expires_at = export.completed_at + timedelta(days=settings.USER_EXPORT_RETENTION_DAYS)
+        export.save()
+
+        logger.info(
+            f"Exported {export.entry_count} entries ({export.size} bytes) for user {export.user_id} "
+            f"as {export.export_format}"
+        )
+        return export
+
+    @staticmethod
+    def delete_expired(now=None) -> int:
+        """Remove expired export files and their records"""
+        UserDataExport = apps.get_model('diary', 'UserDataExport')
+        now = now or timezone.now()
+        deleted = 0
+        for export in UserDataExport.objects.filter(expires_at__lt=now).iterator():
+            if export.file:
+                export.file.delete(save=False)
+            export.delete()
+            deleted += 1
+        return deleted
+
+    @staticmethod
+    def public_export(export) -> Dict:
+        """Export fields safe to return to the client"""
+        return {
+            'token': export.token.hex,
+            'format': export.export_format,
+            'status': export.status,
+            'incremental': export.is_incremental,
+            'since': export.since.isoformat() if export.since else None,
+            'size': export.size,
+            'entry_count': export.entry_count,
+            'photo_count': export.photo_count,
+            'error': export.error or None,
+            'created_at': export.created_at.isoformat(),
+            'completed_at': export.completed_at.isoformat() if export.completed_at else None,
+            'expires_at': export.expires_at.isoformat() if export.expires_at else None,
+        }
@@ -0,0 +1,154 @@
+import io
+import logging
+import os
+
+from PIL import Image, ImageOps, features
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import F, Q
+
+logger = logging.getLogger(__name__)
+
+# Models carrying ImageDerivativesMixin
+IMAGE_MODELS = ('diary.EntryPhoto', 'diary.UserProfile', 'diary.Journal')
+
+DERIVATIVE_FIELDS = {'thumbnail': 'thumbnail', 'medium': 'medium_image'}
+
+# EXIF orientations that rotate the image by 90 degrees
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class ImageService:
+    """
+    Background generation of image derivatives (thumbnail and medium) plus
+    the metadata views need: dimensions, byte size and whether the original
+    is present in storage. Results are written with a single UPDATE so no
+    save signals fire and a replaced source is never overwritten.
+    """
+
+    @staticmethod
+    def output_format():
+        """WebP where Pillow was built with it, JPEG otherwise"""
+        return 'WEBP' if features.check('webp') else 'JPEG'
+
+    @staticmethod
+    def render(image, max_side: int, fmt: str) -> bytes:
+        """Encode a copy of the image scaled to fit a max_side square"""
+        derivative = image.copy()
+        derivative.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        has_alpha = derivative.mode in ('RGBA', 'LA') or 'transparency' in derivative.info
+        if fmt == 'WEBP' and has_alpha:
+            derivative = derivative.convert('RGBA')
+        elif derivative.mode != 'RGB':
+            derivative = derivative.convert('RGB')
+
+        buffer = io.BytesIO()
+        options = {'quality': settings.IMAGE_DERIVATIVE_QUALITY}
+        if fmt == 'WEBP':
+            options['method'] = 4
+        else:
+            options.update(optimize=True, progressive=True)
+        derivative.save(buffer, fmt, **options)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _delete_derivatives(instance):
+        for field in DERIVATIVE_FIELDS.values():
+            derivative = getattr(instance, field)
+            if derivative:
+                try:
+                    derivative.delete(save=False)
+                except OSError as e:
+                    logger.warning(f"Could not delete derivative {derivative.name}: {e}")
+
+    @staticmethod
+    def _source_is(field, name):
+        if name:
+            return Q(**{field: name})
+        return Q(**{f'{field}__isnull': True}) | Q(**{field: ''})
+
+    @staticmethod
+    def generate(instance) -> bool:
+        """
+        Build derivatives for one row from its current source image. Returns
+        False when the source is missing or unreadable (recorded on the row).
+        """
+        model = type(instance)
+        source = instance.source_image
+        source_name = source.name or ''
+        updates = {
+            'image_width': None, 'image_height': None, 'image_size': None,
+            'image_available': False, 'thumbnail': '', 'medium_image': '',
+            'derivatives_source': source_name,
+        }
+        stale = [getattr(instance, field).name for field in DERIVATIVE_FIELDS.values() if getattr(instance, field)]
+
+        generated = []
+        if source_name:
+            fmt = ImageService.output_format()
+            sizes = settings.IMAGE_DERIVATIVE_SIZES
+            try:
+                with source.storage.open(source_name, 'rb') as handle:
+                    image = Image.open(handle)
+                    width, height = image.size
+                    if image.getexif().get(0x0112) in TRANSPOSED_ORIENTATIONS:
+                        width, height = height, width
+                    # Let the JPEG decoder downscale while decoding; medium is the largest output
+                    image.draft('RGB', (sizes['medium'], sizes['medium']))
+                    image = ImageOps.exif_transpose(image)
+                    rendered = {size: ImageService.render(image, sizes[size], fmt) for size in DERIVATIVE_FIELDS}
+                updates.update(
+                    image_width=width, image_height=height,
+                    image_size=source.storage.size(source_name), image_available=True,
+                )
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                # Missing, truncated or not an image: keep the row renderable via its flags
+                logger.warning(f"Cannot process {model.__name__} {instance.pk} image {source_name}: {e}")
+                rendered = {}
+
+            base = os.path.splitext(os.path.basename(source_name))[0]
+            extension = 'webp' if fmt == 'WEBP' else 'jpg'
+            for size, data in rendered.items():
+                field = getattr(instance, DERIVATIVE_FIELDS[size])
+                field.save(f"{base}_{size}.{extension}", ContentFile(data), save=False)
+                generated.append(field.name)
+                updates[DERIVATIVE_FIELDS[size]] = field.name
+
+        # Only write if the source is still the one we processed
+        updated = model.objects.filter(
+            ImageService._source_is(model.SOURCE_IMAGE_FIELD, source_name), pk=instance.pk
+        ).update(**updates)
+
+        storage = model._meta.get_field('thumbnail').storage
+        for name in (stale if updated else generated):
+            try:
+                storage.delete(name)
+            except OSError as e:
+                logger.warning(f"Could not delete derivative {name}: {e}")
+
+        return bool(updated) and updates['image_available']
+
+    @staticmethod
+    def generate_for(model_label: str, pk) -> bool:
+        model = apps.get_model(model_label)
+        instance = model.objects.filter(pk=pk).first()
+        if instance is None:
+            return False
+        return ImageService.generate(instance)
+
+    @staticmethod
+    def pending(model_label: str):
+        """Rows whose derivatives are missing or were built from a different source"""
+        model = apps.get_model(model_label)
+        field = model.SOURCE_IMAGE_FIELD
+        return model.objects.exclude(derivatives_source=F(field)).exclude(
+            ImageService._source_is(field, ''), derivatives_source=''
+        )
+
+    @staticmethod
+    def delete_for(instance):
+        """Remove the derivative files of a deleted row"""
+        ImageService._delete_derivatives(instance)
@@ -0,0 +1,419 @@
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone as dt_timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from ..cache import CacheKeys, CacheService
+from .search_service import SearchService
+from .similarity_service import SimilarityService
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('ndjson', 'csv', 'dayone')
+FORMAT_EXTENSIONS = {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv', '.json': 'dayone'}
+
+DEFAULT_BATCH_SIZE = 500
+MAX_ERRORS_REPORTED = 50
+JOB_TIMEOUT = 60 * 60 * 24  # Job status kept for a day
+
+
+class ImportRecordError(ValueError):
+    """A single record could not be imported; the rest of the file continues"""
+
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        raise ImportRecordError(f"Unrecognised date: {value!r}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _split_tags(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [part for part in value.replace(';', ',').split(',')]
+    if isinstance(value, (list, tuple)):
+        return [str(part) for part in value]
+    raise ImportRecordError("Tags must be a list or a comma separated string")
+
+
+class ImportService:
+    """
+    Bulk import of entries from other journaling apps.
+
+    Input is parsed as a stream (NDJSON, CSV or a Day One JSON export) and
+    written in batches: one bulk INSERT for the entries, one batched tag
+    resolution and one bulk INSERT for tag links per batch. Rollups, the
+    activity bitmap and the search index are updated once per batch rather
+    than through per-entry signals.
+    """
+
+    # ------------------------------------------------------------------
+    # Parsing
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def detect_format(filename: str, requested: Optional[str] = None) -> str:
+        if requested:
+            requested = requested.lower()
+            if requested not in FORMATS:
+                raise ValueError(f"Unsupported import format '{requested}'; use one of {', '.join(FORMATS)}")
+            return requested
+        extension = os.path.splitext(filename or '')[1].lower()
+        if extension not in FORMAT_EXTENSIONS:
+            raise ValueError("Could not tell the import format from the file name; pass format explicitly")
+        return FORMAT_EXTENSIONS[extension]
+
+    @staticmethod
+    def _text(stream):
+        return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    @staticmethod
+    def parse_ndjson(stream) -> Iterator[Tuple[int, Dict]]:
+        text = ImportService._text(stream)
+        try:
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, ImportRecordError(f"Invalid JSON: {e.msg}")
+        finally:
+            # A collected wrapper closes the stream under it, which the caller still owns
+            text.detach()
+
+    @staticmethod
+    def parse_csv(stream) -> Iterator[Tuple[int, Dict]]:
+        text = ImportService._text(stream)
+        try:
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, {key.strip().lower(): value for key, value in row.items() if key}
+        finally:
+            text.detach()
+
+    @staticmethod
+    def parse_dayone(stream, chunk_size=64 * 1024) -> Iterator[Tuple[int, Dict]]:
+        """
+        Stream the objects of the top-level "entries" array of a Day One
+        export without loading the whole file (exports can be hundreds of MB).
+        """
+        decoder = json.JSONDecoder()
+        reader = codecs.getincrementaldecoder('utf-8-sig')()
+        buffer, position, index = '', 0, 0
+        in_array, exhausted = False, False
+
+        def fill():
+            nonlocal buffer, position, exhausted
+            chunk = stream.read(chunk_size)
+            exhausted = not chunk
+            buffer = buffer[position:] + reader.decode(chunk or b'', final=exhausted)
+            position = 0
+
+        while True:
+            if not in_array:
+                start = buffer.find('"entries"', position)
+                bracket = buffer.find('[', start) if start >= 0 else -1
+                if bracket < 0:
+                    if exhausted:
+                        raise ValueError("No \"entries\" array found in the Day One export")
+                    # Keep a tail in case the key straddles two chunks
+                    position = max(position, len(buffer) - 16)
+                    fill()
+                    continue
+                position, in_array = bracket + 1, True
+
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position >= len(buffer):
+                if exhausted:
+                    raise ValueError("Day One export ended inside the entries array")
+                fill()
+                continue
+            if buffer[position] == ']':
+                return
+
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise ValueError("Malformed entry in Day One export")
+                fill()
+                continue
+            index += 1
+            position = end
+            yield index, ImportService._from_dayone(record)
+
+    @staticmethod
+    def _from_dayone(record):
+        """Map a Day One entry onto the generic record shape"""
+        if not isinstance(record, dict):
+            return ImportRecordError("Entry is not an object")
+        text = record.get('text') or ''
+        first_line, _, rest = text.partition('\n')
+        if first_line.startswith('#'):
+            title, content = first_line.lstrip('#').strip(), rest.strip()
+        else:
+            title, content = '', text.strip()
+        return {
+            'title': title,
+            'content': content,
+            'created_at': record.get('creationDate'),
+            'tags': record.get('tags') or [],
+        }
+
+    @staticmethod
+    def parse(stream, fmt: str) -> Iterator[Tuple[int, Dict]]:
+        parser = {
+            'ndjson': ImportService.parse_ndjson,
+            'csv': ImportService.parse_csv,
+            'dayone': ImportService.parse_dayone,
+        }[fmt]
+        return parser(stream)
+
+    # ------------------------------------------------------------------
+    # Normalisation
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def normalize(record) -> Tuple[Dict, List[str]]:
+        """Turn a parsed record into Entry field values plus tag names"""
+        if isinstance(record, ImportRecordError):
+            raise record
+        if not isinstance(record, dict):
+            raise ImportRecordError("Record is not an object")
+
+        Entry = apps.get_model('diary', 'Entry')
+        content = (record.get('content') or record.get('text') or record.get('body') or '').strip()
+        if not content:
+            raise ImportRecordError("Entry has no content")
+
+        title = (record.get('title') or '').strip()
+        if not title:
+            title = ' '.join(content.split()[:8])
+        title = title[:Entry._meta.get_field('title').max_length]
+
+        fields = {
+            'title': title,
+            'content': content,
+            'word_count': len(content.split()),
+        }
+
+        created_at = _parse_datetime(record.get('created_at') or record.get('date') or record.get('creationdate'))
+        if created_at:
+            fields['created_at'] = created_at
+
+        mood = (record.get('mood') or '').strip().lower()
+        if mood:
+            if mood not in dict(Entry.MOOD_CHOICES):
+                raise ImportRecordError(f"Unknown mood '{mood}'")
+            fields['mood'] = mood
+
+        rating = record.get('mood_rating')
+        if rating not in (None, ''):
+            try:
+                rating = int(rating)
+            except (TypeError, ValueError):
+                raise ImportRecordError(f"mood_rating must be a number, got {rating!r}")
+            if not 1 <= rating <= 10:
+                raise ImportRecordError("mood_rating must be between 1 and 10")
+            fields['mood_rating'] = rating
+
+        if record.get('summary'):
+            fields['summary'] = str(record['summary']).strip()
+
+        return fields, _split_tags(record.get('tags'))
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def write_batch(user, rows: List[Tuple[Dict, List[str]]]) -> List[int]:
+        """Insert one batch of normalised rows; returns the new entry ids"""
+        Entry = apps.get_model('diary', 'Entry')
+        Tag = apps.get_model('diary', 'Tag')
+        UserWritingStats = apps.get_model('diary', 'UserWritingStats')
+        UserActivityMap = apps.get_model('diary', 'UserActivityMap')
+        Through = Entry.tags.through
+
+        with transaction.atomic():
+            tags = {tag.name: tag.id for tag in Tag.resolve_names(user, [n for _, names in rows for n in names])}
+            entries = Entry.objects.bulk_create([Entry(user=user, **fields) for fields, _ in rows])
+
+            links = []
+            for entry, (_, names) in zip(entries, rows):
+                for name in {Tag.normalize_name(n) for n in names} - {None}:
+                    links.append(Through(entry_id=entry.id, tag_id=tags[name]))
+            Through.objects.bulk_create(links, ignore_conflicts=True)
+
+            # bulk_create skips signals, so apply the batch to every derived structure here
+            tags_by_delta = defaultdict(list)
+            for tag_id, count in Counter(link.tag_id for link in links).items():
+                tags_by_delta[count].append(tag_id)
+            for delta, tag_ids in tags_by_delta.items():
+                Tag.apply_usage_delta(tag_ids, delta)
+
+            ratings = [entry.mood_rating for entry in entries if entry.mood_rating is not None]
+            dates = [entry.created_at for entry in entries]
+            UserWritingStats.apply_delta(
+                user.id,
+                entries=len(entries),
+                words=sum(entry.word_count for entry in entries),
+                rating_total=sum(ratings),
+                rating_count=len(ratings),
+                moods_added=[entry.mood for entry in entries],
+                added_at=min(dates),
+            )
+            UserWritingStats.apply_delta(user.id, added_at=max(dates))  # widen the upper bound too
+
+            activity = UserActivityMap.set_days(user.id, [UserActivityMap.day_of(d) for d in dates])
+            entry_ids = [entry.id for entry in entries]
+            SearchService.index_entries(entry_ids)
+
+        if activity is not None:
+            CacheService.store_activity_map(activity)
+        return entry_ids
+
+    @staticmethod
+    def import_stream(user, stream, fmt: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                      progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """
+        Import every record of a stream. Bad records are skipped and reported;
+        each batch commits on its own so a late failure keeps earlier batches.
+        """
+        result = {'processed': 0, 'imported': 0, 'skipped': 0, 'errors': []}
+        batch = []
+
+        def flush():
+            if batch:
+                result['imported'] += len(ImportService.write_batch(user, batch))
+                batch.clear()
+                if progress:
+                    progress(result)
+
+        for location, record in ImportService.parse(stream, fmt):
+            result['processed'] += 1
+            try:
+                batch.append(ImportService.normalize(record))
+            except ImportRecordError as e:
+                result['skipped'] += 1
+                if len(result['errors']) < MAX_ERRORS_REPORTED:
+                    result['errors'].append({'record': location, 'error': str(e)})
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+
+        if result['imported']:
+            CacheService.invalidate_user_stats(user)
+            CacheService.invalidate_user_dashboard(user)
+            try:
+                # One full rebuild is cheaper than incremental refreshes for a bulk load
+                SimilarityService.rebuild_user(user.id)
+            except Exception as e:
+                logger.error(f"Error rebuilding related entries after import for user {user.id}: {e}")
+
+        logger.info(
+            f"Imported {result['imported']} entries for user {user.id} "
+            f"({result['skipped']} skipped of {result['processed']})"
+        )
+        return result
+
+    # ------------------------------------------------------------------
+    # Background jobs
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def create_job(user, uploaded_file, fmt: str) -> Dict:
+        """Store an upload and register a queued import job for it"""
+        job_id = uuid.uuid4().hex
+        extension = os.path.splitext(uploaded_file.name)[1].lower()
+        path = default_storage.save(f"imports/{user.id}/{job_id}{extension}", uploaded_file)
+        job = {
+            'job_id': job_id,
+            'user_id': user.id,
+            'path': path,
+            'format': fmt,
+            'size': uploaded_file.size,
+            'status': 'queued',
+            'processed': 0,
+            'imported': 0,
+            'skipped': 0,
+            'errors': [],
+            'created_at': timezone.now().isoformat(),
+        }
+        ImportService.save_job(job)
+        return job
+
+    @staticmethod
+    def get_job(job_id) -> Optional[Dict]:
+        return cache.get(CacheKeys.IMPORT_JOB.format(job_id=job_id))
+
+    @staticmethod
+    def save_job(job):
+        cache.set(CacheKeys.IMPORT_JOB.format(job_id=job['job_id']), job, JOB_TIMEOUT)
+
+    @staticmethod
+    def run_job(job_id, batch_size: int = DEFAULT_BATCH_SIZE) -> Dict:
+        """Run a stored import job, publishing progress to the job record"""
+        job = ImportService.get_job(job_id)
+        if job is None:
+            raise ValueError(f"Import job {job_id} not found or expired")
+
+        user = get_user_model().objects.get(pk=job['user_id'])
+
+        job['status'] = 'running'
+        ImportService.save_job(job)
+
+        with default_storage.open(job['path'], 'rb') as stream:
+            def progress(result):
+                job.update(result, bytes_read=stream.tell())
+                ImportService.save_job(job)
+
+            try:
+                result = ImportService.import_stream(user, stream, job['format'], batch_size, progress)
+            except Exception as e:
+                job.update(status='failed', error=str(e))
+                ImportService.save_job(job)
+                raise
+
+        job.update(result, status='completed', bytes_read=job['size'], finished_at=timezone.now().isoformat())
+        ImportService.save_job(job)
+        default_storage.delete(job['path'])
+        return job
+
+    @staticmethod
+    def public_job(job: Dict) -> Dict:
+        """Job fields safe to return to the client"""
+        progress = round(100 * job.get('bytes_read', 0) / job['size']) if job.get('size') else 0
+        return {
+            key: job.get(key)
+            for key in ('job_id', 'status', 'format', 'processed', 'imported', 'skipped', 'errors', 'error',
+                        'created_at', 'finished_at')
+        } | {'progress': min(progress, 100)}
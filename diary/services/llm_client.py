@@ -0,0 +1,489 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException, Timeout
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+
+from .ai_cache import AIResponseCache, SingleFlight
+from .circuit_breaker import CircuitBreaker
+from .prompt_builder import estimate_tokens
+from .rate_limiter import LLMRateLimiter, RateLimitExceeded
+
+try:
+    import aiohttp
+except ImportError:
+    # Async calls fall back to the pooled sync client in a worker thread
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'llama-3.3-70b-versatile'
+DEFAULT_TIMEOUT = 30
+CONNECT_TIMEOUT = 5
+READ_CHUNK_SIZE = 16 * 1024
+
+_usage_tracker = contextvars.ContextVar('llm_usage_tracker', default=None)
+
+
+class UsageTracker:
+    """
+    Token usage and cost reported by the API for the calls made inside a
+    track_usage() block. Calls answered from the AI response cache never
+    reach the API and add nothing.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.models = set()
+        self._lock = threading.Lock()
+
+    def add(self, model: str, usage: Optional[Dict]):
+        if not isinstance(usage, dict):
+            return
+        prompt_tokens = int(usage.get('prompt_tokens') or 0)
+        completion_tokens = int(usage.get('completion_tokens') or 0)
+        input_price, output_price = settings.LLM_PRICING.get(model, (0, 0))
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost += (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+            self.models.add(model)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+@contextmanager
+def track_usage():
+    """
+    Collect API usage of the LLM calls made inside the block, including
+    calls from asyncio tasks and from threads started with a copy of the
+    context (contextvars.copy_context().run).
+    """
+    tracker = UsageTracker()
+    token = _usage_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _usage_tracker.reset(token)
+
+
+def record_usage(model: str, usage: Optional[Dict]):
+    tracker = _usage_tracker.get()
+    if tracker is not None:
+        tracker.add(model, usage)
+
+
+class LLMClient:
+    """
+    Shared client for the Groq chat completions API.
+
+    Keeps one keep-alive connection pool per process (and one aiohttp pool
+    per event loop for async callers), so consecutive calls reuse the TLS
+    connection instead of handshaking every time. Each call takes a deadline
+    in seconds covering the whole request. Errors match what the call sites
+    already handle: Timeout, RequestException for non-200 responses and
+    ValueError for malformed bodies.
+
+    Calls go through a circuit breaker shared by all workers: while the
+    provider is failing they raise CircuitOpenError (a RequestException)
+    straight away, so callers drop to their fallback content without
+    waiting on timeouts.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 pool_size: Optional[int] = None):
+        self.base_url = (base_url or settings.GROQ_API_BASE_URL).rstrip('/')
+        self.api_key = api_key if api_key is not None else settings.GROK_API_KEY
+        self.pool_size = pool_size or settings.LLM_HTTP_POOL_SIZE
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+        self._async_sessions = weakref.WeakKeyDictionary()
+        self.breaker = CircuitBreaker('groq')
+        self.limiter = LLMRateLimiter('groq')
+
+    @property
+    def completions_url(self) -> str:
+        return f"{self.base_url}/chat/completions"
+
+    def _headers(self, request_id) -> Dict[str, str]:
+        return {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.api_key}',
+            'X-Request-ID': str(request_id),
+        }
+
+    @staticmethod
+    def build_payload(messages: List[Dict], model: str, temperature: float, max_tokens: int) -> Dict:
+        return {
+            'model': model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+        }
+
+    @staticmethod
+    def endpoint(payload: Dict, label: str) -> str:
+        # Latency depends mostly on the output length, so timeouts adapt per label and max_tokens
+        return f"{label}:{payload.get('max_tokens')}"
+
+    @staticmethod
+    def is_provider_failure(status: int) -> bool:
+        """Statuses that count against the circuit (not our own bad requests)"""
+        return status >= 500 or status == 429
+
+    @staticmethod
+    def estimate_payload_tokens(payload: Dict) -> int:
+        """Prompt tokens plus the output allowance, reserved with the rate limiter"""
+        prompt = sum(estimate_tokens(message.get('content')) + 4 for message in payload.get('messages', []))
+        return prompt + int(payload.get('max_tokens') or 0)
+
+    def _open_call(self, payload: Dict, timeout: float, label: str):
+        """
+        Check the circuit, then take rate-limit capacity; returns (probe,
+        endpoint, timeout to use, tokens reserved)
+        """
+        # Calls the open circuit rejects must not use up rate-limit capacity
+        probe = self.breaker.before_call()
+        try:
+            reserved = self.limiter.acquire(self.estimate_payload_tokens(payload))
+        except RateLimitExceeded:
+            if probe:
+                self.breaker.release_probe()
+            raise
+        endpoint = self.endpoint(payload, label)
+        # A probe gets the full timeout so it can measure a slow provider
+        if not probe:
+            timeout = self.breaker.timeout_for(endpoint, timeout)
+        return probe, endpoint, timeout, reserved
+
+    def _finish_call(self, payload: Dict, status: int, headers, response_data, reserved: int):
+        """Rate-limit bookkeeping once a response arrived"""
+        if status == 429:
+            self.limiter.block(self.limiter.retry_after(headers))
+        usage = response_data.get('usage') if isinstance(response_data, dict) else None
+        self.limiter.settle(reserved, usage)
+        record_usage(payload.get('model'), usage)
+
+    def _abandon_call(self, reserved: int):
+        """Return the reserved tokens of a call that failed before any response"""
+        self.limiter.settle(reserved, {'total_tokens': 0})
+
+    @staticmethod
+    def extract_content(response_data: Dict, request_id, label: str) -> str:
+        """Message text of a completion, or ValueError for an unexpected body"""
+        choices = response_data.get('choices') if isinstance(response_data, dict) else None
+        if not choices or 'message' not in choices[0]:
+            error_msg = f"Invalid API response structure: {response_data}"
+            logger.error(f"{label} {request_id}: {error_msg}")
+            raise ValueError(error_msg)
+        return choices[0]['message']['content']
+
+    # ------------------------------------------------------------------
+    # Sync
+    # ------------------------------------------------------------------
+
+    def _get_session(self) -> requests.Session:
+        # Sockets must not be shared with a forked child (gunicorn/celery prefork)
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._lock:
+                if self._session is None or self._session_pid != pid:
+                    session = requests.Session()
+                    # Only retry failed connects; a sent completion request is not idempotent
+                    retries = Retry(total=2, connect=2, read=0, status=0, other=0, backoff_factor=0.1)
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retries)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session, self._session_pid = session, pid
+        return self._session
+
+    def complete(self, payload: Dict, timeout: float = DEFAULT_TIMEOUT, request_id=None,
+                 label: str = 'Groq API request') -> Dict:
+        """POST a chat completion payload and return the decoded response body"""
+        request_id = request_id or int(time.time() * 1000)
+        probe, endpoint, timeout, reserved = self._open_call(payload, timeout, label)
+        deadline = time.monotonic() + timeout
+        start_time = time.time()
+
+        failed = True
+        response = None
+        try:
+            response = self._get_session().post(
+                self.completions_url,
+                headers=self._headers(request_id),
+                json=payload,
+                timeout=(min(CONNECT_TIMEOUT, timeout), timeout),
+                stream=True,
+            )
+            try:
+                body = bytearray()
+                for chunk in response.iter_content(READ_CHUNK_SIZE):
+                    body += chunk
+                    if time.monotonic() > deadline:
+                        raise Timeout(f"Request timed out after {timeout} seconds")
+            finally:
+                response.close()
+            failed = self.is_provider_failure(response.status_code)
+        except Timeout:
+            logger.error(f"{label} {request_id} timed out after {timeout}s")
+            raise Timeout(f"Request timed out after {timeout} seconds")
+        finally:
+            self.breaker.record(endpoint, time.time() - start_time, failed, probe)
+            if response is None:
+                self._abandon_call(reserved)
+
+        api_time = time.time() - start_time
+        logger.info(f"{label} {request_id} completed in {api_time:.2f}s with status {response.status_code}")
+
+        text = body.decode('utf-8', errors='replace')
+        if response.status_code != 200:
+            self._finish_call(payload, response.status_code, response.headers, None, reserved)
+            logger.error(f"{label} {request_id} failed: {response.status_code} - {text}")
+            raise RequestException(f"API returned status code {response.status_code}: {text}")
+        try:
+            response_data = json.loads(text)
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid JSON in API response: {text[:200]}")
+        self._finish_call(payload, response.status_code, response.headers, response_data, reserved)
+        return response_data
+
+    def chat(self, messages: List[Dict], model: str = DEFAULT_MODEL, temperature: float = 0.7,
+             max_tokens: int = 800, timeout: float = DEFAULT_TIMEOUT, request_id=None,
+             label: str = 'Groq API request', cache_as: Optional[str] = None) -> str:
+        """
+        Run a chat completion and return the reply text. With cache_as (an
+        AI_CACHE_TTLS policy name) identical requests are answered from the
+        AI response cache instead of the API, and concurrent duplicates wait
+        for a single upstream call.
+        """
+        request_id = request_id or int(time.time() * 1000)
+        payload = self.build_payload(messages, model, temperature, max_tokens)
+
+        def call():
+            return self.extract_content(self.complete(payload, timeout, request_id, label), request_id, label)
+
+        if cache_as:
+            # Identical concurrent requests share one upstream call
+            return SingleFlight.run(cache_as, payload, call, timeout)
+        return call()
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    # ------------------------------------------------------------------
+    # Async
+    # ------------------------------------------------------------------
+
+    def _get_async_session(self):
+        # aiohttp sessions are bound to the loop they were created on
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            session = aiohttp.ClientSession(connector=connector)
+            self._async_sessions[loop] = session
+        return session
+
+    async def acomplete(self, payload: Dict, timeout: float = DEFAULT_TIMEOUT, request_id=None,
+                        label: str = 'Groq API request') -> Dict:
+        """Async variant of complete()"""
+        request_id = request_id or int(time.time() * 1000)
+        if aiohttp is None:
+            try:
+                return await asyncio.wait_for(
+                    asyncio.to_thread(self.complete, payload, timeout, request_id, label), timeout
+                )
+            except asyncio.TimeoutError:
+                raise Timeout(f"Request timed out after {timeout} seconds")
+
+        probe, endpoint, timeout, reserved = await asyncio.to_thread(self._open_call, payload, timeout, label)
+        start_time = time.time()
+        failed = True
+        status = None
+        try:
+            async with self._get_async_session().post(
+                self.completions_url,
+                headers=self._headers(request_id),
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=timeout, connect=min(CONNECT_TIMEOUT, timeout)),
+            ) as response:
+                status = response.status
+                headers = response.headers
+                text = await response.text()
+            failed = self.is_provider_failure(status)
+        except asyncio.TimeoutError:
+            logger.error(f"{label} {request_id} timed out after {timeout}s")
+            raise Timeout(f"Request timed out after {timeout} seconds")
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        finally:
+            await asyncio.to_thread(self.breaker.record, endpoint, time.time() - start_time, failed, probe)
+            if status is None:
+                await asyncio.to_thread(self._abandon_call, reserved)
+
+        api_time = time.time() - start_time
+        logger.info(f"{label} {request_id} completed in {api_time:.2f}s with status {status}")
+
+        if status != 200:
+            await asyncio.to_thread(self._finish_call, payload, status, headers, None, reserved)
+            logger.error(f"{label} {request_id} failed: {status} - {text}")
+            raise RequestException(f"API returned status code {status}: {text}")
+        try:
+            response_data = json.loads(text)
+        except json.JSONDecodeError:
+            raise ValueError(f"Invalid JSON in API response: {text[:200]}")
+        await asyncio.to_thread(self._finish_call, payload, status, headers, response_data, reserved)
+        return response_data
+
+    async def achat(self, messages: List[Dict], model: str = DEFAULT_MODEL, temperature: float = 0.7,
+                    max_tokens: int = 800, timeout: float = DEFAULT_TIMEOUT, request_id=None,
+                    label: str = 'Groq API request', cache_as: Optional[str] = None) -> str:
+        """Async variant of chat()"""
+        request_id = request_id or int(time.time() * 1000)
+        payload = self.build_payload(messages, model, temperature, max_tokens)
+
+        async def call():
+            response_data = await self.acomplete(payload, timeout, request_id, label)
+            return self.extract_content(response_data, request_id, label)
+
+        if cache_as:
+            return await SingleFlight.arun(cache_as, payload, call, timeout)
+        return await call()
+
+    async def astream_chat(self, messages: List[Dict], model: str = DEFAULT_MODEL, temperature: float = 0.7,
+                           max_tokens: int = 800, timeout: float = DEFAULT_TIMEOUT, request_id=None,
+                           label: str = 'Groq API request', cache_as: Optional[str] = None):
+        """
+        Async generator yielding the reply text in pieces as the API streams
+        it. A cached reply is yielded in one piece; a completed stream is
+        stored under cache_as like chat() would store it.
+        """
+        request_id = request_id or int(time.time() * 1000)
+        payload = self.build_payload(messages, model, temperature, max_tokens)
+        if cache_as:
+            cached = await asyncio.to_thread(AIResponseCache.get, cache_as, payload)
+            if cached is not None:
+                yield cached
+                return
+
+        if aiohttp is None:
+            # No streaming transport; deliver the whole reply at once
+            yield await self.achat(messages, model, temperature, max_tokens, timeout, request_id, label, cache_as)
+            return
+
+        probe, endpoint, timeout, reserved = await asyncio.to_thread(self._open_call, payload, timeout, label)
+        start_time = time.time()
+        parts = []
+        failed = True
+        responded = False
+        try:
+            async with self._get_async_session().post(
+                self.completions_url,
+                headers=self._headers(request_id),
+                json={**payload, 'stream': True},
+                timeout=aiohttp.ClientTimeout(total=timeout, connect=min(CONNECT_TIMEOUT, timeout)),
+            ) as response:
+                responded = True
+                if response.status != 200:
+                    failed = self.is_provider_failure(response.status)
+                    await asyncio.to_thread(self._finish_call, payload, response.status, response.headers, None, reserved)
+                    text = await response.text()
+                    logger.error(f"{label} {request_id} failed: {response.status} - {text}")
+                    raise RequestException(f"API returned status code {response.status}: {text}")
+
+                first_token_at = None
+                # Server-sent events: one "data: {...}" line per chunk, "data: [DONE]" at the end
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8', errors='replace').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[5:].strip()
+                    if data == '[DONE]':
+                        break
+                    try:
+                        chunk = json.loads(data)
+                        delta = chunk['choices'][0].get('delta', {}).get('content')
+                    except (ValueError, KeyError, IndexError, TypeError):
+                        raise ValueError(f"Invalid stream chunk in API response: {data[:200]}")
+                    # Groq reports usage on the last chunk
+                    if isinstance(chunk.get('x_groq'), dict) and 'usage' in chunk['x_groq']:
+                        await asyncio.to_thread(
+                            self._finish_call, payload, response.status, response.headers, chunk['x_groq'], reserved
+                        )
+                    if delta:
+                        if first_token_at is None:
+                            first_token_at = time.time() - start_time
+                        parts.append(delta)
+                        yield delta
+            failed = False
+        except GeneratorExit:
+            # The consumer stopped reading, which says nothing about the provider
+            failed = None
+            raise
+        except asyncio.TimeoutError:
+            logger.error(f"{label} {request_id} timed out after {timeout}s")
+            raise Timeout(f"Request timed out after {timeout} seconds")
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        finally:
+            if failed is not None:
+                await asyncio.to_thread(self.breaker.record, endpoint, time.time() - start_time, failed, probe)
+            if not responded:
+                await asyncio.to_thread(self._abandon_call, reserved)
+
+        logger.info(
+            f"{label} {request_id} streamed in {time.time() - start_time:.2f}s "
+            f"(first token {first_token_at or 0:.2f}s)"
+        )
+        if cache_as and parts:
+            await asyncio.to_thread(AIResponseCache.set, cache_as, payload, ''.join(parts))
+
+    async def aclose(self):
+        """Close the aiohttp pool of the running loop"""
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """The process-wide client; all Groq calls should go through it"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient()
+    return _client
+
+
+def reset_llm_client():
+    """Drop the shared client, e.g. after changing GROQ_API_BASE_URL in tests"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
@@ -0,0 +1,166 @@
+import math
+import re
+from typing import Callable, Dict, Iterable, Optional
+
+from django.utils import timezone
+
+from .ai_cache import normalize_prompt
+
+WORD_RE = re.compile(r"\w+|[^\w\s]")
+SHINGLE_WORDS = 3
+SHINGLE_LIMIT = 400  # Words of an entry compared for near-duplicates
+DUPLICATE_SIMILARITY = 0.8
+
+# Moods that make an entry stand out when no numeric rating is given
+STRONG_MOODS = {'excited', 'angry', 'sad', 'anxious', 'overwhelmed'}
+DEFAULT_WEIGHTS = {'recency': 0.5, 'mood': 0.3, 'length': 0.2}
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Fast local token estimate for Llama-style BPE vocabularies: short ASCII
+    words are one token, longer ones one per ~6 letters, punctuation one
+    each and non-ASCII text about one token per 3 UTF-8 bytes.
+    """
+    if not text:
+        return 0
+    count = 0
+    for piece in WORD_RE.findall(text):
+        if piece.isascii():
+            count += 1 + (len(piece) - 1) // 6
+        else:
+            count += 1 + len(piece.encode('utf-8')) // 3
+    return count
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to roughly max_tokens, at a word boundary"""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    cut = text[:int(len(text) * max_tokens / tokens)]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut + '...'
+
+
+class PromptBuilder:
+    """
+    Packs journal entries into a prompt under a fixed token budget.
+
+    Candidates are ranked by recency, mood extremity and length, near-
+    duplicates (copied or templated entries) are dropped, long entries are
+    cut to a per-entry cap, and the best entries are added until the budget
+    is spent. The result reports token counts so callers can log them.
+    """
+
+    @staticmethod
+    def score(entry, now, half_life_days: float, weights: Dict[str, float]) -> float:
+        age_days = max((now - entry.created_at).total_seconds() / 86400, 0)
+        recency = 0.5 ** (age_days / half_life_days)
+
+        if entry.mood_rating:
+            mood = abs(entry.mood_rating - 5.5) / 4.5
+        elif entry.mood in STRONG_MOODS:
+            mood = 0.7
+        elif entry.mood and entry.mood != 'neutral':
+            mood = 0.4
+        else:
+            mood = 0.0
+
+        words = len((entry.content or '').split())
+        length = min(1.0, math.log1p(words) / math.log1p(400))
+
+        return weights['recency'] * recency + weights['mood'] * mood + weights['length'] * length
+
+    @staticmethod
+    def shingles(text: str) -> set:
+        words = normalize_prompt(text).split()[:SHINGLE_LIMIT]
+        if len(words) < SHINGLE_WORDS:
+            return {' '.join(words)}
+        return {hash(tuple(words[i:i + SHINGLE_WORDS])) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+    @staticmethod
+    def is_duplicate(candidate: set, selected: Iterable[set]) -> bool:
+        for other in selected:
+            union = len(candidate | other)
+            if union and len(candidate & other) / union >= DUPLICATE_SIMILARITY:
+                return True
+        return False
+
+    @staticmethod
+    def pack_entries(entries, budget: int, render: Callable, max_entry_tokens: int = 300,
+                     weights: Optional[Dict[str, float]] = None, half_life_days: float = 60,
+                     chronological: bool = True) -> Dict:
+        """
+        Choose and render entries for a prompt.
+
+        Args:
+            entries: Candidate entries (any iterable of Entry objects)
+            budget (int): Token budget for all rendered blocks together
+            render (callable): render(entry, content) -> str, the block for one entry
+            max_entry_tokens (int): Cap for one entry's content
+            weights (dict): Relative weight of 'recency', 'mood' and 'length'
+            half_life_days (float): Age at which the recency score halves
+            chronological (bool): Order blocks oldest first (else newest first)
+
+        Returns:
+            dict: blocks, entries, tokens, considered, duplicates, truncated
+        """
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        now = timezone.now()
+        candidates = list(entries)
+        ranked = sorted(candidates, key=lambda e: PromptBuilder.score(e, now, half_life_days, weights), reverse=True)
+
+        chosen, fingerprints = [], []
+        used = duplicates = truncated = 0
+        for entry in ranked:
+            remaining = budget - used
+            if remaining < 40:
+                break
+
+            fingerprint = PromptBuilder.shingles(f"{entry.title} {entry.content}")
+            if PromptBuilder.is_duplicate(fingerprint, fingerprints):
+                duplicates += 1
+                continue
+
+            content = entry.content or ''
+            content_tokens = estimate_tokens(content)
+            block = render(entry, content)
+            cost = estimate_tokens(block)
+            cap = min(max_entry_tokens, remaining - (cost - content_tokens))
+            was_cut = content_tokens > cap
+            if was_cut:
+                if cap < 20:
+                    continue
+                block = render(entry, truncate_to_tokens(content, cap))
+                cost = estimate_tokens(block)
+            if cost > remaining:
+                continue
+
+            chosen.append((entry, block))
+            fingerprints.append(fingerprint)
+            used += cost
+            truncated += was_cut
+
+        chosen.sort(key=lambda item: item[0].created_at, reverse=not chronological)
+        return {
+            'blocks': [block for _, block in chosen],
+            'entries': [entry for entry, _ in chosen],
+            'tokens': used,
+            'considered': len(candidates),
+            'duplicates': duplicates,
+            'truncated': truncated,
+        }
+
+    @staticmethod
+    def usage_metadata(packed: Dict, prompt: str) -> Dict:
+        """Token accounting for AIGenerationLog.input_metadata"""
+        return {
+            'prompt_tokens': estimate_tokens(prompt),
+            'entry_tokens': packed['tokens'],
+            'entries_considered': packed['considered'],
+            'entries_packed': len(packed['entries']),
+            'duplicates_skipped': packed['duplicates'],
+            'entries_truncated': packed['truncated'],
+        }
@@ -0,0 +1,252 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from requests.exceptions import RequestException
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+_lane = contextvars.ContextVar('llm_lane', default=INTERACTIVE)
+
+# One hash per limiter: refilled request and token levels, last refill time
+# and a provider-imposed pause. Redis time keeps every worker on one clock.
+TAKE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+local req_cost, tok_cost, floor = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts', 'blocked_until')
+local requests = tonumber(state[1]) or rpm
+local tokens = tonumber(state[2]) or tpm
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+requests = math.min(rpm, requests + elapsed * rpm / 60)
+tokens = math.min(tpm, tokens + elapsed * tpm / 60)
+local wait = math.max(0, (tonumber(state[4]) or 0) - now)
+if requests - req_cost < rpm * floor then
+    wait = math.max(wait, (req_cost + rpm * floor - requests) * 60 / rpm)
+end
+if tokens - tok_cost < tpm * floor then
+    wait = math.max(wait, (tok_cost + tpm * floor - tokens) * 60 / tpm)
+end
+if wait == 0 then
+    requests = requests - req_cost
+    tokens = tokens - tok_cost
+end
+redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 300)
+return tostring(wait)
+"""
+
+ADJUST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBYFLOAT', KEYS[1], 'tokens', ARGV[1])
+end
+return 1
+"""
+
+BLOCK_SCRIPT = """
+local t = redis.call('TIME')
+local until_ = tonumber(t[1]) + tonumber(t[2]) / 1000000 + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+if until_ > current then
+    redis.call('HSET', KEYS[1], 'blocked_until', until_)
+    redis.call('EXPIRE', KEYS[1], 300)
+end
+return 1
+"""
+
+
+class RateLimitExceeded(RequestException):
+    """Raised instead of calling the provider when no capacity frees up in time"""
+
+    def __init__(self, message, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+@contextmanager
+def llm_lane(lane: str):
+    """Run the LLM calls made inside the block in the given lane"""
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def set_lane(lane: str):
+    """Switch the current lane; returns a token for reset_lane()"""
+    return _lane.set(lane)
+
+
+def reset_lane(token):
+    _lane.reset(token)
+
+
+def lane_for_queue(queue: Optional[str]) -> str:
+    return BACKGROUND if queue in settings.LLM_RATE_LIMITS['background_queues'] else INTERACTIVE
+
+
+class LLMRateLimiter:
+    """
+    Cluster-wide token bucket for outbound LLM calls, limiting requests per
+    minute and tokens per minute together.
+
+    With Redis configured the buckets live in one Redis hash updated by Lua
+    scripts, so every web and Celery worker draws from the same budget;
+    otherwise each process keeps its own. Calls take one request and their
+    estimated tokens (prompt + max_tokens); the estimate is corrected with
+    the usage the API reports. Background calls may not take the last
+    interactive_reserve share of either bucket, so a burst of Celery jobs
+    leaves headroom for people waiting on a page. Interactive calls wait a
+    few seconds for capacity; background calls wait briefly and then raise
+    RateLimitExceeded, which the AI tasks turn into a rescheduled retry.
+    A 429 from the provider pauses every worker for its Retry-After.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.key = f"llm_rate_{name}"
+        self.config = settings.LLM_RATE_LIMITS
+        self._redis = None
+        self._scripts = None
+        self._local: Dict[str, float] = {}
+        self._local_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+
+    def _connection(self):
+        """Redis client when the default cache is django-redis, else None"""
+        if self._scripts is None:
+            self._scripts = {}
+            if 'django_redis' in settings.CACHES['default']['BACKEND']:
+                try:
+                    from django_redis import get_redis_connection
+                    self._redis = get_redis_connection('default')
+                    self._scripts = {
+                        'take': self._redis.register_script(TAKE_SCRIPT),
+                        'adjust': self._redis.register_script(ADJUST_SCRIPT),
+                        'block': self._redis.register_script(BLOCK_SCRIPT),
+                    }
+                except Exception as e:
+                    logger.warning(f"Rate limiter {self.name} using per-process buckets: {e}")
+                    self._redis = None
+        return self._redis
+
+    def _local_take(self, rpm: float, tpm: float, tokens: float, floor: float) -> float:
+        # Same arithmetic as TAKE_SCRIPT, for a single process
+        with self._local_lock:
+            now = time.time()
+            state = self._local
+            elapsed = max(0.0, now - state.get('ts', now))
+            requests = min(rpm, state.get('requests', rpm) + elapsed * rpm / 60)
+            available = min(tpm, state.get('tokens', tpm) + elapsed * tpm / 60)
+            wait = max(0.0, state.get('blocked_until', 0) - now)
+            if requests - 1 < rpm * floor:
+                wait = max(wait, (1 + rpm * floor - requests) * 60 / rpm)
+            if available - tokens < tpm * floor:
+                wait = max(wait, (tokens + tpm * floor - available) * 60 / tpm)
+            if wait == 0:
+                requests -= 1
+                available -= tokens
+            state.update(requests=requests, tokens=available, ts=now)
+            return wait
+
+    def _take(self, tokens: float, floor: float) -> float:
+        """Take capacity if there is enough above floor; returns 0 or seconds to wait"""
+        rpm, tpm = self.config['requests_per_minute'], self.config['tokens_per_minute']
+        redis = self._connection()
+        if redis is None:
+            return self._local_take(rpm, tpm, tokens, floor)
+        try:
+            return float(self._scripts['take'](keys=[self.key], args=[rpm, tpm, 1, tokens, floor]))
+        except Exception as e:
+            # Without the shared buckets, let calls through rather than fail them
+            logger.warning(f"Rate limiter {self.name} unavailable: {e}")
+            return 0.0
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def acquire(self, tokens: int, lane: Optional[str] = None) -> int:
+        """
+        Take one request and `tokens` tokens for a call in the lane (the
+        current lane by default), waiting up to the lane's limit.
+
+        Returns:
+            int: Tokens reserved, to pass to settle()
+        """
+        lane = lane or current_lane()
+        floor = self.config['interactive_reserve'] if lane == BACKGROUND else 0.0
+        # A call larger than the lane can ever hold waits for a full bucket instead of forever
+        tokens = min(tokens, int(self.config['tokens_per_minute'] * (1 - floor)))
+        max_wait = self.config[f'{lane}_max_wait']
+        deadline = time.monotonic() + max_wait
+
+        while True:
+            wait = self._take(tokens, floor)
+            if wait <= 0:
+                return tokens
+            if time.monotonic() + wait > deadline:
+                logger.warning(f"Rate limiter {self.name}: {lane} call deferred, capacity in {wait:.1f}s")
+                raise RateLimitExceeded(
+                    f"LLM rate limit reached for {lane} calls; retry in {wait:.1f}s", retry_after=wait
+                )
+            # Jitter so waiting workers do not all retry at the same instant
+            time.sleep(wait + random.uniform(0, 0.25))
+
+    def settle(self, reserved: int, usage: Optional[Dict]):
+        """Return the unused part of a reservation (or charge the overrun)"""
+        if not reserved or not isinstance(usage, dict) or 'total_tokens' not in usage:
+            return
+        refund = reserved - int(usage['total_tokens'])
+        if not refund:
+            return
+        redis = self._connection()
+        if redis is None:
+            with self._local_lock:
+                if 'tokens' in self._local:
+                    self._local['tokens'] += refund
+            return
+        try:
+            self._scripts['adjust'](keys=[self.key], args=[refund])
+        except Exception as e:
+            logger.warning(f"Rate limiter {self.name} could not settle tokens: {e}")
+
+    def block(self, seconds: float):
+        """Pause all calls for `seconds` (the provider answered 429)"""
+        seconds = min(max(seconds, 1.0), self.config['max_block_seconds'])
+        logger.warning(f"Rate limiter {self.name}: provider rate limited, pausing calls for {seconds:.1f}s")
+        redis = self._connection()
+        if redis is None:
+            with self._local_lock:
+                self._local['blocked_until'] = max(self._local.get('blocked_until', 0), time.time() + seconds)
+            return
+        try:
+            self._scripts['block'](keys=[self.key], args=[seconds])
+        except Exception as e:
+            logger.warning(f"Rate limiter {self.name} could not pause calls: {e}")
+
+    @staticmethod
+    def retry_after(headers) -> float:
+        """Seconds from a 429 response's Retry-After header (default 5)"""
+        try:
+            return float(headers.get('retry-after') or headers.get('Retry-After') or 5)
+        except (TypeError, ValueError):
+            return 5.0
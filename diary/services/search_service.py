@@ -0,0 +1,515 @@
+import html
+import logging
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Highlight markers survive the database round trip and are swapped for
+# <mark> tags only after the surrounding text has been HTML-escaped
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+MAX_PAGE_SIZE = 50
+
+
+def _render_highlight(text):
+    """Escape search output and turn highlight markers into <mark> tags"""
+    escaped = html.escape(text or '')
+    return escaped.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+
+def _day_bound(value, end=False):
+    """Turn a date filter into an aware datetime bound ([start, end) semantics)"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        moment = datetime.combine(value + timedelta(days=1) if end else value, time.min)
+    if settings.USE_TZ and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class _SearchBackend:
+    """Common filter handling for the SQL search backends"""
+
+    vendor = None
+
+    def __init__(self):
+        Document = apps.get_model('diary', 'EntrySearchDocument')
+        Entry = apps.get_model('diary', 'Entry')
+        Tag = apps.get_model('diary', 'Tag')
+        self.doc_table = Document._meta.db_table
+        self.tag_table = Tag._meta.db_table
+        self.entry_tags_table = Entry.tags.through._meta.db_table
+
+    def create_index(self):
+        """DDL for the full-text structures; run from rebuild_search_index, never per request"""
+        raise NotImplementedError
+
+    def index_exists(self) -> bool:
+        """Catalog lookup only: whether create_index() has run on this database"""
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def search(self, user_id, query, filters, limit, offset):
+        raise NotImplementedError
+
+    def _filter_sql(self, user_id, filters):
+        clauses = ['d.user_id = %s']
+        params = [user_id]
+
+        if filters.get('mood'):
+            clauses.append('d.mood = %s')
+            params.append(filters['mood'])
+        if filters.get('date_from'):
+            clauses.append('d.created_at >= %s')
+            params.append(filters['date_from'])
+        if filters.get('date_to'):
+            clauses.append('d.created_at < %s')
+            params.append(filters['date_to'])
+        if filters.get('tag'):
+            clauses.append(
+                f'EXISTS (SELECT 1 FROM {self.entry_tags_table} et '
+                f'JOIN {self.tag_table} t ON t.id = et.tag_id '
+                f'WHERE et.entry_id = d.entry_id AND t.name = %s)'
+            )
+            params.append(filters['tag'])
+
+        return ' AND '.join(clauses), params
+
+
+class PostgresSearchBackend(_SearchBackend):
+    """tsvector generated column with a GIN index, ranked by ts_rank_cd"""
+
+    vendor = 'postgresql'
+    config = 'english'
+
+    def create_index(self):
+        # Adding the stored column rewrites the table under an ACCESS EXCLUSIVE lock
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                ALTER TABLE {self.doc_table} ADD COLUMN IF NOT EXISTS search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector('{self.config}', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('{self.config}', coalesce(tags, '')), 'B') ||
+                    setweight(to_tsvector('{self.config}', coalesce(summary, '')), 'C') ||
+                    setweight(to_tsvector('{self.config}', coalesce(body, '')), 'D')
+                ) STORED
+            """)
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.doc_table}_search_gin "
+                f"ON {self.doc_table} USING GIN (search_vector)"
+            )
+
+    def index_exists(self) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'search_vector'",
+                [self.doc_table]
+            )
+            if cursor.fetchone() is None:
+                return False
+            cursor.execute(
+                "SELECT 1 FROM pg_indexes WHERE schemaname = current_schema() AND indexname = %s",
+                [f"{self.doc_table}_search_gin"]
+            )
+            if cursor.fetchone() is None:
+                logger.warning(f"GIN index on {self.doc_table}.search_vector is missing; searches will scan")
+        return True
+
+    def rebuild(self):
+        # The generated column recomputes itself; just refresh planner stats
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {self.doc_table}")
+
+    def search(self, user_id, query, filters, limit, offset):
+        where, params = self._filter_sql(user_id, filters)
+        headline_opts = (
+            f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, '
+            'MaxFragments=2, MaxWords=30, MinWords=12, FragmentDelimiter=" … "'
+        )
+        # ts_headline re-parses the document, so rank and limit first and
+        # only build headlines for the rows on this page
+        sql = f"""
+            SELECT p.entry_id, p.created_at, p.mood, p.rank,
+                   ts_headline('{self.config}', p.title, q, %s) AS title_hl,
+                   ts_headline('{self.config}', coalesce(nullif(p.body, ''), p.summary), q, %s) AS snippet
+            FROM (
+                SELECT d.entry_id, d.created_at, d.mood, d.title, d.body, d.summary,
+                       ts_rank_cd(d.search_vector, q) AS rank
+                FROM {self.doc_table} d, websearch_to_tsquery('{self.config}', %s) q
+                WHERE d.search_vector @@ q AND {where}
+                ORDER BY rank DESC, d.created_at DESC, d.entry_id DESC
+                LIMIT %s OFFSET %s
+            ) p, websearch_to_tsquery('{self.config}', %s) q
+            ORDER BY p.rank DESC, p.created_at DESC, p.entry_id DESC
+        """
+        count_sql = f"""
+            SELECT count(*) FROM {self.doc_table} d, websearch_to_tsquery('{self.config}', %s) q
+            WHERE d.search_vector @@ q AND {where}
+        """
+        title_opts = f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, HighlightAll=true'
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [title_opts, headline_opts, query, *params, limit, offset, query])
+            rows = cursor.fetchall()
+            cursor.execute(count_sql, [query, *params])
+            total = cursor.fetchone()[0]
+
+        return [
+            {'entry_id': r[0], 'created_at': r[1], 'mood': r[2], 'rank': float(r[3]),
+             'title': r[4], 'snippet': r[5]}
+            for r in rows
+        ], total
+
+
+class SQLiteSearchBackend(_SearchBackend):
+    """External-content FTS5 table kept in sync by triggers, ranked by bm25"""
+
+    vendor = 'sqlite'
+
+    @property
+    def fts_table(self):
+        return f"{self.doc_table}_fts"
+
+    def create_index(self):
+        fts, doc = self.fts_table, self.doc_table
+        columns = 'title, body, summary, tags'
+        new_values = 'new.title, new.body, new.summary, new.tags'
+        old_values = 'old.title, old.body, old.summary, old.tags'
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fts])
+            created = cursor.fetchone() is None
+
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                f"{columns}, content='{doc}', content_rowid='id', tokenize='porter unicode61')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {doc} BEGIN "
+                f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {doc} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {doc} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+                f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+            )
+
+        if created:
+            # Documents written before the FTS table existed need to be picked up
+            self.rebuild()
+
+    def index_exists(self) -> bool:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.fts_table])
+            return cursor.fetchone() is not None
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES ('rebuild')")
+
+    @staticmethod
+    def match_expression(query):
+        """Quote each term (FTS5 syntax is not safe for raw user input); prefix-match the last one"""
+        terms = re.findall(r'\w+', query, re.UNICODE)
+        if not terms:
+            return None
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, user_id, query, filters, limit, offset):
+        match = self.match_expression(query)
+        if match is None:
+            return [], 0
+
+        fts = self.fts_table
+        where, params = self._filter_sql(user_id, filters)
+        # CROSS JOIN pins the FTS table as the outer loop (SQLite otherwise may
+        # scan the user's documents and run MATCH per row). snippet()/highlight()
+        # are only built for the rows on the requested page.
+        page_sql = f"""
+            SELECT {fts}.rowid, d.entry_id, d.created_at, d.mood, bm25({fts}, 10.0, 1.0, 2.0, 5.0) AS rank
+            FROM {fts} CROSS JOIN {self.doc_table} d ON d.id = {fts}.rowid
+            WHERE {fts} MATCH %s AND {where}
+            ORDER BY rank, d.created_at DESC, d.entry_id DESC
+            LIMIT %s OFFSET %s
+        """
+        count_sql = f"""
+            SELECT count(*) FROM {fts} CROSS JOIN {self.doc_table} d ON d.id = {fts}.rowid
+            WHERE {fts} MATCH %s AND {where}
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(page_sql, [match, *params, limit, offset])
+            rows = cursor.fetchall()
+            cursor.execute(count_sql, [match, *params])
+            total = cursor.fetchone()[0]
+
+            highlights = {}
+            if rows:
+                rowids = [r[0] for r in rows]
+                placeholders = ', '.join(['%s'] * len(rowids))
+                cursor.execute(
+                    f"SELECT rowid, highlight({fts}, 0, %s, %s), snippet({fts}, -1, %s, %s, ' … ', 24) "
+                    f"FROM {fts} WHERE {fts} MATCH %s AND rowid IN ({placeholders})",
+                    [HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END, match, *rowids]
+                )
+                highlights = {r[0]: (r[1], r[2]) for r in cursor.fetchall()}
+
+        # bm25() is "lower is better"; flip it so callers always see higher = better
+        return [
+            {'entry_id': r[1], 'created_at': r[2], 'mood': r[3], 'rank': -float(r[4]),
+             'title': highlights.get(r[0], ('', ''))[0], 'snippet': highlights.get(r[0], ('', ''))[1]}
+            for r in rows
+        ], total
+
+
+class FallbackSearchBackend:
+    """ORM substring search for databases without a full-text engine"""
+
+    vendor = None
+
+    def create_index(self):
+        pass
+
+    def index_exists(self) -> bool:
+        return True
+
+    def rebuild(self):
+        pass
+
+    def search(self, user_id, query, filters, limit, offset):
+        Document = apps.get_model('diary', 'EntrySearchDocument')
+        terms = re.findall(r'\w+', query, re.UNICODE)
+        if not terms:
+            return [], 0
+
+        docs = Document.objects.filter(user_id=user_id)
+        for term in terms:
+            docs = docs.filter(
+                Q(title__icontains=term) | Q(body__icontains=term) |
+                Q(summary__icontains=term) | Q(tags__icontains=term)
+            )
+        if filters.get('mood'):
+            docs = docs.filter(mood=filters['mood'])
+        if filters.get('date_from'):
+            docs = docs.filter(created_at__gte=filters['date_from'])
+        if filters.get('date_to'):
+            docs = docs.filter(created_at__lt=filters['date_to'])
+        if filters.get('tag'):
+            docs = docs.filter(entry__tags__name=filters['tag'])
+
+        pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+        mark = lambda text: pattern.sub(lambda m: f"{HIGHLIGHT_START}{m.group(0)}{HIGHLIGHT_END}", text or '')
+
+        results = []
+        for doc in docs.order_by('-created_at', '-entry_id')[offset:offset + limit]:
+            first_hit = pattern.search(doc.body or '')
+            start = max(0, first_hit.start() - 80) if first_hit else 0
+            results.append({
+                'entry_id': doc.entry_id, 'created_at': doc.created_at, 'mood': doc.mood, 'rank': 0.0,
+                'title': mark(doc.title), 'snippet': mark((doc.body or doc.summary or '')[start:start + 200]),
+            })
+        return results, docs.count()
+
+
+class SearchService:
+    """Full-text search over a user's entries (title, content, summary and tags)"""
+
+    _backend = None
+    _index_ready = False
+
+    @staticmethod
+    def get_backend():
+        """Pick the search backend for the default database connection"""
+        if SearchService._backend is None:
+            if connection.vendor == 'postgresql':
+                SearchService._backend = PostgresSearchBackend()
+            elif connection.vendor == 'sqlite':
+                SearchService._backend = SQLiteSearchBackend()
+            else:
+                SearchService._backend = FallbackSearchBackend()
+        return SearchService._backend
+
+    @staticmethod
+    def create_index():
+        """Create the full-text index structures (rebuild_search_index; takes DDL locks)"""
+        backend = SearchService.get_backend()
+        try:
+            backend.create_index()
+        except DatabaseError as e:
+            # e.g. SQLite compiled without FTS5 - degrade to substring search
+            logger.error(f"Full-text index unavailable ({backend.vendor}), using fallback search: {e}")
+            SearchService._backend = FallbackSearchBackend()
+        SearchService._index_ready = True
+
+    @staticmethod
+    def ensure_index() -> bool:
+        """
+        Whether the full-text index exists, checked in the catalog without
+        any DDL. A missing index is looked up again on the next call, so
+        running rebuild_search_index takes effect without a restart.
+        """
+        if SearchService._index_ready:
+            return True
+        backend = SearchService.get_backend()
+        try:
+            # A savepoint keeps a failed lookup from aborting the caller's transaction
+            with transaction.atomic():
+                ready = backend.index_exists()
+        except DatabaseError as e:
+            logger.error(f"Could not check the full-text index ({backend.vendor}): {e}")
+            return False
+        if not ready:
+            logger.warning("Full-text index missing, using fallback search; run manage.py rebuild_search_index")
+        SearchService._index_ready = ready
+        return ready
+
+    @staticmethod
+    def build_document_fields(entry, tag_names: Optional[Iterable[str]] = None) -> Dict:
+        """Column values of an entry's search document"""
+        if tag_names is None:
+            tag_names = entry.tags.values_list('name', flat=True)
+        return {
+            'user_id': entry.user_id,
+            'title': entry.title or '',
+            'body': entry.content or '',
+            'summary': entry.summary or '',
+            'tags': ' '.join(sorted(tag_names)),
+            'mood': entry.mood,
+            'created_at': entry.created_at,
+        }
+
+    @staticmethod
+    def index_entry(entry, tag_names: Optional[Iterable[str]] = None):
+        """Insert or refresh one entry's search document"""
+        Document = apps.get_model('diary', 'EntrySearchDocument')
+        Document.objects.update_or_create(
+            entry_id=entry.pk, defaults=SearchService.build_document_fields(entry, tag_names)
+        )
+
+    @staticmethod
+    def index_entries(entry_ids: List[int]) -> int:
+        """Bulk (re)index a batch of entries with a constant number of queries"""
+        if not entry_ids:
+            return 0
+        Entry = apps.get_model('diary', 'Entry')
+        Document = apps.get_model('diary', 'EntrySearchDocument')
+
+        entries = list(Entry.objects.filter(id__in=entry_ids))
+        tag_names = {}
+        for entry_id, name in Entry.tags.through.objects.filter(
+            entry_id__in=entry_ids
+        ).values_list('entry_id', 'tag__name'):
+            tag_names.setdefault(entry_id, []).append(name)
+
+        existing = set(Document.objects.filter(entry_id__in=entry_ids).values_list('entry_id', flat=True))
+        new_docs, changed_docs = [], []
+        for entry in entries:
+            fields = SearchService.build_document_fields(entry, tag_names.get(entry.id, []))
+            doc = Document(entry_id=entry.id, indexed_at=timezone.now(), **fields)
+            (changed_docs if entry.id in existing else new_docs).append(doc)
+
+        Document.objects.bulk_create(new_docs, batch_size=500)
+        if changed_docs:
+            # Existing rows are rewritten through a delete + insert so the
+            # index triggers see one change per document
+            Document.objects.filter(entry_id__in=[d.entry_id for d in changed_docs]).delete()
+            Document.objects.bulk_create(changed_docs, batch_size=500)
+        return len(entries)
+
+    @staticmethod
+    def refresh_tags(entry):
+        """Re-sync the tag column after an entry's tags change"""
+        Document = apps.get_model('diary', 'EntrySearchDocument')
+        tags = ' '.join(sorted(entry.tags.values_list('name', flat=True)))
+        if not Document.objects.filter(entry_id=entry.pk).update(tags=tags, indexed_at=timezone.now()):
+            SearchService.index_entry(entry)
+
+    @staticmethod
+    def rebuild_index(user=None, batch_size=1000) -> int:
+        """Create the index if needed and backfill search documents for every entry (or one user's entries)"""
+        SearchService.create_index()
+        Entry = apps.get_model('diary', 'Entry')
+        entries = Entry.objects.all() if user is None else Entry.objects.filter(user=user)
+
+        indexed = 0
+        batch = []
+        for entry_id in entries.order_by('id').values_list('id', flat=True).iterator(chunk_size=batch_size):
+            batch.append(entry_id)
+            if len(batch) >= batch_size:
+                indexed += SearchService.index_entries(batch)
+                batch = []
+        indexed += SearchService.index_entries(batch)
+
+        SearchService.get_backend().rebuild()
+        logger.info(f"Rebuilt search index for {indexed} entries")
+        return indexed
+
+    @staticmethod
+    def search(user, query: str, mood: str = None, tag: str = None, date_from=None, date_to=None,
+               page: int = 1, page_size: int = 20) -> Dict:
+        """
+        Ranked full-text search over the user's entries.
+
+        Returns a page of results with HTML-safe highlighted title and snippet
+        (matches wrapped in <mark>), plus total hit count for pagination.
+        """
+        query = (query or '').strip()
+        page = max(1, int(page or 1))
+        page_size = max(1, min(int(page_size or 20), MAX_PAGE_SIZE))
+        response = {
+            'query': query,
+            'results': [],
+            'total': 0,
+            'page': page,
+            'page_size': page_size,
+            'has_next': False,
+        }
+        if not query:
+            return response
+
+        backend = SearchService.get_backend() if SearchService.ensure_index() else FallbackSearchBackend()
+        filters = {
+            'mood': mood,
+            'tag': tag,
+            'date_from': _day_bound(date_from),
+            'date_to': _day_bound(date_to, end=True),
+        }
+        rows, total = backend.search(
+            user.id, query, filters, page_size, (page - 1) * page_size
+        )
+
+        response['results'] = [
+            {
+                'entry_id': row['entry_id'],
+                'title_html': _render_highlight(row['title']),
+                'snippet_html': _render_highlight(row['snippet']),
+                'mood': row['mood'],
+                'created_at': row['created_at'],
+                'rank': round(row['rank'], 4),
+            }
+            for row in rows
+        ]
+        response['total'] = total
+        response['has_next'] = page * page_size < total
+        return response
@@ -0,0 +1,277 @@
+import logging
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[^\W\d_]{3,}", re.UNICODE)
+
+STOP_WORDS = frozenset("""
+about above after again against all also and any are because been before being below between both
+but can could did does doing down during each few for from further had has have having her here
+hers herself him himself his how into its itself just more most myself nor not now off once only
+other our ours ourselves out over own same she should some such than that the their theirs them
+themselves then there these they this those through too under until very was were what when where
+which while who whom why will with would you your yours yourself yourselves today really got get
+""".split())
+
+
+class SimilarityService:
+    """
+    Related-entries index. Each user's entries are embedded as TF-IDF vectors
+    over title + content and as IDF-weighted tag vectors; similarity is the
+    blended cosine of the two, and the top-k neighbours of every entry are
+    stored in RelatedEntry so entry pages only do one indexed lookup.
+    """
+
+    TOP_K = 5
+    CONTENT_WEIGHT = 0.6
+    TAG_WEIGHT = 0.4
+    MIN_SCORE = 0.05
+    # Rows of the similarity matrix materialised at once (bounds memory on large diaries)
+    BLOCK_ROWS = 256
+    # Changes within this many seconds are folded into one refresh per user
+    REFRESH_DELAY = 30
+    PENDING_TTL = 86400
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return [token for token in TOKEN_RE.findall((text or '').lower()) if token not in STOP_WORDS]
+
+    @staticmethod
+    def _normalize_rows(matrix):
+        """L2-normalise rows of a sparse matrix (all-zero rows stay zero)"""
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms) @ matrix
+
+    @staticmethod
+    def _weighted_matrix(rows: Iterable[Tuple[int, int, float]], n_rows: int, n_cols: int):
+        """IDF-weighted, row-normalised CSR matrix from (row, col, value) triples"""
+        rows = list(rows)
+        if not rows or not n_cols:
+            return sparse.csr_matrix((n_rows, max(n_cols, 1)))
+        row_idx, col_idx, values = (np.asarray(part) for part in zip(*rows))
+        matrix = sparse.csr_matrix((values.astype(np.float64), (row_idx, col_idx)), shape=(n_rows, n_cols))
+
+        document_frequency = np.bincount(col_idx, minlength=n_cols)
+        idf = np.log((1 + n_rows) / (1 + document_frequency)) + 1.0
+        return SimilarityService._normalize_rows(matrix @ sparse.diags(idf)).tocsr()
+
+    @staticmethod
+    def build_corpus(user_id):
+        """
+        Vectorise a user's entries.
+
+        Returns (entry_ids, content_matrix, tag_matrix) where row i of both
+        matrices belongs to entry_ids[i].
+        """
+        Entry = apps.get_model('diary', 'Entry')
+
+        entry_ids, content_triples, vocabulary = [], [], {}
+        entries = Entry.objects.filter(user_id=user_id).order_by('id').values_list('id', 'title', 'content')
+        for row, (entry_id, title, content) in enumerate(entries.iterator(chunk_size=2000)):
+            entry_ids.append(entry_id)
+            counts = Counter(SimilarityService.tokenize(f"{title} {content}"))
+            for term, count in counts.items():
+                column = vocabulary.setdefault(term, len(vocabulary))
+                # Sublinear tf so one repeated word doesn't dominate an entry
+                content_triples.append((row, column, 1.0 + np.log(count)))
+
+        position = {entry_id: row for row, entry_id in enumerate(entry_ids)}
+        tag_columns, tag_triples = {}, []
+        for entry_id, tag_id in Entry.tags.through.objects.filter(
+            entry__user_id=user_id
+        ).values_list('entry_id', 'tag_id'):
+            if entry_id in position:
+                column = tag_columns.setdefault(tag_id, len(tag_columns))
+                tag_triples.append((position[entry_id], column, 1.0))
+
+        n = len(entry_ids)
+        content = SimilarityService._weighted_matrix(content_triples, n, len(vocabulary))
+        tags = SimilarityService._weighted_matrix(tag_triples, n, len(tag_columns))
+        return entry_ids, content, tags
+
+    @staticmethod
+    def similarity_rows(rows, content, tags):
+        """Dense blended similarity of the given row indices against every entry"""
+        block = (
+            SimilarityService.CONTENT_WEIGHT * (content[rows] @ content.T) +
+            SimilarityService.TAG_WEIGHT * (tags[rows] @ tags.T)
+        )
+        return block.toarray()
+
+    @staticmethod
+    def top_neighbours(rows, entry_ids, content, tags, k=None) -> Dict[int, List[Tuple[int, float]]]:
+        """Top-k (related_id, score) lists for the given row indices, computed block by block"""
+        k = k or SimilarityService.TOP_K
+        n = len(entry_ids)
+        ids = np.asarray(entry_ids)
+        neighbours = {}
+        if n < 2:
+            return {entry_ids[row]: [] for row in rows}
+
+        kth = min(k, n - 1)
+        rows = np.asarray(list(rows), dtype=np.int64)
+        for start in range(0, len(rows), SimilarityService.BLOCK_ROWS):
+            block_rows = rows[start:start + SimilarityService.BLOCK_ROWS]
+            scores = SimilarityService.similarity_rows(block_rows, content, tags)
+            scores[np.arange(len(block_rows)), block_rows] = -np.inf  # never relate an entry to itself
+
+            candidates = np.argpartition(-scores, kth - 1, axis=1)[:, :kth]
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1)
+            candidates = np.take_along_axis(candidates, order, axis=1)
+            candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+            for i, row in enumerate(block_rows):
+                keep = candidate_scores[i] > SimilarityService.MIN_SCORE
+                neighbours[entry_ids[row]] = [
+                    (int(related), round(float(score), 4))
+                    for related, score in zip(ids[candidates[i][keep]], candidate_scores[i][keep])
+                ]
+        return neighbours
+
+    @staticmethod
+    def _store(neighbours: Dict[int, List[Tuple[int, float]]], replace=True):
+        """Write neighbour lists, replacing any stored lists of the same entries"""
+        RelatedEntry = apps.get_model('diary', 'RelatedEntry')
+        with transaction.atomic():
+            if replace:
+                RelatedEntry.objects.filter(entry_id__in=list(neighbours)).delete()
+            RelatedEntry.objects.bulk_create([
+                RelatedEntry(entry_id=entry_id, related_id=related_id, score=score, rank=rank)
+                for entry_id, related in neighbours.items()
+                for rank, (related_id, score) in enumerate(related)
+            ], batch_size=1000)
+
+    @staticmethod
+    def rebuild_user(user_id) -> int:
+        """Recompute the neighbour lists of every entry a user has"""
+        entry_ids, content, tags = SimilarityService.build_corpus(user_id)
+        neighbours = SimilarityService.top_neighbours(range(len(entry_ids)), entry_ids, content, tags)
+
+        RelatedEntry = apps.get_model('diary', 'RelatedEntry')
+        with transaction.atomic():
+            RelatedEntry.objects.filter(entry__user_id=user_id).delete()
+            SimilarityService._store(neighbours, replace=False)
+
+        logger.info(f"Rebuilt related entries for user {user_id} ({len(entry_ids)} entries)")
+        return len(entry_ids)
+
+    @staticmethod
+    def refresh_entries(user_id, entry_ids: Iterable[int]) -> int:
+        """
+        Incrementally update the index after some entries changed.
+
+        Recomputes the changed entries plus every entry whose stored list is
+        affected: lists that pointed at a changed entry, and lists the changed
+        entries now score high enough to break into. IDF drift on untouched
+        entries is corrected by the periodic full rebuild.
+        """
+        RelatedEntry = apps.get_model('diary', 'RelatedEntry')
+        changed = set(entry_ids)
+        all_ids, content, tags = SimilarityService.build_corpus(user_id)
+        position = {entry_id: row for row, entry_id in enumerate(all_ids)}
+        present = [position[entry_id] for entry_id in changed if entry_id in position]
+        k = SimilarityService.TOP_K
+        full = min(k, len(all_ids) - 1)
+
+        stored = {}
+        for entry_id, related_id, score in RelatedEntry.objects.filter(
+            entry__user_id=user_id
+        ).values_list('entry_id', 'related_id', 'score'):
+            stored.setdefault(entry_id, []).append((related_id, score))
+
+        affected = set(present)
+        for entry_id, related in stored.items():
+            if entry_id in position and any(related_id in changed for related_id, _ in related):
+                affected.add(position[entry_id])
+
+        if present and full > 0:
+            # Similarity is symmetric: column j of the changed rows is how well
+            # entry j now scores against the changed entries
+            best_incoming = np.zeros(len(all_ids))
+            for start in range(0, len(present), SimilarityService.BLOCK_ROWS):
+                block = SimilarityService.similarity_rows(present[start:start + SimilarityService.BLOCK_ROWS], content, tags)
+                best_incoming = np.maximum(best_incoming, block.max(axis=0))
+
+            thresholds = np.full(len(all_ids), SimilarityService.MIN_SCORE)
+            for entry_id, related in stored.items():
+                if entry_id in position and len(related) >= full:
+                    thresholds[position[entry_id]] = min(score for _, score in related)
+            affected.update(np.flatnonzero(best_incoming > thresholds).tolist())
+
+        neighbours = SimilarityService.top_neighbours(sorted(affected), all_ids, content, tags)
+        SimilarityService._store(neighbours)
+        return len(neighbours)
+
+    @staticmethod
+    def _redis():
+        """Redis client when the default cache is django-redis, else None"""
+        if 'django_redis' not in settings.CACHES['default']['BACKEND']:
+            return None
+        try:
+            from django_redis import get_redis_connection
+            return get_redis_connection('default')
+        except Exception as e:
+            logger.warning(f"Related entries refresh queue using the cache API: {e}")
+            return None
+
+    @staticmethod
+    def queue_refresh(user_id, entry_ids: Iterable[int]) -> bool:
+        """
+        Add entries to the user's pending refresh. Returns True when no
+        refresh is scheduled yet, i.e. the caller should queue one.
+
+        Without Redis the pending set can't be shared safely between the web
+        processes and the worker, so every change queues its own refresh.
+        """
+        redis = SimilarityService._redis()
+        if redis is None:
+            return True
+        entry_ids = [int(entry_id) for entry_id in entry_ids]
+        key = cache.make_key(f"related_pending_{user_id}")
+        pipe = redis.pipeline()
+        if entry_ids:
+            pipe.sadd(key, *entry_ids)
+        pipe.expire(key, SimilarityService.PENDING_TTL)
+        pipe.execute()
+        # Outlives the delay so a lost task doesn't block refreshes for long
+        return cache.add(f"related_scheduled_{user_id}", 1, SimilarityService.REFRESH_DELAY * 10)
+
+    @staticmethod
+    def unschedule_refresh(user_id):
+        """Forget that a refresh is scheduled (its task could not be queued)"""
+        cache.delete(f"related_scheduled_{user_id}")
+
+    @staticmethod
+    def take_pending(user_id) -> List[int]:
+        """Remove and return the user's pending entry ids; later changes schedule a new refresh"""
+        redis = SimilarityService._redis()
+        if redis is None:
+            return []
+        SimilarityService.unschedule_refresh(user_id)
+        key = cache.make_key(f"related_pending_{user_id}")
+        pipe = redis.pipeline()
+        pipe.smembers(key)
+        pipe.delete(key)
+        members, _ = pipe.execute()
+        return sorted(int(member) for member in members)
+
+    @staticmethod
+    def related_entries(entry, limit=3):
+        """Stored neighbours of an entry, best first (single indexed lookup)"""
+        Entry = apps.get_model('diary', 'Entry')
+        return Entry.objects.filter(
+            neighbour_of__entry=entry
+        ).order_by('neighbour_of__rank').prefetch_related('photos')[:limit]
@@ -0,0 +1,96 @@
+import logging
+import uuid
+from typing import Dict, Optional, Tuple
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..cache import CacheKeys
+
+logger = logging.getLogger(__name__)
+
+JOB_TIMEOUT = 60 * 60  # Job status kept for an hour
+# A queued or running job is reused for repeat clicks until it finishes or this expires
+ACTIVE_JOB_TIMEOUT = 15 * 60
+ACTIVE_STATUSES = ('queued', 'running', 'retrying')
+
+
+class SummaryJobService:
+    """
+    Status records for background summary regeneration.
+
+    Each request gets a job record in the cache that the Celery task
+    updates as it runs and that the status endpoint returns. A per-entry
+    pointer to the active job makes repeated clicks return the job already
+    in flight instead of queuing another LLM call.
+    """
+
+    @staticmethod
+    def get_job(job_id) -> Optional[Dict]:
+        return cache.get(CacheKeys.SUMMARY_JOB.format(job_id=job_id))
+
+    @staticmethod
+    def save_job(job):
+        cache.set(CacheKeys.SUMMARY_JOB.format(job_id=job['job_id']), job, JOB_TIMEOUT)
+
+    @staticmethod
+    def update_job(job_id, **fields) -> Optional[Dict]:
+        job = SummaryJobService.get_job(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        SummaryJobService.save_job(job)
+        if job['status'] not in ACTIVE_STATUSES:
+            # Finished: the next click starts a fresh job
+            active_key = CacheKeys.SUMMARY_JOB_ENTRY.format(entry_id=job['entry_id'])
+            if cache.get(active_key) == job_id:
+                cache.delete(active_key)
+        return job
+
+    @staticmethod
+    def enqueue(entry) -> Tuple[Dict, bool]:
+        """
+        Queue summary regeneration for an entry.
+
+        Returns:
+            tuple: (job, created) - created is False when an active job was reused
+        """
+        from ..tasks import generate_entry_summary_async
+
+        active_key = CacheKeys.SUMMARY_JOB_ENTRY.format(entry_id=entry.id)
+        job_id = uuid.uuid4().hex
+        if not cache.add(active_key, job_id, ACTIVE_JOB_TIMEOUT):
+            existing = SummaryJobService.get_job(cache.get(active_key))
+            if existing and existing['status'] in ACTIVE_STATUSES:
+                return existing, False
+            # Stale pointer (job expired or finished without clearing it)
+            cache.set(active_key, job_id, ACTIVE_JOB_TIMEOUT)
+
+        job = {
+            'job_id': job_id,
+            'user_id': entry.user_id,
+            'entry_id': entry.id,
+            'status': 'queued',
+            'summary': None,
+            'error': None,
+            'created_at': timezone.now().isoformat(),
+        }
+        SummaryJobService.save_job(job)
+
+        try:
+            generate_entry_summary_async.apply_async((entry.id, job_id), retry=False)
+        except Exception as e:
+            logger.error(f"Could not queue summary for entry {entry.id}: {e}")
+            SummaryJobService.update_job(job_id, status='failed', error='Could not queue the summary')
+            raise
+
+        # In eager mode (CELERY_EAGER=1) the task has already run
+        return SummaryJobService.get_job(job_id) or job, True
+
+    @staticmethod
+    def public_job(job: Dict) -> Dict:
+        """Job fields safe to return to the client"""
+        return {
+            key: job.get(key)
+            for key in ('job_id', 'entry_id', 'status', 'summary', 'error', 'created_at', 'finished_at')
+        }
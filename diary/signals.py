@@ -1,7 +1,18 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import UserProfile, Entry, Tag, WalletSession, Web3Nonce
+from django.conf import settings
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from .models import (
+    UserProfile, Entry, Tag, WalletSession, Web3Nonce, UserWritingStats, UserActivityMap, RelatedEntry,
+    EntryPhoto, Journal
+)
+from .cache import CacheService
+from .services.search_service import SearchService
+from .services.similarity_service import SimilarityService
+from .services.image_service import ImageService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -40,27 +51,330 @@ def manage_user_profile(sender, instance, created, **kwargs):
 # Journal Entry Signals
 # ============================================================================
 
-@receiver(post_save, sender=Entry)
-def update_tag_usage_count(sender, instance, created, **kwargs):
-    """Update usage count for tags when an entry is saved."""
-    if created:
-        # Update usage count for all tags associated with this entry
-        for tag in instance.tags.all():
-            tag.update_usage_count()
-        
-        logger.info(f"Updated tag usage counts for new entry: {instance.title}")
+def _schedule_tag_usage_delta(tag_ids, delta):
+    """Apply a usage delta to a set of tags (one UPDATE) once the transaction commits."""
+    tag_ids = list(tag_ids)
+    if not tag_ids or not delta:
+        return
+
+    def apply():
+        try:
+            Tag.apply_usage_delta(tag_ids, delta)
+        except Exception as e:
+            logger.error(f"Error applying tag usage delta {delta} to tags {tag_ids}: {str(e)}")
+
+    transaction.on_commit(apply)
+
+@receiver(m2m_changed, sender=Entry.tags.through)
+def update_tag_usage_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Tag.usage_count in step with entry/tag links using F() deltas."""
+    through = Entry.tags.through
+    try:
+        if action == 'pre_remove':
+            # pk_set may name links that don't exist; only count the real ones
+            if reverse:
+                instance._usage_removed = through.objects.filter(tag_id=instance.pk, entry_id__in=pk_set).count()
+            else:
+                instance._usage_removed = list(
+                    through.objects.filter(entry_id=instance.pk, tag_id__in=pk_set).values_list('tag_id', flat=True)
+                )
+        elif action == 'pre_clear':
+            if reverse:
+                instance._usage_removed = through.objects.filter(tag_id=instance.pk).count()
+            else:
+                instance._usage_removed = list(
+                    through.objects.filter(entry_id=instance.pk).values_list('tag_id', flat=True)
+                )
+        elif action == 'post_add' and pk_set:
+            # post_add only reports links that were actually created
+            if reverse:
+                _schedule_tag_usage_delta([instance.pk], len(pk_set))
+            else:
+                _schedule_tag_usage_delta(pk_set, 1)
+        elif action in ('post_remove', 'post_clear'):
+            removed = getattr(instance, '_usage_removed', None)
+            instance._usage_removed = None
+            if reverse and removed:
+                _schedule_tag_usage_delta([instance.pk], -removed)
+            elif not reverse and removed:
+                _schedule_tag_usage_delta(removed, -1)
+    except Exception as e:
+        logger.error(f"Error updating tag usage for {action}: {str(e)}")
+
+@receiver(pre_delete, sender=Entry)
+def snapshot_tags_on_delete(sender, instance, **kwargs):
+    """Remember the entry's tags; the cascade removes the links without m2m_changed."""
+    try:
+        instance._usage_removed = list(instance.tags.values_list('id', flat=True))
+    except Exception as e:
+        logger.error(f"Error reading tags of entry {instance.pk} before deletion: {str(e)}")
 
 @receiver(post_delete, sender=Entry)
 def cleanup_tag_usage_on_delete(sender, instance, **kwargs):
-    """Update tag usage counts when an entry is deleted."""
+    """Decrement usage counts of the deleted entry's tags."""
+    _schedule_tag_usage_delta(getattr(instance, '_usage_removed', None) or [], -1)
+
+# ============================================================================
+# Writing Stats Rollup Signals
+# ============================================================================
+
+STATS_FIELDS = ('word_count', 'mood', 'mood_rating', 'created_at')
+
+@receiver(pre_save, sender=Entry)
+def snapshot_entry_stats(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Remember the persisted stats fields so post_save can apply a delta."""
+    instance._stats_snapshot = None
+    if raw or not instance.pk:
+        return
+    if update_fields is not None and not set(update_fields) & set(STATS_FIELDS):
+        instance._stats_snapshot = False  # Nothing the rollup tracks is changing
+        return
+    instance._stats_snapshot = Entry.objects.filter(pk=instance.pk).values(*STATS_FIELDS).first()
+
+@receiver(post_save, sender=Entry)
+def update_writing_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    """Apply the entry's contribution (or the change to it) to the user's rollup."""
+    if raw:
+        return
+    try:
+        old = getattr(instance, '_stats_snapshot', None)
+        if old is False:
+            return
+
+        if created or old is None:
+            UserWritingStats.apply_delta(
+                instance.user_id,
+                entries=1,
+                words=instance.word_count,
+                rating_total=instance.mood_rating or 0,
+                rating_count=1 if instance.mood_rating is not None else 0,
+                moods_added=[instance.mood],
+                added_at=instance.created_at,
+            )
+            return
+
+        mood_changed = old['mood'] != instance.mood
+        moved = old['created_at'] != instance.created_at
+        if (old['word_count'] == instance.word_count and not mood_changed and not moved
+                and old['mood_rating'] == instance.mood_rating):
+            return
+
+        UserWritingStats.apply_delta(
+            instance.user_id,
+            words=instance.word_count - old['word_count'],
+            rating_total=(instance.mood_rating or 0) - (old['mood_rating'] or 0),
+            rating_count=(instance.mood_rating is not None) - (old['mood_rating'] is not None),
+            moods_added=[instance.mood] if mood_changed else (),
+            moods_removed=[old['mood']] if mood_changed else (),
+            added_at=instance.created_at if moved else None,
+            removed_at=old['created_at'] if moved else None,
+        )
+    except Exception as e:
+        logger.error(f"Error updating writing stats for entry {instance.pk}: {str(e)}")
+
+@receiver(post_delete, sender=Entry)
+def update_writing_stats_on_delete(sender, instance, **kwargs):
+    """Remove the deleted entry's contribution from the user's rollup."""
+    try:
+        UserWritingStats.apply_delta(
+            instance.user_id,
+            entries=-1,
+            words=-instance.word_count,
+            rating_total=-(instance.mood_rating or 0),
+            rating_count=-1 if instance.mood_rating is not None else 0,
+            moods_removed=[instance.mood],
+            removed_at=instance.created_at,
+        )
+    except Exception as e:
+        logger.error(f"Error updating writing stats after entry deletion: {str(e)}")
+
+# ============================================================================
+# Daily Activity Bitmap Signals
+# ============================================================================
+
+def _clear_day_if_empty(user_id, day):
+    """Clear a day's activity bit once no entries remain on it."""
+    start = timezone.make_aware(datetime.combine(day, time.min)) if settings.USE_TZ else datetime.combine(day, time.min)
+    if Entry.objects.filter(user_id=user_id, created_at__gte=start, created_at__lt=start + timedelta(days=1)).exists():
+        return None
+    return UserActivityMap.set_day(user_id, day, active=False)
+
+@receiver(post_save, sender=Entry)
+def update_activity_map_on_save(sender, instance, created, raw=False, **kwargs):
+    """Set the bit for the entry's day (and clear the old day if it moved)."""
+    if raw:
+        return
+    try:
+        old = getattr(instance, '_stats_snapshot', None)
+        new_day = UserActivityMap.day_of(instance.created_at)
+        if created or old is None:
+            activity = UserActivityMap.set_day(instance.user_id, new_day)
+        elif old is False or UserActivityMap.day_of(old['created_at']) == new_day:
+            return
+        else:
+            _clear_day_if_empty(instance.user_id, UserActivityMap.day_of(old['created_at']))
+            activity = UserActivityMap.set_day(instance.user_id, new_day)
+
+        if activity is not None:
+            CacheService.store_activity_map(activity)
+    except Exception as e:
+        logger.error(f"Error updating activity map for entry {instance.pk}: {str(e)}")
+
+@receiver(post_delete, sender=Entry)
+def update_activity_map_on_delete(sender, instance, **kwargs):
+    """Clear the entry's day when it was the last entry written that day."""
+    try:
+        activity = _clear_day_if_empty(instance.user_id, UserActivityMap.day_of(instance.created_at))
+        if activity is not None:
+            CacheService.store_activity_map(activity)
+    except Exception as e:
+        logger.error(f"Error updating activity map after entry deletion: {str(e)}")
+
+# ============================================================================
+# Search Index Signals
+# ============================================================================
+
+SEARCH_FIELDS = ('title', 'content', 'summary', 'mood', 'created_at')
+
+@receiver(post_save, sender=Entry)
+def update_search_document_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Keep the entry's search document in step with its searchable fields."""
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    try:
+        # A brand new entry has no tags yet; m2m_changed fills them in
+        SearchService.index_entry(instance, tag_names=[] if created else None)
+    except Exception as e:
+        logger.error(f"Error indexing entry {instance.pk} for search: {str(e)}")
+
+@receiver(m2m_changed, sender=Entry.tags.through)
+def update_search_document_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    """Refresh the tag column when tags are added to or removed from entries."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    try:
+        if not reverse:
+            SearchService.refresh_tags(instance)
+        elif action != 'post_clear' and pk_set:
+            # tag.entries.add/remove(...) - instance is the tag
+            for entry in Entry.objects.filter(pk__in=pk_set):
+                SearchService.refresh_tags(entry)
+    except Exception as e:
+        logger.error(f"Error refreshing search tags: {str(e)}")
+
+# ============================================================================
+# Related Entries Signals
+# ============================================================================
+
+SIMILARITY_FIELDS = ('title', 'content')
+
+def _schedule_related_refresh(user_id, entry_ids):
+    """
+    Add entries to the user's pending related-entries refresh once the
+    transaction commits; with Redis, one delayed task per user handles
+    everything that changed in the meantime.
+    """
+    entry_ids = list(entry_ids)
+
+    def enqueue():
+        try:
+            from .tasks import refresh_related_entries  # tasks imports services; avoid an import cycle
+            if not SimilarityService.queue_refresh(user_id, entry_ids):
+                return  # A refresh is already scheduled and will pick these up
+            try:
+                # No publish retries: a missing broker must not stall the request
+                refresh_related_entries.apply_async(
+                    (user_id, entry_ids), countdown=SimilarityService.REFRESH_DELAY, retry=False
+                )
+            except Exception:
+                # Let the next change schedule the refresh again
+                SimilarityService.unschedule_refresh(user_id)
+                raise
+        except Exception as e:
+            logger.error(f"Error queueing related entries refresh for user {user_id}: {str(e)}")
+
+    transaction.on_commit(enqueue)
+
+@receiver(pre_save, sender=Entry)
+def snapshot_similarity_text(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Remember the persisted title and content so post_save can skip saves that keep them."""
+    instance._similarity_snapshot = None
+    if raw or not instance.pk:
+        return
+    if update_fields is not None and not set(update_fields) & set(SIMILARITY_FIELDS):
+        return
+    instance._similarity_snapshot = Entry.objects.filter(pk=instance.pk).values_list(*SIMILARITY_FIELDS).first()
+
+@receiver(post_save, sender=Entry)
+def refresh_related_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Refresh neighbours when an entry's text changes."""
+    if raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(SIMILARITY_FIELDS):
+        return
+    snapshot = getattr(instance, '_similarity_snapshot', None)
+    if not created and snapshot == tuple(getattr(instance, field) for field in SIMILARITY_FIELDS):
+        return
+    _schedule_related_refresh(instance.user_id, [instance.pk])
+
+@receiver(pre_delete, sender=Entry)
+def refresh_related_on_delete(sender, instance, **kwargs):
+    """Entries that listed the deleted one as a neighbour need a replacement."""
     try:
-        # Update usage count for all tags that were associated with this entry
-        for tag in instance.tags.all():
-            tag.update_usage_count()
-        
-        logger.info(f"Updated tag usage counts after deleting entry: {instance.title}")
+        referrers = list(RelatedEntry.objects.filter(related=instance).values_list('entry_id', flat=True))
+        _schedule_related_refresh(instance.user_id, [instance.pk, *referrers])
     except Exception as e:
-        logger.error(f"Error updating tag usage after entry deletion: {str(e)}")
+        logger.error(f"Error scheduling related entries refresh for deleted entry {instance.pk}: {str(e)}")
+
+@receiver(m2m_changed, sender=Entry.tags.through)
+def refresh_related_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Tag co-occurrence is part of the similarity, so tag edits refresh neighbours too."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action != 'post_clear' and not pk_set:
+        return  # Nothing was actually linked or unlinked
+    if not reverse:
+        _schedule_related_refresh(instance.user_id, [instance.pk])
+    elif pk_set:
+        _schedule_related_refresh(instance.user_id, pk_set)
+
+# ============================================================================
+# Image Derivative Signals
+# ============================================================================
+
+@receiver(post_save, sender=EntryPhoto)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=Journal)
+def schedule_image_derivatives(sender, instance, raw=False, **kwargs):
+    """Generate thumbnails and image metadata in the background when the source image changes."""
+    if raw or not instance.needs_derivatives:
+        return
+
+    model_label = sender._meta.label
+
+    def enqueue():
+        try:
+            from .tasks import generate_image_derivatives
+            generate_image_derivatives.apply_async((model_label, instance.pk), retry=False)
+        except Exception as e:
+            logger.error(f"Error queueing image derivatives for {model_label} {instance.pk}: {str(e)}")
+
+    transaction.on_commit(enqueue)
+
+@receiver(post_delete, sender=EntryPhoto)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=Journal)
+def delete_image_derivatives(sender, instance, **kwargs):
+    """Derivative files are owned by the row, so remove them with it."""
+    def delete():
+        try:
+            ImageService.delete_for(instance)
+        except Exception as e:
+            logger.error(f"Error deleting image derivatives for {sender._meta.label} {instance.pk}: {str(e)}")
+
+    transaction.on_commit(delete)
 
 # ============================================================================
 # Web3 Authentication Signals
@@ -69,7 +383,7 @@ def cleanup_tag_usage_on_delete(sender, instance, **kwargs):
 @receiver(post_save, sender=User)
 def handle_web3_user_creation(sender, instance, created, **kwargs):
     """Handle Web3-specific setup for new users."""
-    if created and instance.wallet_address:
+    if created and getattr(instance, 'wallet_address', None):
         try:
             # Log Web3 user creation
             logger.info(f"New Web3 user created: {instance.username} with wallet {instance.wallet_address}")
@@ -103,10 +417,17 @@ def log_nonce_cleanup(sender, instance, **kwargs):
 # ============================================================================
 
 @receiver(post_save, sender=Tag)
-def handle_tag_creation(sender, instance, created, **kwargs):
+def handle_tag_creation(sender, instance, created, update_fields=None, **kwargs):
     """Handle tag creation and updates."""
     if created:
         logger.info(f"New tag created: {instance.name} by user {instance.user.username}")
+    elif update_fields is None or 'name' in update_fields:
+        # Renames show up in the tag column of every tagged entry's document
+        try:
+            for entry in instance.entries.all():
+                SearchService.refresh_tags(entry)
+        except Exception as e:
+            logger.error(f"Error refreshing search tags for tag {instance.name}: {str(e)}")
 
 @receiver(post_delete, sender=Tag)
 def handle_tag_deletion(sender, instance, **kwargs):
@@ -116,25 +437,6 @@ def handle_tag_deletion(sender, instance, **kwargs):
     except Exception as e:
         logger.error(f"Error handling tag deletion: {str(e)}")
 
-# ============================================================================
-# User Activity Signals
-# ============================================================================
-
-@receiver(post_save, sender=Entry)
-def update_user_streak(sender, instance, created, **kwargs):
-    """Update user streak when a new entry is created."""
-    if created:
-        try:
-            user = instance.user
-            # Update streak logic here
-            if hasattr(user, 'streak_days'):
-                # You can implement streak calculation logic here
-                # For now, just log the activity
-                logger.info(f"Entry created by {user.username}, checking streak status")
-                
-        except Exception as e:
-            logger.error(f"Error updating user streak: {str(e)}")
-
 # ============================================================================
 # Marketplace Signals (Optional - if marketplace models exist)
 # ============================================================================
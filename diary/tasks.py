@@ -1,54 +1,94 @@
 # diary/tasks.py - Complete optimized background task processing
 from celery import shared_task
+from celery.signals import task_prerun, task_postrun
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Count, Sum, Avg, F
+from django.db.models import Count, Sum, Avg, F, Max, Q
+from django.conf import settings
 from django.core.cache import cache
 from datetime import timedelta
 import logging
+import random
 import time
 
 from .models import (
-    Entry, UserInsight, Journal, Biography, AnalyticsEvent,
+    Entry, UserInsight, Journal, AnalyticsEvent,
     AIGenerationLog, JournalAnalytics, Tag, JournalCompilationSession
 )
 from .services.ai_service import AIService
-from .views.marketplace_service import MarketplaceService
+from .services.ai_cache import AIResponseCache
+from .services.llm_client import get_llm_client
+from .services.rate_limiter import RateLimitExceeded, lane_for_queue, reset_lane, set_lane
+from .services.summary_jobs import SummaryJobService
+from .services.similarity_service import SimilarityService
+from .services.chapter_clustering import ChapterClusteringService
+from .services.import_service import ImportService
+from .services.export_service import ExportService
+from .services.image_service import ImageService
 from .cache import CacheService
 
+try:
+    from .views.marketplace_service import MarketplaceService
+except ImportError:
+    # Marketplace service not available yet; payout tasks log and skip
+    MarketplaceService = None
+
 logger = logging.getLogger(__name__)
 
 # ========================================================================
 # AI CONTENT GENERATION TASKS
 # ========================================================================
 
+# LLM calls made by tasks routed to a background queue use the background rate-limit lane
+_lane_tokens = {}
+
+
+@task_prerun.connect
+def set_llm_lane(task_id=None, task=None, **kwargs):
+    queue = settings.CELERY_TASK_ROUTES.get(task.name, {}).get('queue')
+    _lane_tokens[task_id] = set_lane(lane_for_queue(queue))
+
+
+@task_postrun.connect
+def reset_llm_lane(task_id=None, **kwargs):
+    token = _lane_tokens.pop(task_id, None)
+    if token is not None:
+        reset_lane(token)
+
+
+def retry_ai_task(task, exc, countdown, **kwargs):
+    """
+    Retry an AI task. Rate-limited work is rescheduled for when the limiter
+    expects capacity (with jitter, up to background_max_deferrals times);
+    other failures back off exponentially from countdown.
+    """
+    if isinstance(exc, RateLimitExceeded):
+        return task.retry(
+            exc=exc, countdown=exc.retry_after + random.uniform(1, 15),
+            max_retries=settings.LLM_RATE_LIMITS['background_max_deferrals'], **kwargs
+        )
+    return task.retry(exc=exc, countdown=countdown * (2 ** task.request.retries), **kwargs)
+
 @shared_task(bind=True, max_retries=3)
 def generate_insights_async(self, user_id):
-    """Generate user insights in background with caching optimization"""
+    """Update user insights in background from the entries written since the last run"""
     try:
         user = User.objects.get(id=user_id)
 
-        # OPTIMIZED: Use select_related and prefetch_related for better performance
-        entries = Entry.objects.filter(user=user).select_related(
-            'chapter'
-        ).prefetch_related('tags').order_by('-created_at')[:20]
-
-        if not entries.exists():
-            logger.info(f"No entries found for user {user.username}")
-            return "No entries to analyze"
-
-        # Clear old insights
-        UserInsight.objects.filter(user=user).delete()
-
-        # Generate new insights
-        insights = AIService.generate_insights(user, entries)
+        result = AIService.update_insights(user)
+        if not result['new_entries']:
+            logger.info(f"No new entries to analyze for user {user.username}")
+            return "No new entries to analyze"
 
         # ENHANCED: Invalidate user caches for fresh data
         CacheService.invalidate_user_insights(user)
         CacheService.invalidate_user_stats(user)
 
-        logger.info(f"Generated {len(insights)} insights for user {user.username}")
-        return f"Generated {len(insights)} insights"
+        logger.info(
+            f"Updated insights for user {user.username} from {result['new_entries']} new entries: "
+            f"{result['created']} created, {result['updated']} updated, {result['retired']} retired"
+        )
+        return f"Analyzed {result['new_entries']} new entries"
 
     except User.DoesNotExist:
         logger.error(f"User {user_id} not found")
@@ -56,7 +96,7 @@ def generate_insights_async(self, user_id):
     except Exception as exc:
         logger.error(f"Failed to generate insights for user {user_id}: {exc}")
         # Retry with exponential backoff
-        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+        raise retry_ai_task(self, exc, 60)
 
 @shared_task(bind=True, max_retries=3)
 def generate_biography_async(self, user_id, chapter=None):
@@ -77,27 +117,170 @@ def generate_biography_async(self, user_id, chapter=None):
         return "User not found"
     except Exception as exc:
         logger.error(f"Failed to generate biography for user {user_id}: {exc}")
-        raise self.retry(exc=exc, countdown=60 * (2 ** self.request.retries))
+        raise retry_ai_task(self, exc, 60)
 
 @shared_task(bind=True, max_retries=3)
-def generate_entry_summary_async(self, entry_id):
-    """Generate entry summary in background with optimized queries"""
+def generate_entry_summary_async(self, entry_id, job_id=None):
+    """Generate entry summary in background with optimized queries, reporting to a summary job if given"""
+    if job_id:
+        SummaryJobService.update_job(job_id, status='running')
     try:
-        # OPTIMIZED: Use select_related to fetch user and chapter data efficiently
-        entry = Entry.objects.select_related('user', 'chapter').get(id=entry_id)
-        summary = AIService.generate_entry_summary(entry)
+        # OPTIMIZED: Use select_related to fetch user data efficiently
+        entry = Entry.objects.select_related('user').get(id=entry_id)
+        summary = AIService.generate_entry_summary(entry, raise_errors=True)
 
         # ENHANCED: Invalidate user stats cache since entry was updated
         CacheService.invalidate_user_stats(entry.user)
 
+        if job_id:
+            SummaryJobService.update_job(
+                job_id, status='completed', summary=summary, finished_at=timezone.now().isoformat()
+            )
         logger.info(f"Generated summary for entry {entry.id}")
         return "Summary generated successfully"
 
     except Entry.DoesNotExist:
         logger.error(f"Entry {entry_id} not found")
+        if job_id:
+            SummaryJobService.update_job(
+                job_id, status='failed', error='Entry not found', finished_at=timezone.now().isoformat()
+            )
         return "Entry not found"
     except Exception as exc:
         logger.error(f"Failed to generate summary for entry {entry_id}: {exc}")
+        if job_id:
+            limit = (settings.LLM_RATE_LIMITS['background_max_deferrals']
+                     if isinstance(exc, RateLimitExceeded) else self.max_retries)
+            if self.request.retries >= limit:
+                SummaryJobService.update_job(
+                    job_id, status='failed', error='Could not generate a summary',
+                    finished_at=timezone.now().isoformat()
+                )
+            else:
+                SummaryJobService.update_job(job_id, status='retrying')
+        raise retry_ai_task(self, exc, 30)
+
+@shared_task(bind=True, max_retries=3)
+def summarize_entries_batch(self, user_id, entry_ids):
+    """Summarize a chunk of entries with batched prompts; retries only the entries that failed"""
+    try:
+        entries = list(Entry.objects.filter(user_id=user_id, id__in=entry_ids).order_by('created_at'))
+        summaries = AIService.generate_entry_summaries(entries)
+        if summaries:
+            CacheService.invalidate_user_stats(entries[0].user)
+    except RateLimitExceeded as exc:
+        # Summaries written before the limit was hit are kept; reschedule the rest
+        remaining = list(
+            Entry.objects.filter(user_id=user_id, id__in=entry_ids)
+            .filter(Q(summary__isnull=True) | Q(summary=''))
+            .values_list('id', flat=True)
+        )
+        logger.info(f"Rate limited summarizing entries for user {user_id}; {len(remaining)} rescheduled")
+        raise retry_ai_task(self, exc, 30, args=(user_id, remaining))
+    except Exception as exc:
+        logger.error(f"Failed to summarize entries for user {user_id}: {exc}")
+        raise self.retry(exc=exc, countdown=30 * (2 ** self.request.retries))
+
+    missing = [entry.id for entry in entries if entry.id not in summaries]
+    logger.info(f"Summarized {len(summaries)} entries for user {user_id}, {len(missing)} missing")
+    if not missing:
+        return f"Summarized {len(summaries)} entries"
+    if self.request.retries >= self.max_retries:
+        logger.error(f"Giving up on summaries for entries {missing} of user {user_id}")
+        return f"Summarized {len(summaries)} entries, {len(missing)} failed"
+    raise self.retry(args=(user_id, missing), countdown=30 * (2 ** self.request.retries))
+
+@shared_task
+def summarize_user_backlog(user_id):
+    """Queue batched summaries for all of a user's entries that have none yet"""
+    pending = list(
+        Entry.objects.filter(user_id=user_id)
+        .filter(Q(summary__isnull=True) | Q(summary=''))
+        .order_by('created_at')
+        .values_list('id', flat=True)
+    )
+    chunk = settings.AI_SUMMARY_TASK_CHUNK
+    for start in range(0, len(pending), chunk):
+        summarize_entries_batch.delay(user_id, pending[start:start + chunk])
+
+    logger.info(f"Queued {len(pending)} entries of user {user_id} for batched summaries")
+    return f"Queued {len(pending)} entries"
+
+# ========================================================================
+# RELATED ENTRIES (SIMILARITY INDEX) TASKS
+# ========================================================================
+
+@shared_task(bind=True, max_retries=3, ignore_result=True)
+def refresh_related_entries(self, user_id, entry_ids=None):
+    """Incrementally update the related-entries index for the given and the user's pending changed entries"""
+    # The ids travel with the task too, so a cache the worker can't see costs extra refreshes, not lost ones
+    entry_ids = sorted(set(entry_ids or []) | set(SimilarityService.take_pending(user_id)))
+    if not entry_ids:
+        return "Nothing to refresh"
+    try:
+        refreshed = SimilarityService.refresh_entries(user_id, entry_ids)
+        logger.info(f"Refreshed related entries for {refreshed} entries of user {user_id}")
+        return f"Refreshed {refreshed} entries"
+
+    except Exception as exc:
+        logger.error(f"Failed to refresh related entries for user {user_id}: {exc}")
+        raise self.retry(exc=exc, args=(user_id, entry_ids), countdown=30 * (2 ** self.request.retries))
+
+@shared_task
+def rebuild_related_entries(user_id=None):
+    """Full rebuild of the related-entries index (one user, or every user with entries)"""
+    try:
+        if user_id is not None:
+            user_ids = [user_id]
+        else:
+            user_ids = Entry.objects.values_list('user_id', flat=True).distinct()
+
+        rebuilt = 0
+        for uid in user_ids:
+            try:
+                SimilarityService.rebuild_user(uid)
+                rebuilt += 1
+            except Exception as user_error:
+                logger.error(f"Failed to rebuild related entries for user {uid}: {user_error}")
+
+        logger.info(f"Rebuilt related entries for {rebuilt} users")
+        return f"Rebuilt related entries for {rebuilt} users"
+
+    except Exception as exc:
+        logger.error(f"Failed to rebuild related entries: {exc}")
+        raise exc
+
+# ========================================================================
+# BULK IMPORT TASKS
+# ========================================================================
+
+@shared_task(bind=True, ignore_result=True)
+def import_entries_async(self, job_id):
+    """Run a bulk entry import; progress is published on the job record"""
+    try:
+        job = ImportService.run_job(job_id)
+        logger.info(f"Import job {job_id} finished: {job['imported']} imported, {job['skipped']} skipped")
+        return f"Imported {job['imported']} entries"
+
+    except Exception as exc:
+        # Not retried: batches already committed would be imported twice
+        logger.error(f"Import job {job_id} failed: {exc}")
+        return f"Import failed: {exc}"
+
+# ========================================================================
+# IMAGE PROCESSING TASKS
+# ========================================================================
+
+@shared_task(bind=True, max_retries=3, ignore_result=True)
+def generate_image_derivatives(self, model_label, pk):
+    """Build thumbnail/medium derivatives and metadata for an uploaded image"""
+    try:
+        available = ImageService.generate_for(model_label, pk)
+        logger.info(f"Generated image derivatives for {model_label} {pk} (available: {available})")
+        return available
+
+    except Exception as exc:
+        logger.error(f"Failed to generate image derivatives for {model_label} {pk}: {exc}")
         raise self.retry(exc=exc, countdown=30 * (2 ** self.request.retries))
 
 # ========================================================================
@@ -107,6 +290,10 @@ def generate_entry_summary_async(self, entry_id):
 @shared_task
 def process_monthly_payouts():
     """Process monthly payouts to authors with enhanced logging"""
+    if MarketplaceService is None:
+        logger.warning("Marketplace service not available, skipping monthly payouts")
+        return "Skipped: marketplace service not available"
+
     try:
         # OPTIMIZED: Get authors with published journals using select_related
         authors = User.objects.filter(
@@ -268,10 +455,16 @@ def cleanup_old_ai_logs():
     try:
         cutoff_date = timezone.now() - timedelta(days=30)
 
-        # Delete old AI logs
-        deleted_count, _ = AIGenerationLog.objects.filter(
-            created_at__lt=cutoff_date
-        ).delete()
+        # Delete old AI logs in batches so no single statement locks the table for long
+        deleted_count = 0
+        while True:
+            batch_ids = list(AIGenerationLog.objects.filter(
+                created_at__lt=cutoff_date
+            ).order_by().values_list('id', flat=True)[:5000])
+            if not batch_ids:
+                break
+            deleted, _ = AIGenerationLog.objects.filter(id__in=batch_ids).delete()
+            deleted_count += deleted
 
         logger.info(f"Cleaned up {deleted_count} old AI generation logs")
         return f"Cleaned up {deleted_count} AI logs"
@@ -299,24 +492,12 @@ def cleanup_old_analytics_events():
 
 @shared_task
 def update_tag_usage_counts():
-    """Update usage counts for all tags efficiently"""
+    """Reconcile tag usage counts; signals keep them current, this only corrects drift"""
     try:
-        # OPTIMIZED: Batch update tag usage counts
-        tags = Tag.objects.all()
-        updated_count = 0
-
-        for tag in tags:
-            try:
-                old_count = tag.usage_count
-                tag.update_usage_count()
-
-                if tag.usage_count != old_count:
-                    updated_count += 1
+        # OPTIMIZED: One set-based UPDATE touching only tags whose count drifted
+        updated_count = Tag.reconcile_usage_counts()
 
-            except Exception as tag_error:
-                logger.error(f"Failed to update usage count for tag {tag.id}: {tag_error}")
-
-        logger.info(f"Updated usage counts for {updated_count} tags")
+        logger.info(f"Reconciled usage counts for {updated_count} tags")
         return f"Updated {updated_count} tag usage counts"
 
     except Exception as exc:
@@ -388,11 +569,10 @@ def process_journal_compilation(session_id):
         session.save()
 
         # Get selected entries with optimized queries
-        entries = session.selected_entries.select_related('chapter').prefetch_related('tags').all()
+        entries = session.selected_entries.prefetch_related('tags').all()
 
-        # Generate analysis
-        from .views.journal_compiler import JournalAnalysisService
-        analysis = JournalAnalysisService.analyze_user_entries(session.user, entries)
+        # Local analysis (themes, dates, moods); chapters are assigned by clustering, not the LLM
+        analysis = ChapterClusteringService.analyze(entries)
 
         session.analysis_results = analysis
         session.status = 'structuring'
@@ -425,29 +605,26 @@ def process_journal_compilation(session_id):
 def generate_daily_insights_digest():
     """Generate daily insights digest for active users"""
     try:
-        # Find users who have written in the last 7 days
+        # Find users who have written in the last 7 days and have entries their insights haven't seen
         cutoff_date = timezone.now() - timedelta(days=7)
-        active_users = User.objects.filter(
+        active_user_ids = User.objects.filter(
             diary_entries__created_at__gte=cutoff_date
-        ).distinct()
+        ).annotate(
+            latest_entry_id=Max('diary_entries__id')
+        ).filter(
+            Q(insight_state__isnull=True) | Q(latest_entry_id__gt=F('insight_state__last_entry_id'))
+        ).values_list('id', flat=True)
 
         digest_count = 0
 
-        for user in active_users:
+        for user_id in active_user_ids:
             try:
-                # Check if user has recent insights
-                recent_insights = UserInsight.objects.filter(
-                    user=user,
-                    created_at__gte=timezone.now() - timedelta(days=30)
-                ).count()
-
-                # Generate insights if they don't have recent ones
-                if recent_insights < 3:
-                    generate_insights_async.delay(user.id)
-                    digest_count += 1
+                # Incremental: each run only analyzes the new entries
+                generate_insights_async.delay(user_id)
+                digest_count += 1
 
             except Exception as e:
-                logger.error(f"Failed to process digest for user {user.id}: {e}")
+                logger.error(f"Failed to process digest for user {user_id}: {e}")
                 continue
 
         logger.info(f"Queued insights generation for {digest_count} users")
@@ -490,41 +667,17 @@ def send_weekly_insights_emails():
 # UTILITY AND MONITORING TASKS
 # ========================================================================
 
-@shared_task
-def backup_user_data(user_id):
-    """Backup user data for export/migration"""
+# Large diaries (and zips with photos) outlast the default 10 minute limit
+@shared_task(soft_time_limit=3600, time_limit=3900)
+def backup_user_data(user_id, export_format='ndjson', incremental=False):
+    """Write a streaming export of a user's data to file storage"""
     try:
         user = User.objects.get(id=user_id)
 
-        # ENHANCED: Gather comprehensive user data
-        user_data = {
-            'user_info': {
-                'username': user.username,
-                'email': user.email,
-                'date_joined': user.date_joined.isoformat(),
-            },
-            'entries': list(Entry.objects.filter(user=user).values(
-                'title', 'content', 'mood', 'mood_rating', 'energy_level',
-                'created_at', 'word_count'
-            )),
-            'insights': list(UserInsight.objects.filter(user=user).values(
-                'insight_type', 'title', 'content', 'confidence_score',
-                'priority', 'created_at'
-            )),
-            'journals': list(Journal.objects.filter(author=user).values(
-                'title', 'description', 'is_published', 'price',
-                'date_published', 'journal_type', 'compilation_method'
-            )),
-            'chapters': list(user.life_chapters.values(
-                'title', 'description', 'color', 'start_date', 'end_date'
-            )),
-        }
+        export = ExportService.create_export(user, export_format, incremental)
+        export = ExportService.run_export(export.id)
 
-        # Store backup data
-        backup_key = f"user_backup_{user_id}_{timezone.now().strftime('%Y%m%d')}"
-        cache.set(backup_key, user_data, 86400 * 7)  # Store for 7 days
-
-        logger.info(f"Backed up data for user {user.username}")
+        logger.info(f"Backed up data for user {user.username} to {export.file.name}")
         return f"Backup completed for user {user_id}"
 
     except User.DoesNotExist:
@@ -534,6 +687,30 @@ def backup_user_data(user_id):
         logger.error(f"Failed to backup user {user_id}: {exc}")
         raise exc
 
+@shared_task(ignore_result=True, soft_time_limit=3600, time_limit=3900)
+def generate_user_export(export_id):
+    """Run an export requested through the API; status is kept on the export record"""
+    try:
+        export = ExportService.run_export(export_id)
+        return f"Exported {export.entry_count} entries"
+
+    except Exception as exc:
+        # Not retried: the export is marked failed and the user can request another
+        logger.error(f"User export {export_id} failed: {exc}")
+        return f"Export failed: {exc}"
+
+@shared_task
+def cleanup_expired_exports():
+    """Delete export files past their retention period"""
+    try:
+        deleted = ExportService.delete_expired()
+        logger.info(f"Deleted {deleted} expired user exports")
+        return f"Deleted {deleted} exports"
+
+    except Exception as exc:
+        logger.error(f"Failed to clean up expired exports: {exc}")
+        raise exc
+
 @shared_task
 def health_check():
     """Health check task to verify Celery is working"""
@@ -591,6 +768,8 @@ def generate_system_report():
                 'ai_logs_week': AIGenerationLog.objects.filter(
                     created_at__gte=timezone.now() - timedelta(days=7)
                 ).count(),
+                'response_cache': AIResponseCache.stats(),
+                'llm_circuit': get_llm_client().breaker.state(),
             },
             'timestamp': timezone.now().isoformat(),
         }
@@ -0,0 +1,48 @@
+import json
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from diary.models import Entry
+from diary.services.import_service import ImportService
+
+
+class ImportJobTests(TestCase):
+    """Background imports run from the stored upload to a finished job"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        storage = override_settings(MEDIA_ROOT=media_root)
+        storage.enable()
+        self.addCleanup(storage.disable)
+        self.user = get_user_model().objects.create_user(username='importer', password='x')
+
+    def run_import(self, name, content, fmt):
+        job = ImportService.create_job(self.user, SimpleUploadedFile(name, content), fmt)
+        self.assertTrue(default_storage.exists(job['path']))
+        return ImportService.run_job(job['job_id'], batch_size=2)
+
+    def assertCompleted(self, job, imported, skipped=0):
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual((job['imported'], job['skipped']), (imported, skipped))
+        self.assertEqual(job['bytes_read'], job['size'])
+        self.assertEqual(ImportService.get_job(job['job_id'])['status'], 'completed')
+        self.assertFalse(default_storage.exists(job['path']))
+        self.assertEqual(Entry.objects.filter(user=self.user).count(), imported)
+
+    def test_ndjson_job(self):
+        lines = [json.dumps({'title': f"Day {i}", 'content': f"Entry number {i}",
+                             'created_at': f"2024-01-0{i}T09:00:00Z"}) for i in range(1, 6)]
+        lines.insert(2, '{not json')
+        job = self.run_import('entries.ndjson', '\n'.join(lines).encode(), 'ndjson')
+        self.assertCompleted(job, imported=5, skipped=1)
+
+    def test_csv_job(self):
+        rows = ['title,content,created_at'] + [f"Day {i},Entry number {i},2024-02-0{i}T09:00:00Z" for i in range(1, 4)]
+        job = self.run_import('entries.csv', '\n'.join(rows).encode(), 'csv')
+        self.assertCompleted(job, imported=3)
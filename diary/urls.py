@@ -6,7 +6,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from .views import core
 from .views.core import CustomLoginView, CustomSignupView
-from .views.api import save_entry_api, user_stats, recent_entries
+from .views.api import save_entry_api, user_stats, recent_entries, activity_heatmap, entries_api, search_entries
 from .views import api
 from .views import web3_auth
 from . import views
@@ -48,7 +48,15 @@ urlpatterns = [
     path('api/save-generated-entry/', api.save_generated_entry, name='save_generated_entry'),
     path('api/save-entry/', save_entry_api, name='save_entry_api'),
     path('api/user-stats/', user_stats, name='user_stats'),
+    path('api/activity-heatmap/', activity_heatmap, name='activity_heatmap'),
     path('api/recent-entries/', recent_entries, name='recent_entries'),
+    path('api/entries/', entries_api, name='entries_api'),
+    path('api/search/', search_entries, name='search_entries'),
+    path('api/import/', api.import_entries_api, name='import_entries'),
+    path('api/import/<str:job_id>/', api.import_status, name='import_status'),
+    path('api/exports/', api.create_export_api, name='create_export'),
+    path('api/exports/<uuid:token>/', api.export_status, name='export_status'),
+    path('exports/<uuid:token>/download/', api.download_export, name='download_export'),
     path('api/web3/connect-wallet-session/', api.connect_wallet_session, name='connect_wallet_session'),
 
     # ============================================================================
@@ -100,10 +108,12 @@ urlpatterns = [
     # ============================================================================
     # Journal Generation & Management
     path('api/demo-journal/', views.demo_journal, name='demo_journal'),
+    path('api/demo-journal/stream/', views.demo_journal_stream, name='demo_journal_stream'),
     path('save-generated-entry/', views.save_generated_entry, name='save_generated_entry_alt'),
 
     # Entry Management API
     path('api/entry/<int:entry_id>/regenerate-summary/', views.regenerate_summary_ajax, name='regenerate_summary_ajax'),
+    path('api/summary-jobs/<str:job_id>/', views.summary_job_status, name='summary_job_status'),
 
     # ============================================================================
     # SMART JOURNAL COMPILER - API Endpoints
@@ -1,16 +1,13 @@
 import time
-import json
 import logging
 import re
-from datetime import datetime, timedelta
+from datetime import datetime
 
-import requests
-from requests.exceptions import Timeout, ConnectionError, RequestException
-from django.utils import timezone
-from django.conf import settings
+from requests.exceptions import Timeout, ConnectionError
 from django.apps import apps
 
 from .decorators import retry_on_failure
+from ..services.llm_client import get_llm_client
 
 logger = logging.getLogger(__name__)
 
@@ -33,23 +30,15 @@ def extract_json_from_text(text):
     # If all else fails, return the original text
     return text
 
-@retry_on_failure(max_retries=3, delay=1, backoff=2)
-def call_grok_api(journal_content, timeout=10):
-    """
-    Call the Grok API with retries, timeouts and better error handling
-    """
-    request_id = int(time.time() * 1000)  # Simple request ID for tracking
-    logger.info(f"API Request {request_id} started for content of length {len(journal_content)}")
-
-    try:
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {settings.GROK_API_KEY}',
-            'X-Request-ID': str(request_id)  # Add request ID for tracking
-        }
+JOURNAL_MODEL = 'llama-3.3-70b-versatile'
+JOURNAL_SYSTEM_PROMPT = 'You are a helpful journal assistant that transforms brief notes into thoughtful diary entries.'
+# Titles are generated from the start of the entry only
+TITLE_SOURCE_CHARS = 300
 
-        today = datetime.now().strftime("%B %d, %Y")  # Get current date
-        prompt = f"""
+def journal_entry_messages(journal_content):
+    """Chat messages turning a user's notes into a journal entry"""
+    today = datetime.now().strftime("%B %d, %Y")  # Get current date
+    prompt = f"""
         Transform the following daily activities into a reflective, well-written journal entry.
         Add emotional depth, insights, and reflection while staying true to the events mentioned.
 
@@ -60,44 +49,136 @@ def call_grok_api(journal_content, timeout=10):
         Write the entry in first person as if the user wrote it themselves, with a thoughtful, introspective tone.
         Include paragraphs for readability and natural flow.
         """
+    return [
+        {'role': 'system', 'content': JOURNAL_SYSTEM_PROMPT},
+        {'role': 'user', 'content': prompt}
+    ]
+
+def build_style_guide(user_preferences):
+    """Prompt instructions matching the user's writing preferences"""
+    # Build a personalized prompt based on preferences
+    style_guide = ""
+
+    # Writing style
+    if user_preferences['writing_style'] == 'reflective':
+        style_guide += "Write in a thoughtful, introspective tone with personal insights. "
+    elif user_preferences['writing_style'] == 'analytical':
+        style_guide += "Write in a logical, analytical tone with observations about patterns and causes. "
+    elif user_preferences['writing_style'] == 'creative':
+        style_guide += "Write in a creative, expressive tone with vivid descriptions and imagery. "
+    elif user_preferences['writing_style'] == 'concise':
+        style_guide += "Write concisely and to the point, focusing on key events and feelings. "
+    elif user_preferences['writing_style'] == 'detailed':
+        style_guide += "Include rich details and thorough descriptions of events, feelings, and surroundings. "
+    elif user_preferences['writing_style'] == 'poetic':
+        style_guide += "Include poetic language, metaphors, and a flowing, rhythmic writing style. "
+    elif user_preferences['writing_style'] == 'humorous':
+        style_guide += "Incorporate gentle humor and a lighthearted tone where appropriate. "
+
+    # Emotional tone
+    if user_preferences['tone'] == 'positive':
+        style_guide += "Emphasize positive aspects and silver linings in events. "
+    elif user_preferences['tone'] == 'balanced':
+        style_guide += "Balance both positive and challenging aspects of experiences. "
+    elif user_preferences['tone'] == 'realistic':
+        style_guide += "Take a realistic, pragmatic approach to describing events. "
+    elif user_preferences['tone'] == 'growth':
+        style_guide += "Focus on lessons learned and personal growth opportunities. "
+
+    # Focus areas
+    if user_preferences['focus_areas']:
+        areas = ', '.join(user_preferences['focus_areas'])
+        style_guide += f"When relevant, emphasize these areas: {areas}. "
+
+    # Language complexity
+    if user_preferences['language_complexity'] == 'simple':
+        style_guide += "Use simple, clear language avoiding complex vocabulary. "
+    elif user_preferences['language_complexity'] == 'moderate':
+        style_guide += "Use moderately sophisticated language accessible to most readers. "
+    elif user_preferences['language_complexity'] == 'advanced':
+        style_guide += "Use rich, sophisticated vocabulary and complex sentence structures. "
+
+    # Metaphor frequency
+    if user_preferences['metaphor_frequency'] == 'minimal':
+        style_guide += "Use metaphors and analogies sparingly. "
+    elif user_preferences['metaphor_frequency'] == 'occasional':
+        style_guide += "Occasionally include metaphors or analogies to illustrate points. "
+    elif user_preferences['metaphor_frequency'] == 'frequent':
+        style_guide += "Frequently incorporate metaphors and analogies throughout the entry. "
+
+    # Questions
+    if user_preferences['include_questions']:
+        style_guide += "End with 1-2 thoughtful reflective questions related to the events. "
+    return style_guide
+
+def personalized_journal_messages(journal_content, user_preferences):
+    """Chat messages for a journal entry written in the user's preferred style"""
+    style_guide = build_style_guide(user_preferences)
+    prompt = f"""
+        Transform the following daily activities into a reflective, well-written journal entry.
+        Add emotional depth, insights, and reflection while staying true to the events mentioned.
 
-        payload = {
-            'model': 'llama-3.3-70b-versatile',
-            'messages': [
-                {'role': 'system', 'content': 'You are a helpful journal assistant that transforms brief notes into thoughtful diary entries.'},
-                {'role': 'user', 'content': prompt}
-            ],
-            'temperature': 0.7,
-            'max_tokens': 800
-        }
+        User's activities: {journal_content}
 
-        # Add proper timeout to prevent hanging requests
-        start_time = time.time()
-        response = requests.post(
-            'https://api.groq.com/openai/v1/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=timeout  # Add timeout
-        )
-        api_time = time.time() - start_time
+        Style guide: {style_guide}
 
-        # Log response time for performance monitoring
-        logger.info(f"API Request {request_id} completed in {api_time:.2f}s with status {response.status_code}")
+        Write the entry in first person as if the user wrote it themselves.
+        Include paragraphs for readability and natural flow.
+        """
+    return [
+        {'role': 'system', 'content': JOURNAL_SYSTEM_PROMPT},
+        {'role': 'user', 'content': prompt}
+    ]
+
+def title_messages(journal_entry):
+    """Chat messages asking for a short title for an entry"""
+    prompt = f"""
+        Create a short, engaging title for this journal entry:
 
-        if response.status_code != 200:
-            logger.error(f"API Request {request_id} failed: {response.status_code} - {response.text}")
-            raise RequestException(f"API returned status code {response.status_code}: {response.text}")
+        {journal_entry[:TITLE_SOURCE_CHARS]}...
 
-        response_data = response.json()
+        The title should be 5-7 words maximum, reflecting the main themes or feelings in the entry.
+        """
+    return [
+        {'role': 'system', 'content': 'You are a helpful writing assistant.'},
+        {'role': 'user', 'content': prompt}
+    ]
+
+def format_title(content):
+    """Clean a generated title and add today's date"""
+    title = content.strip('"').strip()
+    today = datetime.now().strftime("%B %d, %Y")
+    return f"{title} - {today}"
+
+def fallback_title(journal_entry):
+    """Title built from the entry itself when generation fails"""
+    today = datetime.now().strftime("%B %d, %Y")
+    words = journal_entry.split()[:5]
+    if words:
+        # Create a title from the first few words
+        return f"{' '.join(words)}... - {today}"
+    return f"Journal Entry - {today}"
 
-        # Validate response structure
-        if 'choices' not in response_data or not response_data['choices']:
-            error_msg = f"Invalid API response structure: {response_data}"
-            logger.error(f"API Request {request_id}: {error_msg}")
-            raise ValueError(error_msg)
+@retry_on_failure(max_retries=3, delay=1, backoff=2)
+def call_grok_api(journal_content, timeout=10):
+    """
+    Call the Grok API with retries, timeouts and better error handling
+    """
+    request_id = int(time.time() * 1000)  # Simple request ID for tracking
+    logger.info(f"API Request {request_id} started for content of length {len(journal_content)}")
 
-        # Extract the message content based on the API response structure
-        return response_data['choices'][0]['message']['content']
+    try:
+        # Pooled keep-alive connection; timeout is a deadline for the whole call
+        return get_llm_client().chat(
+            journal_entry_messages(journal_content),
+            model=JOURNAL_MODEL,
+            temperature=0.7,
+            max_tokens=800,
+            timeout=timeout,
+            request_id=request_id,
+            label='API Request',
+            cache_as='journal_entry',
+        )
 
     except Timeout:
         logger.error(f"API Request {request_id} timed out after {timeout}s")
@@ -118,73 +199,41 @@ def generate_title(journal_entry, timeout=5):
     logger.info(f"Title generation {request_id} started for entry of length {len(journal_entry)}")
 
     try:
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {settings.GROK_API_KEY}',
-            'X-Request-ID': str(request_id)
-        }
-
-        prompt = f"""
-        Create a short, engaging title for this journal entry:
-
-        {journal_entry[:300]}...
-
-        The title should be 5-7 words maximum, reflecting the main themes or feelings in the entry.
-        """
-
-        payload = {
-            'model': 'llama-3.3-70b-versatile',
-            'messages': [
-                {'role': 'system', 'content': 'You are a helpful writing assistant.'},
-                {'role': 'user', 'content': prompt}
-            ],
-            'temperature': 0.7,
-            'max_tokens': 30
-        }
-
-        start_time = time.time()
-        response = requests.post(
-            'https://api.groq.com/openai/v1/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=timeout
+        content = get_llm_client().chat(
+            title_messages(journal_entry),
+            model=JOURNAL_MODEL,
+            temperature=0.7,
+            max_tokens=30,
+            timeout=timeout,
+            request_id=request_id,
+            label='Title generation',
+            cache_as='title',
         )
-        api_time = time.time() - start_time
-
-        logger.info(f"Title generation {request_id} completed in {api_time:.2f}s with status {response.status_code}")
 
-        if response.status_code != 200:
-            logger.error(f"Title generation {request_id} failed: {response.status_code} - {response.text}")
-            raise RequestException(f"API returned status code {response.status_code}")
+        return format_title(content)
 
-        response_data = response.json()
-
-        # Validate response structure with detailed error
-        if 'choices' not in response_data:
-            error_msg = f"Missing 'choices' in API response: {response_data}"
-            logger.error(f"Title generation {request_id}: {error_msg}")
-            raise ValueError(error_msg)
-
-        if not response_data['choices'] or 'message' not in response_data['choices'][0]:
-            error_msg = f"Invalid structure in API response: {response_data}"
-            logger.error(f"Title generation {request_id}: {error_msg}")
-            raise ValueError(error_msg)
-
-        title = response_data['choices'][0]['message']['content'].strip('"').strip()
-
-        # Add today's date to the title
-        today = datetime.now().strftime("%B %d, %Y")
-        return f"{title} - {today}"
+    except Exception as e:
+        logger.error(f"Title generation {request_id} error: {str(e)}", exc_info=True)
+        return fallback_title(journal_entry)
 
+async def agenerate_title(journal_entry, timeout=5):
+    """Async variant of generate_title() for streaming views (single attempt, same fallback)"""
+    request_id = int(time.time() * 1000)
+    try:
+        content = await get_llm_client().achat(
+            title_messages(journal_entry),
+            model=JOURNAL_MODEL,
+            temperature=0.7,
+            max_tokens=30,
+            timeout=timeout,
+            request_id=request_id,
+            label='Title generation',
+            cache_as='title',
+        )
+        return format_title(content)
     except Exception as e:
         logger.error(f"Title generation {request_id} error: {str(e)}", exc_info=True)
-        # More descriptive fallback title
-        today = datetime.now().strftime("%B %d, %Y")
-        words = journal_entry.split()[:5]
-        if words:
-            # Create a title from the first few words
-            return f"{' '.join(words)}... - {today}"
-        return f"Journal Entry - {today}"
+        return fallback_title(journal_entry)
 
 def generate_ai_content(journal_content):
     """
@@ -277,115 +326,16 @@ def call_grok_api_personalized(journal_content, user_preferences):
     logger.info(f"Personalized API Request {request_id} started for content length {len(journal_content)}")
 
     try:
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {settings.GROK_API_KEY}',
-            'X-Request-ID': str(request_id)
-        }
-
-        # Build a personalized prompt based on preferences
-        style_guide = ""
-
-        # Writing style
-        if user_preferences['writing_style'] == 'reflective':
-            style_guide += "Write in a thoughtful, introspective tone with personal insights. "
-        elif user_preferences['writing_style'] == 'analytical':
-            style_guide += "Write in a logical, analytical tone with observations about patterns and causes. "
-        elif user_preferences['writing_style'] == 'creative':
-            style_guide += "Write in a creative, expressive tone with vivid descriptions and imagery. "
-        elif user_preferences['writing_style'] == 'concise':
-            style_guide += "Write concisely and to the point, focusing on key events and feelings. "
-        elif user_preferences['writing_style'] == 'detailed':
-            style_guide += "Include rich details and thorough descriptions of events, feelings, and surroundings. "
-        elif user_preferences['writing_style'] == 'poetic':
-            style_guide += "Include poetic language, metaphors, and a flowing, rhythmic writing style. "
-        elif user_preferences['writing_style'] == 'humorous':
-            style_guide += "Incorporate gentle humor and a lighthearted tone where appropriate. "
-
-        # Emotional tone
-        if user_preferences['tone'] == 'positive':
-            style_guide += "Emphasize positive aspects and silver linings in events. "
-        elif user_preferences['tone'] == 'balanced':
-            style_guide += "Balance both positive and challenging aspects of experiences. "
-        elif user_preferences['tone'] == 'realistic':
-            style_guide += "Take a realistic, pragmatic approach to describing events. "
-        elif user_preferences['tone'] == 'growth':
-            style_guide += "Focus on lessons learned and personal growth opportunities. "
-
-        # Focus areas
-        if user_preferences['focus_areas']:
-            areas = ', '.join(user_preferences['focus_areas'])
-            style_guide += f"When relevant, emphasize these areas: {areas}. "
-
-        # Language complexity
-        if user_preferences['language_complexity'] == 'simple':
-            style_guide += "Use simple, clear language avoiding complex vocabulary. "
-        elif user_preferences['language_complexity'] == 'moderate':
-            style_guide += "Use moderately sophisticated language accessible to most readers. "
-        elif user_preferences['language_complexity'] == 'advanced':
-            style_guide += "Use rich, sophisticated vocabulary and complex sentence structures. "
-
-        # Metaphor frequency
-        if user_preferences['metaphor_frequency'] == 'minimal':
-            style_guide += "Use metaphors and analogies sparingly. "
-        elif user_preferences['metaphor_frequency'] == 'occasional':
-            style_guide += "Occasionally include metaphors or analogies to illustrate points. "
-        elif user_preferences['metaphor_frequency'] == 'frequent':
-            style_guide += "Frequently incorporate metaphors and analogies throughout the entry. "
-
-        # Questions
-        if user_preferences['include_questions']:
-            style_guide += "End with 1-2 thoughtful reflective questions related to the events. "
-
-        # Build the prompt with style guide
-        today = datetime.now().strftime("%B %d, %Y")
-        prompt = f"""
-        Transform the following daily activities into a reflective, well-written journal entry.
-        Add emotional depth, insights, and reflection while staying true to the events mentioned.
-
-        User's activities: {journal_content}
-
-        Style guide: {style_guide}
-
-        Write the entry in first person as if the user wrote it themselves.
-        Include paragraphs for readability and natural flow.
-        """
-
-        payload = {
-            'model': 'llama-3.3-70b-versatile',
-            'messages': [
-                {'role': 'system', 'content': 'You are a helpful journal assistant that transforms brief notes into thoughtful diary entries.'},
-                {'role': 'user', 'content': prompt}
-            ],
-            'temperature': 0.7,
-            'max_tokens': 800
-        }
-
-        # Add proper timeout to prevent hanging requests
-        start_time = time.time()
-        response = requests.post(
-            'https://api.groq.com/openai/v1/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=10
+        return get_llm_client().chat(
+            personalized_journal_messages(journal_content, user_preferences),
+            model=JOURNAL_MODEL,
+            temperature=0.7,
+            max_tokens=800,
+            timeout=10,
+            request_id=request_id,
+            label='API Request',
+            cache_as='journal_entry',
         )
-        api_time = time.time() - start_time
-
-        logger.info(f"API Request {request_id} completed in {api_time:.2f}s with status {response.status_code}")
-
-        if response.status_code != 200:
-            logger.error(f"API Request {request_id} failed: {response.status_code} - {response.text}")
-            raise RequestException(f"API returned status code {response.status_code}")
-
-        response_data = response.json()
-
-        # Validate response structure
-        if 'choices' not in response_data or not response_data['choices']:
-            error_msg = f"Invalid API response structure: {response_data}"
-            logger.error(f"API Request {request_id}: {error_msg}")
-            raise ValueError(error_msg)
-
-        return response_data['choices'][0]['message']['content']
 
     except Exception as e:
         logger.error(f"API Request {request_id} error: {str(e)}", exc_info=True)
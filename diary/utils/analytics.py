@@ -1,8 +1,11 @@
 import hashlib
 
+from ..services.ai_cache import normalize_prompt
+
 def get_content_hash(journal_content):
     """Create a unique hash for the journal content to use as cache key"""
-    return hashlib.md5(journal_content.encode('utf-8')).hexdigest()
+    # Whitespace and case variants of the same notes share one cache entry
+    return hashlib.md5(normalize_prompt(journal_content).encode('utf-8')).hexdigest()
 
 def get_mood_emoji(mood):
     """Return appropriate emoji for a given mood."""
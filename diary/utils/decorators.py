@@ -3,6 +3,9 @@ import logging
 from functools import wraps
 from requests.exceptions import RequestException
 
+from ..services.circuit_breaker import CircuitOpenError
+from ..services.rate_limiter import RateLimitExceeded
+
 logger = logging.getLogger(__name__)
 
 def retry_on_failure(max_retries=3, delay=1, backoff=2, exceptions=(RequestException,)):
@@ -15,6 +18,10 @@ def retry_on_failure(max_retries=3, delay=1, backoff=2, exceptions=(RequestExcep
     - backoff: Multiplier for the delay with each retry
     - exceptions: Tuple of exceptions to catch and retry
 
+    CircuitOpenError and RateLimitExceeded are never retried: the provider
+    is known to be down or out of capacity, so the caller should fall back
+    (or reschedule) straight away instead of sleeping.
+
     Usage:
     @retry_on_failure(max_retries=3, delay=1, backoff=2)
     def call_api():
@@ -27,6 +34,8 @@ def retry_on_failure(max_retries=3, delay=1, backoff=2, exceptions=(RequestExcep
             while mtries > 0:
                 try:
                     return func(*args, **kwargs)
+                except (CircuitOpenError, RateLimitExceeded):
+                    raise
                 except exceptions as e:
                     msg = f"{func.__name__} failed. Retrying in {mdelay}s. Error: {str(e)}"
                     logger.warning(msg)
@@ -0,0 +1,416 @@
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+
+import requests
+
+from ..services.prompt_builder import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+COMPLETIONS_PATH = '/openai/v1/chat/completions'
+
+MODES = ('synthetic', 'record', 'replay')
+
+WORDS = (
+    "today I walked through the park and thought about work family friends the rain coffee "
+    "morning evening plans dinner music book quiet calm grateful tired hopeful busy slowly "
+    "remembered noticed decided wondered felt realized again finally still maybe really"
+).split()
+
+
+class LatencyModel:
+    """
+    Seconds before the first token, from a spec string:
+
+        fixed:0.5              always 0.5s
+        uniform:0.2:1.5        uniform between 0.2s and 1.5s
+        lognormal:0.8:0.5      median 0.8s, sigma 0.5 (a long right tail)
+        recorded               the latency stored in the cassette (replay only)
+    """
+
+    def __init__(self, spec: str = 'lognormal:0.8:0.5'):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        try:
+            values = [float(value) for value in params.split(':')] if params else []
+        except ValueError:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        expected = {'fixed': 1, 'uniform': 2, 'lognormal': 2, 'recorded': 0}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(
+                f"Invalid latency spec: {spec} (use fixed:S, uniform:A:B, lognormal:MEDIAN:SIGMA or recorded)"
+            )
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random, recorded: Optional[float] = None) -> float:
+        if self.kind == 'fixed':
+            return self.values[0]
+        if self.kind == 'uniform':
+            return rng.uniform(*self.values)
+        if self.kind == 'lognormal':
+            median, sigma = self.values
+            return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return recorded or 0.0
+
+
+def cassette_key(payload: Dict) -> str:
+    """Replay key for a request: model and messages, ignoring sampling settings"""
+    canonical = json.dumps(
+        [payload.get('model'), [[m.get('role'), m.get('content')] for m in payload.get('messages', [])]],
+        separators=(',', ':'), ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class GroqStubServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Groq chat completions API, for load tests that
+    must not reach the real provider.
+
+    POST /openai/v1/chat/completions gets the response shape Groq sends
+    (streamed as server-sent events with usage on the last chunk when the
+    request asks for it) after a first-token latency from a LatencyModel
+    plus generation time at tokens_per_second. A share of requests can be
+    failed with chosen status codes. In record mode requests are proxied to
+    the real API and the responses appended to a JSONL cassette; replay mode
+    answers from that cassette, so benchmarks can use realistic text
+    offline. GET /stats returns request and error counters.
+
+    Use start()/stop() to run it in a background thread of the current
+    process, or serve_forever() to run it in the foreground. base_url is
+    what GROQ_API_BASE_URL should be set to.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: str = 'lognormal:0.8:0.5',
+                 tokens_per_second: float = 250.0, reply_words: int = 150, error_rate: float = 0.0,
+                 error_statuses: Sequence[int] = (500, 503), retry_after: float = 1.0,
+                 mode: str = 'synthetic', cassette: Optional[str] = None,
+                 upstream: Optional[str] = None, api_key: Optional[str] = None, seed: Optional[int] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown stub mode: {mode}")
+        if mode != 'synthetic' and not cassette:
+            raise ValueError(f"{mode} mode needs a cassette file")
+        if mode == 'record' and not upstream:
+            raise ValueError("record mode needs an upstream API URL")
+
+        super().__init__((host, port), StubRequestHandler)
+        self.latency = LatencyModel(latency)
+        if self.latency.kind == 'recorded' and mode != 'replay':
+            raise ValueError("recorded latency is only available in replay mode")
+        self.tokens_per_second = tokens_per_second
+        self.reply_words = reply_words
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses) or (500,)
+        self.retry_after = retry_after
+        self.mode = mode
+        self.cassette = cassette
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.api_key = api_key
+
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = defaultdict(int)
+        self._recordings: Dict[str, List[Dict]] = {}
+        self._replay_position: Dict[str, int] = defaultdict(int)
+        if mode == 'replay':
+            self._recordings = self.load_cassette(cassette)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/openai/v1"
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self) -> 'GroqStubServer':
+        """Serve from a daemon thread; returns self"""
+        self._thread = threading.Thread(target=self.serve_forever, name='groq-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def count(self, counter: str, amount: int = 1):
+        with self._lock:
+            self.stats[counter] += amount
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+    def request_rng(self) -> random.Random:
+        """A generator for one request, seeded from the shared one"""
+        with self._lock:
+            return random.Random(self._rng.getrandbits(64))
+
+    # ------------------------------------------------------------------
+    # Cassettes
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def load_cassette(path: str) -> Dict[str, List[Dict]]:
+        """Recorded responses by cassette key, in recording order"""
+        recordings = defaultdict(list)
+        with open(path, encoding='utf-8') as cassette:
+            for line_number, line in enumerate(cassette, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    recordings[record['key']].append(record)
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Skipping cassette line {line_number} of {path}: {e}")
+        logger.info(f"Loaded {sum(len(items) for items in recordings.values())} recorded responses from {path}")
+        return dict(recordings)
+
+    def replay(self, payload: Dict) -> Optional[Dict]:
+        """Next recorded response for the request, cycling through repeats"""
+        key = cassette_key(payload)
+        records = self._recordings.get(key)
+        if not records:
+            return None
+        with self._lock:
+            position = self._replay_position[key]
+            self._replay_position[key] = position + 1
+        return records[position % len(records)]
+
+    def record(self, payload: Dict) -> Dict:
+        """Proxy the request upstream (without streaming) and append the response to the cassette"""
+        started = time.time()
+        response = requests.post(
+            f"{self.upstream}/chat/completions",
+            json={**payload, 'stream': False},
+            headers={'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'},
+            timeout=120,
+        )
+        latency = time.time() - started
+        record = {
+            'key': cassette_key(payload),
+            'model': payload.get('model'),
+            'status': response.status_code,
+            'latency': round(latency, 3),
+            'response': response.json() if response.headers.get('content-type', '').startswith('application/json')
+            else {'error': {'message': response.text}},
+        }
+        with self._lock:
+            with open(self.cassette, 'a', encoding='utf-8') as cassette:
+                cassette.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return record
+
+    # ------------------------------------------------------------------
+    # Synthetic replies
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def json_template(prompt: str) -> Optional[Dict]:
+        """The example object a prompt asks the model to answer with, if it has one"""
+        marker = prompt.rfind('JSON')
+        if marker < 0:
+            return None
+        decoder = json.JSONDecoder()
+        position = prompt.find('{', marker)
+        while position >= 0:
+            try:
+                value, _ = decoder.raw_decode(prompt, position)
+                if isinstance(value, dict):
+                    return value
+            except ValueError:
+                pass
+            position = prompt.find('{', position + 1)
+        return None
+
+    def synthesize(self, payload: Dict, rng: random.Random) -> str:
+        """Reply text: the prompt's JSON template when it asks for JSON, else filler prose"""
+        messages = payload.get('messages') or [{}]
+        prompt = str(messages[-1].get('content') or '')
+        template = self.json_template(prompt)
+        if template is not None:
+            return json.dumps(template, ensure_ascii=False, indent=2)
+
+        limit = int(payload.get('max_tokens') or 800) * 3 // 4
+        count = max(1, min(self.reply_words, limit))
+        sentences, words = [], 0
+        while words < count:
+            length = min(rng.randint(8, 18), count - words)
+            sentence = ' '.join(rng.choice(WORDS) for _ in range(length))
+            sentences.append(sentence[:1].upper() + sentence[1:] + '.')
+            words += length
+        return ' '.join(sentences)
+
+    @staticmethod
+    def completion(payload: Dict, content: str) -> Dict:
+        """A chat completion response body for the content"""
+        prompt_tokens = sum(estimate_tokens(str(m.get('content'))) for m in payload.get('messages', []))
+        completion_tokens = estimate_tokens(content)
+        return {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        }
+
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so the client's pooled connections are reused like with the real API
+    protocol_version = 'HTTP/1.1'
+    server: GroqStubServer
+
+    def log_message(self, format, *args):
+        logger.debug(f"Groq stub: {format % args}")
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.server.snapshot())
+        elif self.path.rstrip('/') == '/openai/v1/models':
+            self._send_json(200, {'object': 'list', 'data': []})
+        else:
+            self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if self.path.split('?')[0].rstrip('/') != COMPLETIONS_PATH:
+            self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+            return
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Request body is not valid JSON', 'type': 'invalid_request_error'}})
+            return
+
+        server.count('requests')
+        rng = server.request_rng()
+        stream = bool(payload.get('stream'))
+
+        if server.error_rate and rng.random() < server.error_rate:
+            self._fail(rng)
+            return
+
+        recorded_latency = None
+        if server.mode == 'replay':
+            record = server.replay(payload)
+            if record is None:
+                server.count('replay_misses')
+                response = server.completion(payload, server.synthesize(payload, rng))
+            else:
+                server.count('replay_hits')
+                recorded_latency = record.get('latency')
+                if record.get('status', 200) != 200:
+                    time.sleep(server.latency.sample(rng, recorded_latency))
+                    self._send_json(record['status'], record['response'])
+                    return
+                response = record['response']
+        elif server.mode == 'record':
+            try:
+                record = server.record(payload)
+            except requests.RequestException as e:
+                server.count('upstream_errors')
+                self._send_json(502, {'error': {'message': f"Upstream request failed: {e}"}})
+                return
+            server.count('recorded')
+            if record['status'] != 200:
+                self._send_json(record['status'], record['response'])
+                return
+            response = record['response']
+        else:
+            response = server.completion(payload, server.synthesize(payload, rng))
+
+        # A recorded call already took real upstream time
+        ttft = server.latency.sample(rng, recorded_latency) if server.mode != 'record' else 0.0
+        completion_tokens = (response.get('usage') or {}).get('completion_tokens', 0)
+        generation = completion_tokens / server.tokens_per_second if server.mode != 'record' else 0.0
+        server.count('completion_tokens', completion_tokens)
+
+        if stream:
+            self._stream(payload, response, ttft, generation)
+        else:
+            time.sleep(ttft + generation)
+            self._send_json(200, response)
+
+    def _fail(self, rng: random.Random):
+        server = self.server
+        status = rng.choice(server.error_statuses)
+        server.count(f'errors_{status}')
+        # Failures come back quickly, like an overloaded provider shedding load
+        time.sleep(server.latency.sample(rng) * 0.1)
+        headers = {'Retry-After': f"{server.retry_after:g}"} if status == 429 else None
+        error_type = 'rate_limit_exceeded' if status == 429 else 'server_error'
+        self._send_json(status, {'error': {'message': f"Injected {status} from Groq stub", 'type': error_type}},
+                        headers)
+
+    def _stream(self, payload: Dict, response: Dict, ttft: float, generation: float):
+        """Send the response as chat.completion.chunk events, pacing tokens over the generation time"""
+        content = response['choices'][0]['message']['content'] or ''
+        words = content.split(' ')
+        pieces = [' '.join(words[i:i + 4]) + (' ' if i + 4 < len(words) else '') for i in range(0, len(words), 4)]
+        interval = generation / max(len(pieces), 1)
+        base = {'id': response.get('id'), 'object': 'chat.completion.chunk', 'created': response.get('created'),
+                'model': payload.get('model')}
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        # No length up front: the stream ends when the server closes the connection
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(ttft)
+        try:
+            for index, piece in enumerate(pieces):
+                if index:
+                    time.sleep(interval)
+                delta = {'role': 'assistant', 'content': piece} if index == 0 else {'content': piece}
+                self._event({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})
+            # Groq puts usage in x_groq on the final chunk
+            self._event({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                         'x_groq': {'id': response.get('id'), 'usage': response.get('usage', {})}})
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.count('client_disconnects')
+
+    def _event(self, chunk: Dict):
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        self.wfile.flush()
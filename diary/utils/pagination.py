@@ -0,0 +1,120 @@
+import base64
+import logging
+from datetime import datetime
+
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated queryset. Behaves like a list of objects
+    and carries opaque cursors for the neighbouring pages.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def encode_cursor(obj, direction):
+    """Encode an object's (created_at, id) position as an opaque URL-safe cursor"""
+    raw = f"{direction}|{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into (direction, created_at, id); returns None if malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        if direction not in ('next', 'prev'):
+            return None
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        logger.debug(f"Ignoring malformed pagination cursor: {cursor}")
+        return None
+
+
+def parse_page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Clamp a user-supplied page size to [1, MAX_PAGE_SIZE]"""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def paginate_by_keyset(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Paginate newest-first on (created_at, id).
+
+    Each page is a range scan that seeks past the cursor position using the
+    (user, created_at) index, so page N costs the same as page 1. Unlike
+    OFFSET pagination, cursors stay stable while entries are added.
+
+    Usage:
+    page = paginate_by_keyset(Entry.objects.filter(user=user), request.GET.get('cursor'))
+    """
+    position = decode_cursor(cursor)
+
+    if position is None:
+        rows = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+        has_next, has_previous = len(rows) > page_size, False
+        rows = rows[:page_size]
+    elif position[0] == 'next':
+        _, created_at, pk = position
+        rows = list(
+            queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+            .order_by('-created_at', '-id')[:page_size + 1]
+        )
+        has_next, has_previous = len(rows) > page_size, True
+        rows = rows[:page_size]
+    else:
+        # Walk backwards from the cursor, then flip back to newest-first
+        _, created_at, pk = position
+        rows = list(
+            queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+            .order_by('created_at', 'id')[:page_size + 1]
+        )
+        has_next, has_previous = True, len(rows) > page_size
+        rows = rows[:page_size][::-1]
+
+    if not rows:
+        return KeysetPage([])
+
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1], 'next') if has_next else None,
+        previous_cursor=encode_cursor(rows[0], 'prev') if has_previous else None,
+    )
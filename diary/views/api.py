@@ -1,11 +1,13 @@
 # Core Python
+import asyncio
 import json
 import logging
 import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Django core
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model, login
@@ -13,7 +15,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.backends import ModelBackend
 from django.core.cache import cache
 from django.db.models import Count, Avg
-from django.http import JsonResponse
+from django.http import FileResponse, HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.utils import timezone
@@ -28,11 +30,22 @@ from rest_framework.authtoken.models import Token
 
 # Local app imports
 from .. import models
-from ..models import Entry, Journal, Tag, JournalEntry
+from ..models import Entry, Journal, Tag, JournalEntry, UserWritingStats, UserDataExport
 from ..serializers import NonceRequestSerializer, Web3LoginSerializer, UserProfileSerializer
 from ..services.ai_service import AIService
-from ..utils.ai_helpers import generate_ai_content, generate_ai_content_personalized
+from ..services.analytics_engine import EntryAnalytics
+from ..services.search_service import SearchService
+from ..services.import_service import ImportService
+from ..services.export_service import ExportService
+from ..services.summary_jobs import SummaryJobService
+from ..cache import CacheService
+from ..services.llm_client import get_llm_client
+from ..utils.ai_helpers import (
+    JOURNAL_MODEL, TITLE_SOURCE_CHARS, agenerate_title, generate_ai_content, generate_ai_content_personalized,
+    get_user_preferences, journal_entry_messages, personalized_journal_messages,
+)
 from ..utils.analytics import get_content_hash, auto_generate_tags
+from ..utils.pagination import paginate_by_keyset, parse_page_size
 from diary.models import Web3Nonce, WalletSession
 from diary.utils.Web3Utils import Web3Utils
 
@@ -40,6 +53,41 @@ from diary.utils.Web3Utils import Web3Utils
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+DEMO_PHOTO_REFERENCE = "\n\nI captured a special moment in a photo today. Looking at it now brings back the feelings and memories of that moment."
+DEMO_CACHE_TIMEOUT = 3600  # 1 hour
+
+def _parse_demo_request(request, request_id):
+    """(journal_content, photo, personalize) from a multipart or JSON demo request"""
+    # Check content type to determine how to process the request
+    if request.content_type and 'multipart/form-data' in request.content_type:
+        # Handle multipart form data (with file uploads)
+        journal_content = request.POST.get('journal_content', '')
+        photo = request.FILES.get('journal_photo')
+        personalize = request.POST.get('personalize') == 'true'
+
+        logger.info(f"Journal request {request_id} with multipart form data")
+        if photo:
+            logger.info(f"Photo included: {photo.name}, size: {photo.size} bytes")
+    else:
+        # Handle JSON data (old method)
+        data = json.loads(request.body)
+        journal_content = data.get('journal_content', '')
+        personalize = data.get('personalize', False)
+        photo = None
+
+        logger.info(f"Journal request {request_id} with JSON data")
+    return journal_content, photo, personalize
+
+def _demo_cache_key(journal_content, photo, user=None):
+    """Cache key for a generated demo entry; user is set for personalized requests"""
+    # Cache key includes photo info if a photo is present
+    photo_indicator = "with_photo" if photo else "no_photo"
+    if user is not None:
+        # Create a unique cache key based on content, photo presence, and user
+        return f"journal_entry:user{user.id}:{photo_indicator}:{get_content_hash(journal_content)}"
+    # Otherwise use standard cache key
+    return f"journal_entry:{photo_indicator}:{get_content_hash(journal_content)}"
+
 @require_POST
 def demo_journal(request):
     request_id = int(time.time() * 1000)
@@ -48,40 +96,14 @@ def demo_journal(request):
     try:
         start_time = time.time()
 
-        # Check content type to determine how to process the request
-        if request.content_type and 'multipart/form-data' in request.content_type:
-            # Handle multipart form data (with file uploads)
-            journal_content = request.POST.get('journal_content', '')
-            photo = request.FILES.get('journal_photo')
-            personalize = request.POST.get('personalize') == 'true'
-
-            logger.info(f"Journal request {request_id} with multipart form data")
-            if photo:
-                logger.info(f"Photo included: {photo.name}, size: {photo.size} bytes")
-        else:
-            # Handle JSON data (old method)
-            data = json.loads(request.body)
-            journal_content = data.get('journal_content', '')
-            personalize = data.get('personalize', False)
-            photo = None
-
-            logger.info(f"Journal request {request_id} with JSON data")
+        journal_content, photo, personalize = _parse_demo_request(request, request_id)
 
         if not journal_content:
             logger.warning(f"Journal request {request_id}: No content provided")
             return JsonResponse({'error': 'No content provided'}, status=400)
 
-        # Cache key includes photo info if a photo is present
-        photo_indicator = "with_photo" if photo else "no_photo"
-
-        # If personalization is requested and user is logged in, use that
-        if personalize and request.user.is_authenticated:
-            # Create a unique cache key based on content, photo presence, and user
-            user_id = request.user.id
-            cache_key = f"journal_entry:user{user_id}:{photo_indicator}:{get_content_hash(journal_content)}"
-        else:
-            # Otherwise use standard cache key
-            cache_key = f"journal_entry:{photo_indicator}:{get_content_hash(journal_content)}"
+        personalize = personalize and request.user.is_authenticated
+        cache_key = _demo_cache_key(journal_content, photo, request.user if personalize else None)
 
         # Try to get cached response
         cached_response = cache.get(cache_key)
@@ -93,7 +115,7 @@ def demo_journal(request):
             return JsonResponse(cached_response)
 
         # Generate new content if not cached
-        if personalize and request.user.is_authenticated:
+        if personalize:
             # Use personalized generation
             response_data = generate_ai_content_personalized(journal_content, request.user)
         else:
@@ -106,8 +128,7 @@ def demo_journal(request):
             entry_text = response_data.get('entry', '')
             if entry_text:
                 # Add a reference to the photo at the end of the entry
-                photo_reference = "\n\nI captured a special moment in a photo today. Looking at it now brings back the feelings and memories of that moment."
-                response_data['entry'] = entry_text + photo_reference
+                response_data['entry'] = entry_text + DEMO_PHOTO_REFERENCE
 
         # Add metadata
         response_data['cache_hit'] = False
@@ -119,7 +140,7 @@ def demo_journal(request):
 
         # Cache the response (only if successful and no errors and no photo)
         if 'error' not in response_data and not photo:
-            cache.set(cache_key, response_data, timeout=3600)  # Cache for 1 hour
+            cache.set(cache_key, response_data, timeout=DEMO_CACHE_TIMEOUT)
 
         logger.info(f"Journal request {request_id} completed in {response_data['request_time']}s")
         return JsonResponse(response_data)
@@ -135,14 +156,141 @@ def demo_journal(request):
             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }, status=500)
 
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _demo_journal_events(request_id, start_time, journal_content, photo, cache_key, cached_response, preferences):
+    """Server-sent events for demo_journal_stream: token*, title, done"""
+    if cached_response:
+        logger.info(f"Journal request {request_id} served from cache")
+        cached_response['cache_hit'] = True
+        cached_response['cache_type'] = 'server'
+        cached_response['response_time'] = round(time.time() - start_time, 3)
+        yield _sse_event('done', cached_response)
+        return
+
+    if preferences is not None:
+        chat_messages = personalized_journal_messages(journal_content, preferences)
+    else:
+        chat_messages = journal_entry_messages(journal_content)
+
+    parts, streamed, title_task = [], 0, None
+    try:
+        async for text in get_llm_client().astream_chat(
+            chat_messages, model=JOURNAL_MODEL, temperature=0.7, max_tokens=800,
+            request_id=request_id, label='API Request', cache_as='journal_entry',
+        ):
+            parts.append(text)
+            streamed += len(text)
+            yield _sse_event('token', {'text': text})
+            if title_task is None and streamed >= TITLE_SOURCE_CHARS:
+                # The title prompt only reads the start of the entry, so it runs while the rest streams
+                title_task = asyncio.create_task(agenerate_title(''.join(parts)))
+
+        journal_entry = ''.join(parts)
+        if title_task is None:
+            title_task = asyncio.create_task(agenerate_title(journal_entry))
+        title = await title_task
+        yield _sse_event('title', {'title': title})
+
+        response_data = {
+            'title': title,
+            'entry': journal_entry,
+            'generation_time': round(time.time() - start_time, 2)
+        }
+        if preferences is not None:
+            response_data.update(personalized=True, preferences_used=preferences)
+    except Exception as e:
+        if title_task is not None:
+            title_task.cancel()
+        logger.error(f"Journal request {request_id} stream failed: {str(e)}", exc_info=True)
+        # Same fallback content generate_ai_content returns
+        today = datetime.now().strftime("%B %d, %Y")
+        response_data = {
+            'title': f"Journal Entry - {today}",
+            'entry': f"Today I {journal_content[:50]}..." if len(journal_content) > 50 else f"Today I {journal_content}...",
+            'error': str(e)
+        }
+
+    if photo and 'error' not in response_data:
+        response_data['entry'] += DEMO_PHOTO_REFERENCE
+        yield _sse_event('token', {'text': DEMO_PHOTO_REFERENCE})
+
+    response_data['cache_hit'] = False
+    response_data['cache_type'] = 'none'
+    response_data['request_time'] = round(time.time() - start_time, 2)
+    response_data['has_photo'] = photo is not None
+
+    if 'error' not in response_data and not photo:
+        await cache.aset(cache_key, response_data, timeout=DEMO_CACHE_TIMEOUT)
+
+    logger.info(f"Journal request {request_id} streamed in {response_data['request_time']}s")
+    yield _sse_event('done', response_data)
+
+async def demo_journal_stream(request):
+    """
+    Streaming variant of demo_journal. Sends the entry as server-sent events
+    while it is generated ("token" events), then the title, then a "done"
+    event carrying exactly the payload demo_journal would return. Needs an
+    ASGI server (core.asgi) to stream; under WSGI the events arrive at once.
+    """
+    # Django 4.2's method decorators are sync-only
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    request_id = int(time.time() * 1000)
+    start_time = time.time()
+    logger.info(f"Journal stream request {request_id} started")
+
+    try:
+        journal_content, photo, personalize = _parse_demo_request(request, request_id)
+    except json.JSONDecodeError:
+        logger.error(f"Journal request {request_id}: Invalid JSON in request")
+        return JsonResponse({'error': 'Invalid JSON format'}, status=400)
+
+    if not journal_content:
+        logger.warning(f"Journal request {request_id}: No content provided")
+        return JsonResponse({'error': 'No content provided'}, status=400)
+
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    personalize = bool(personalize and user)
+    cache_key = _demo_cache_key(journal_content, photo, user if personalize else None)
+    # Don't use cache if there's a photo upload
+    cached_response = None if photo else await cache.aget(cache_key)
+    preferences = await sync_to_async(get_user_preferences)(user) if personalize and not cached_response else None
+
+    response = StreamingHttpResponse(
+        _demo_journal_events(request_id, start_time, journal_content, photo, cache_key, cached_response, preferences),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keep nginx from buffering the stream
+    return response
+
+@login_required
 @require_POST
 def regenerate_summary_ajax(request, entry_id):
-    """AJAX view to regenerate an entry summary"""
-    if request.method == 'POST':
-        entry = get_object_or_404(Entry, id=entry_id, user=request.user)
-        summary = AIService.generate_entry_summary(entry)
-        return JsonResponse({'success': True, 'summary': summary})
-    return JsonResponse({'success': False, 'error': 'Invalid request'})
+    """AJAX view to regenerate an entry summary in the background; poll status_url for the result"""
+    entry = get_object_or_404(Entry, id=entry_id, user=request.user)
+    try:
+        job, created = SummaryJobService.enqueue(entry)
+    except Exception:
+        return JsonResponse({'success': False, 'error': 'Could not start summary regeneration'}, status=503)
+
+    return JsonResponse({
+        'success': True,
+        'created': created,
+        'job': SummaryJobService.public_job(job),
+        'status_url': reverse('summary_job_status', args=[job['job_id']]),
+    }, status=202)
+
+@login_required
+def summary_job_status(request, job_id):
+    """Status of a summary regeneration job, with the summary once completed"""
+    job = SummaryJobService.get_job(job_id)
+    if job is None or job['user_id'] != request.user.id:
+        return JsonResponse({'success': False, 'error': 'Summary job not found'}, status=404)
+    return JsonResponse({'success': True, 'job': SummaryJobService.public_job(job)})
 
 @require_POST
 def save_generated_entry(request):
@@ -275,13 +423,7 @@ def save_generated_entry(request):
                     tags = []
 
             if tags:
-                for tag_name in tags:
-                    if tag_name and isinstance(tag_name, str):
-                        tag, created = Tag.objects.get_or_create(
-                            name=tag_name.lower().strip(),
-                            user=request.user
-                        )
-                        entry.tags.add(tag)
+                entry.tags.add(*Tag.resolve_names(request.user, tags))
 
             # Calculate rewards for authenticated users with wallet
             word_count = len(content.split())
@@ -1106,52 +1248,28 @@ def analyze_writing_style(conversation_history):
         return "casual and conversational"
 
     all_text = ' '.join(user_messages)
+    analytics = EntryAnalytics.from_texts([all_text])
 
     style_analysis = {
         'length': 'concise' if len(all_text) < 200 else 'detailed',
-        'tone': analyze_tone(all_text),
-        'emotion_level': analyze_emotion_level(all_text),
-        'complexity': analyze_complexity(all_text)
+        'tone': analytics.tone(),
+        'emotion_level': analytics.emotion_level(),
+        'complexity': analytics.complexity()
     }
 
     return f"{style_analysis['tone']}, {style_analysis['emotion_level']}, tends to be {style_analysis['length']}"
 
 def analyze_tone(text):
     """Analyze conversational tone"""
-    casual_indicators = ['like', 'yeah', 'really', 'kinda', 'gonna', 'wanna']
-    formal_indicators = ['however', 'therefore', 'consequently', 'furthermore']
-
-    casual_count = sum(1 for word in casual_indicators if word in text.lower())
-    formal_count = sum(1 for word in formal_indicators if word in text.lower())
-
-    if casual_count > formal_count:
-        return 'casual'
-    elif formal_count > casual_count:
-        return 'formal'
-    else:
-        return 'balanced'
+    return EntryAnalytics.from_texts([text]).tone()
 
 def analyze_emotion_level(text):
     """Analyze emotional expression level"""
-    emotion_words = ['feel', 'felt', 'amazing', 'terrible', 'excited', 'sad', 'happy', 'frustrated']
-    emotion_count = sum(1 for word in emotion_words if word in text.lower())
-
-    if emotion_count > 3:
-        return 'emotionally expressive'
-    elif emotion_count > 1:
-        return 'moderately emotional'
-    else:
-        return 'reserved'
+    return EntryAnalytics.from_texts([text]).emotion_level()
 
 def analyze_complexity(text):
     """Analyze language complexity"""
-    words = text.split()
-    avg_word_length = sum(len(word) for word in words) / len(words) if words else 0
-
-    if avg_word_length > 5:
-        return 'complex vocabulary'
-    else:
-        return 'simple vocabulary'
+    return EntryAnalytics.from_texts([text]).complexity()
 
 def extract_user_content_from_conversation(conversation_history, final_message):
     """
@@ -1702,13 +1820,7 @@ def anonymous_entry_preview(request, entry_uuid):
                 
                 # Add tags
                 tags = entry_data.get('tags', [])
-                for tag_name in tags:
-                    if tag_name:
-                        tag, created = Tag.objects.get_or_create(
-                            name=tag_name.lower().strip(),
-                            user=request.user
-                        )
-                        entry.tags.add(tag)
+                entry.tags.add(*Tag.resolve_names(request.user, tags))
                 
                 # Remove from anonymous entries
                 del anonymous_entries[entry_uuid_str]
@@ -1773,52 +1885,17 @@ def save_entry_api(request):
 def user_stats(request):
     """Get current user statistics"""
     try:
-        from django.db.models import Sum
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        entries = Entry.objects.filter(user=request.user)
-        
-        # Total entries
-        total_entries = entries.count()
-        
-        # Total words
-        total_words = sum(len(entry.content.split()) for entry in entries)
-        
-        # Calculate streak
-        today = timezone.now().date()
-        entry_dates = list(entries.values_list('created_at__date', flat=True).distinct().order_by('-created_at__date'))
-        
-        streak = 0
-        if entry_dates:
-            if entry_dates[0] == today or entry_dates[0] == today - timedelta(days=1):
-                streak = 1
-                current_date = entry_dates[0]
-                
-                for entry_date in entry_dates[1:]:
-                    expected_date = current_date - timedelta(days=1)
-                    if entry_date == expected_date:
-                        streak += 1
-                        current_date = entry_date
-                    else:
-                        break
-        
-        # Get mood counts
-        mood_counts = {}
-        for entry in entries:
-            if entry.mood:
-                mood_counts[entry.mood] = mood_counts.get(entry.mood, 0) + 1
-        
-        # Get dominant mood
-        dominant_mood = max(mood_counts.items(), key=lambda x: x[1])[0] if mood_counts else None
+        writing_stats = UserWritingStats.for_user(request.user)
+        activity = CacheService.get_activity_map(request.user)
         
         return JsonResponse({
             'success': True,
-            'total_entries': total_entries,
-            'total_words': total_words,
-            'streak': streak,
-            'dominant_mood': dominant_mood,
-            'mood_counts': mood_counts
+            'total_entries': writing_stats.entry_count,
+            'total_words': writing_stats.total_words,
+            'streak': activity.current_streak(),
+            'longest_streak': activity.longest_streak(),
+            'dominant_mood': writing_stats.dominant_mood,
+            'mood_counts': writing_stats.mood_counts
         })
         
     except Exception as e:
@@ -1826,28 +1903,288 @@ def user_stats(request):
             'success': False,
             'error': str(e)
         }, status=500)
+
+@login_required
+def activity_heatmap(request):
+    """Return the trailing year of daily writing activity for a heatmap"""
+    try:
+        days = min(max(int(request.GET.get('days', 365)), 1), 366 * 2)
+        activity = CacheService.get_activity_map(request.user)
+
+        return JsonResponse({
+            'success': True,
+            'days': [
+                {'date': day['date'].isoformat(), 'active': day['active']}
+                for day in activity.heatmap(days)
+            ],
+            'current_streak': activity.current_streak(),
+            'longest_streak': activity.longest_streak(),
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=500)
     
 def recent_entries(request):
-    """Return recent entries for dashboard updates"""
-    entries = Entry.objects.filter(user=request.user).order_by('-created_at')[:6]
+    """Return recent entries for dashboard updates (keyset paginated via ?cursor=)"""
+    entries = Entry.objects.filter(user=request.user).prefetch_related('photos')
+    page = paginate_by_keyset(entries, request.GET.get('cursor'), parse_page_size(request.GET.get('limit'), default=6))
     
     entries_data = []
-    for entry in entries:
+    for entry in page:
+        photo = entry.cover_photo
         entry_data = {
             'id': entry.id,
             'title': entry.title or 'Untitled',
             'created_at': entry.created_at.strftime('%b %d, %Y'),
-            'has_photo': bool(entry.photo or entry.photos.exists())
+            'has_photo': photo is not None
         }
         
-        if entry.photos.exists():
-            entry_data['photo_url'] = entry.photos.first().photo.url
-        elif entry.photo:
-            entry_data['photo_url'] = entry.photo.url
+        if photo:
+            entry_data['photo_url'] = photo.thumbnail_url
             
         entries_data.append(entry_data)
     
-    return JsonResponse({'entries': entries_data})
+    return JsonResponse({'entries': entries_data, 'next_cursor': page.next_cursor})
+
+@login_required
+def entries_api(request):
+    """Paged list of the user's entries, newest first, with optional tag/mood/period filters"""
+    try:
+        entries = Entry.objects.filter(user=request.user).prefetch_related('tags')
+
+        period = request.GET.get('period')
+        if period:
+            entries = Entry.for_period(request.user, period).prefetch_related('tags')
+        if request.GET.get('tag'):
+            entries = entries.filter(tags__name=request.GET['tag'])
+        if request.GET.get('mood'):
+            entries = entries.filter(mood=request.GET['mood'])
+
+        page = paginate_by_keyset(entries, request.GET.get('cursor'), parse_page_size(request.GET.get('limit')))
+
+        return JsonResponse({
+            'success': True,
+            'entries': [
+                {
+                    'id': entry.id,
+                    'title': entry.title,
+                    'excerpt': entry.get_excerpt(),
+                    'mood': entry.mood,
+                    'word_count': entry.word_count,
+                    'tags': [tag.name for tag in entry.tags.all()],
+                    'created_at': entry.created_at.isoformat(),
+                }
+                for entry in page
+            ],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        })
+
+    except Exception as e:
+        logger.error(f"Error listing entries for user {request.user.id}: {e}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@login_required
+def search_entries(request):
+    """Ranked full-text search over the user's entries with highlighted snippets"""
+    try:
+        results = SearchService.search(
+            request.user,
+            request.GET.get('q', ''),
+            mood=request.GET.get('mood') or None,
+            tag=request.GET.get('tag') or None,
+            date_from=request.GET.get('from') or None,
+            date_to=request.GET.get('to') or None,
+            page=request.GET.get('page', 1),
+            page_size=request.GET.get('page_size', 20),
+        )
+        for result in results['results']:
+            result['created_at'] = result['created_at'].isoformat()
+            result['url'] = reverse('entry_detail', args=[result['entry_id']])
+
+        return JsonResponse({'success': True, **results})
+
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': f'Invalid search parameter: {e}'}, status=400)
+    except Exception as e:
+        logger.error(f"Error searching entries for user {request.user.id}: {e}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@login_required
+@require_POST
+def import_entries_api(request):
+    """Upload an NDJSON, CSV or Day One export and import it in the background"""
+    upload = request.FILES.get('file')
+    if not upload:
+        return JsonResponse({'success': False, 'error': 'No file uploaded'}, status=400)
+    if upload.size > settings.ENTRY_IMPORT_MAX_BYTES:
+        return JsonResponse({'success': False, 'error': 'Import file is too large'}, status=413)
+
+    try:
+        fmt = ImportService.detect_format(upload.name, request.POST.get('format'))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    try:
+        from ..tasks import import_entries_async
+
+        job = ImportService.create_job(request.user, upload, fmt)
+        import_entries_async.apply_async((job['job_id'],), retry=False)
+
+        return JsonResponse({
+            'success': True,
+            'job': ImportService.public_job(ImportService.get_job(job['job_id']) or job),
+            'status_url': reverse('import_status', args=[job['job_id']]),
+        }, status=202)
+
+    except Exception as e:
+        logger.error(f"Error starting import for user {request.user.id}: {e}")
+        return JsonResponse({'success': False, 'error': 'Could not start the import'}, status=503)
+
+@login_required
+def import_status(request, job_id):
+    """Progress of a bulk import job"""
+    job = ImportService.get_job(job_id)
+    if job is None or job['user_id'] != request.user.id:
+        return JsonResponse({'success': False, 'error': 'Import job not found'}, status=404)
+    return JsonResponse({'success': True, 'job': ImportService.public_job(job)})
+
+@login_required
+@require_POST
+def create_export_api(request):
+    """Start a data export (NDJSON, or a zip with photos), optionally only what changed since the last one"""
+    try:
+        data = json.loads(request.body) if request.body else {}
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+
+    # Exports older than the task time limit are stuck, not in progress
+    pending = UserDataExport.objects.filter(
+        user=request.user, status__in=['queued', 'running'], created_at__gte=timezone.now() - timedelta(hours=2)
+    ).first()
+    if pending:
+        return JsonResponse({
+            'success': False,
+            'error': 'An export is already in progress',
+            'export': ExportService.public_export(pending),
+            'status_url': reverse('export_status', args=[pending.token]),
+        }, status=409)
+
+    try:
+        export = ExportService.create_export(
+            request.user, data.get('format', 'ndjson'), bool(data.get('incremental'))
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    try:
+        from ..tasks import generate_user_export
+
+        generate_user_export.apply_async((export.id,), retry=False)
+        export.refresh_from_db()
+
+        return JsonResponse({
+            'success': True,
+            'export': ExportService.public_export(export),
+            'status_url': reverse('export_status', args=[export.token]),
+        }, status=202)
+
+    except Exception as e:
+        logger.error(f"Error starting export for user {request.user.id}: {e}")
+        export.status = 'failed'
+        export.error = 'Could not start the export'
+        export.save(update_fields=['status', 'error'])
+        return JsonResponse({'success': False, 'error': 'Could not start the export'}, status=503)
+
+@login_required
+def export_status(request, token):
+    """Progress of a data export, with its download link once finished"""
+    export = UserDataExport.objects.filter(token=token, user=request.user).first()
+    if export is None:
+        return JsonResponse({'success': False, 'error': 'Export not found'}, status=404)
+
+    payload = {'success': True, 'export': ExportService.public_export(export)}
+    if export.status == 'completed' and export.file:
+        payload['download_url'] = reverse('download_export', args=[export.token])
+    return JsonResponse(payload)
+
+def _parse_byte_range(header, size):
+    """
+    (start, end) of a single-range `bytes=` header, inclusive, or None when
+    the header is absent or not something we serve partially. Raises
+    ValueError for ranges outside the file.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+def _stream_file_range(handle, start, length, chunk_size=64 * 1024):
+    try:
+        handle.seek(start)
+        while length > 0:
+            chunk = handle.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
+
+@login_required
+def download_export(request, token):
+    """
+    Serve a finished export. Supports single byte ranges (with If-Range), so
+    interrupted downloads of large archives can be resumed.
+    """
+    export = UserDataExport.objects.filter(token=token, user=request.user, status='completed').first()
+    if export is None or not export.file:
+        return JsonResponse({'success': False, 'error': 'Export not found'}, status=404)
+
+    filename = export.file.name.rsplit('/', 1)[-1]
+    etag = f'"{export.token.hex}-{export.size}"'
+    content_type = 'application/zip' if export.export_format == 'zip' else 'application/x-ndjson'
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if if_range is None or if_range == etag:
+        try:
+            byte_range = _parse_byte_range(request.headers.get('Range'), export.size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{export.size}'
+            return response
+
+    handle = export.file.storage.open(export.file.name, 'rb')
+    if byte_range is None:
+        response = FileResponse(handle, as_attachment=True, filename=filename, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _stream_file_range(handle, start, end - start + 1), status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{export.size}'
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
 
 @csrf_exempt
 def connect_wallet_session(request):
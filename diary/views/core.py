@@ -22,10 +22,12 @@ from django.db.models import Count, Sum, Avg, Min, Max, F, Q
 from django.contrib.auth.backends import ModelBackend
 
 from ..models import (
-    Entry, Tag, SummaryVersion, UserInsight, EntryTag, UserPreference, Journal, JournalTag
+    Entry, Tag, SummaryVersion, UserInsight, EntryTag, UserPreference, Journal, JournalTag,
+    UserWritingStats
 )
 from ..forms import EntryForm, SignUpForm
 from ..services.ai_service import AIService
+from ..cache import CacheService
 
 from allauth.account.utils import get_next_redirect_url
 from allauth.account.views import LoginView as AllauthLoginView, SignupView as AllauthSignupView
@@ -354,7 +356,7 @@ def dashboard(request):
     
     # Initialize default values for anonymous users
     entries = Entry.objects.none()
-    time_periods = {}
+    time_periods = []
     recent_entries = []
     insights = []
     streak = 0
@@ -406,68 +408,27 @@ def dashboard(request):
             except Exception as e:
                 logger.error(f"Error creating entry after login: {str(e)}")
 
-        # Get time periods - FIXED for SQLite
-        for entry in entries:
-            period = entry.get_time_period()  # This method should work fine
-            if period not in time_periods:
-                time_periods[period] = {
-                    'period': period,
-                    'count': 0,
-                    'entries': [],
-                    'first_entry': None,
-                    'color': 'sky-700'  # Default color
-                }
-
-            time_periods[period]['count'] += 1
-            time_periods[period]['entries'].append(entry)
-
-            # Keep track of first entry for preview
-            if time_periods[period]['first_entry'] is None or entry.created_at < time_periods[period]['first_entry'].created_at:
-                time_periods[period]['first_entry'] = entry
-
-        # Assign different colors to time periods
+        # Time periods are grouped in the database (one GROUP BY per quarter bucket)
         colors = ['sky-700', 'indigo-600', 'emerald-600', 'amber-600', 'rose-600']
-        for i, period_key in enumerate(time_periods.keys()):
-            time_periods[period_key]['color'] = colors[i % len(colors)]
+        time_periods = Entry.time_period_buckets(request.user)
+        for i, period in enumerate(time_periods):
+            period['color'] = colors[i % len(colors)]
 
         # Get recent entries
-        recent_entries = list(entries.order_by('-created_at')[:5])
+        recent_entries = list(entries.order_by('-created_at').prefetch_related('photos')[:5])
 
         # Get insights
         insights = list(UserInsight.objects.filter(user=request.user))
 
-        # Calculate streak - FIXED for SQLite
-        today = timezone.now().date()
-        entry_dates = list(entries.values_list('created_at__date', flat=True).distinct().order_by('-created_at__date'))
-
-        if entry_dates:
-            # Check if today or yesterday has an entry
-            if entry_dates[0] == today or entry_dates[0] == today - timedelta(days=1):
-                streak = 1
-                current_date = entry_dates[0]
-
-                # Count consecutive days
-                for entry_date in entry_dates[1:]:
-                    expected_date = current_date - timedelta(days=1)
-                    if entry_date == expected_date:
-                        streak += 1
-                        current_date = entry_date
-                    else:
-                        break
-
-        # Calculate stats for dashboard cards
-        total_entries = entries.count()
-        total_words = sum(len(entry.content.split()) for entry in entries)
-        
-        # Get mood distribution for quick stats
-        for entry in entries:
-            if entry.mood:
-                mood_counts[entry.mood] = mood_counts.get(entry.mood, 0) + 1
-        
-        dominant_mood = max(mood_counts.items(), key=lambda x: x[1])[0] if mood_counts else None
+        # Streak comes from the daily activity bitmap
+        streak = CacheService.get_activity_map(request.user).current_streak()
 
-    # Sort time periods by most recent first
-    sorted_periods = sorted(time_periods.values(), key=lambda x: x['period'], reverse=True) if time_periods else []
+        # Stats for dashboard cards come from the per-user rollup row
+        writing_stats = UserWritingStats.for_user(request.user)
+        total_entries = writing_stats.entry_count
+        total_words = writing_stats.total_words
+        mood_counts = dict(writing_stats.mood_counts)
+        dominant_mood = writing_stats.dominant_mood
 
     # Sample data for anonymous users to see what the dashboard looks like
     if is_anonymous:
@@ -505,7 +466,7 @@ def dashboard(request):
         }
 
     context = {
-        'time_periods': sorted_periods[:5] if not is_anonymous else sample_periods,
+        'time_periods': time_periods[:5] if not is_anonymous else sample_periods,
         'recent_entries': recent_entries,
         'insights': insights,
         'streak': streak,
@@ -521,32 +482,8 @@ def dashboard(request):
     return render(request, 'diary/dashboard.html', context)
 
 def calculate_writing_streak(user):
-    """
-    Optimized function to calculate writing streak
-    """
-    today = timezone.now().date()
-
-    # Get all entry dates for the user in the last year, ordered by date
-    entry_dates = Entry.objects.filter(
-        user=user,
-        created_at__date__gte=today - timedelta(days=365)
-    ).values_list('created_at__date', flat=True).distinct().order_by('-created_at__date')
-
-    if not entry_dates:
-        return 0
-
-    # Convert to set for O(1) lookups
-    entry_dates_set = set(entry_dates)
-
-    streak = 0
-    check_date = today
-
-    # Check consecutive days
-    while check_date in entry_dates_set:
-        streak += 1
-        check_date -= timedelta(days=1)
-
-    return streak
+    """Current writing streak, answered from the user's daily activity bitmap"""
+    return CacheService.get_activity_map(user).current_streak()
 
 def custom_login(request):
     """Custom login view that handles save_after_login flag"""
@@ -10,8 +10,10 @@ from django.db.models import Q, Count
 
 from ..models import Entry, Tag, SummaryVersion, EntryPhoto
 from ..forms import EntryForm, auto_generate_tags  # Import auto_generate_tags from forms
-from ..services.ai_service import AIService
+from ..services.summary_jobs import SummaryJobService
+from ..services.similarity_service import SimilarityService
 from ..utils.analytics import get_mood_emoji, get_tag_color  # Removed auto_generate_tags from here
+from ..utils.pagination import paginate_by_keyset, parse_page_size
 
 
 logger = logging.getLogger(__name__)
@@ -275,10 +277,15 @@ def entry_detail(request, entry_id):
 
     if request.method == 'POST':
         if 'regenerate_summary' in request.POST:
-            # Regenerate AI summary
+            # Regenerate AI summary in the background; the page picks it up on reload
             try:
-                AIService.generate_entry_summary(entry)
-                messages.success(request, 'Summary regenerated!')
+                job, created = SummaryJobService.enqueue(entry)
+                if job['status'] == 'completed':
+                    messages.success(request, 'Summary regenerated!')
+                elif created:
+                    messages.info(request, 'Regenerating summary. It will appear here in a moment.')
+                else:
+                    messages.info(request, 'Summary is already being regenerated.')
             except Exception as e:
                 logger.error(f"Error regenerating summary: {e}")
                 messages.error(request, 'Could not regenerate summary. Please try again.')
@@ -302,35 +309,28 @@ def entry_detail(request, entry_id):
             messages.success(request, 'Summary version restored!')
             return redirect('entry_detail', entry_id=entry.id)
 
-    # Get related entries (same tags)
-    related_entries = Entry.objects.filter(
-        user=request.user,
-        tags__in=entry.tags.all()
-    ).exclude(id=entry.id).distinct()[:3]
-
-    # Add debug information about photos
-    photos = entry.photos.all()
-    photo_count = photos.count()
-    photo_info = []
-
-    for photo in photos:
-        try:
-            photo_info.append({
-                'id': photo.id,
-                'url': photo.photo.url,
-                'exists': photo.photo.storage.exists(photo.photo.name)
-            })
-        except Exception as e:
-            photo_info.append({
-                'id': photo.id,
-                'error': str(e)
-            })
+    # Precomputed neighbours (content + tag similarity); falls back to shared
+    # tags until the index has been built for this entry
+    related_entries = list(SimilarityService.related_entries(entry, limit=3))
+    if not related_entries:
+        related_entries = Entry.objects.filter(
+            user=request.user,
+            tags__in=entry.tags.all()
+        ).exclude(id=entry.id).distinct().prefetch_related('photos')[:3]
+
+    # Photo state comes from the stored derivative metadata, not per-photo storage lookups
+    photos = list(entry.photos.all())
+    photo_info = [
+        {'id': photo.id, 'url': photo.medium_url, 'exists': photo.image_available is not False}
+        for photo in photos
+    ]
 
     context = {
         'entry': entry,
         'summary_versions': entry.versions.all() if hasattr(entry, 'versions') else [],
         'related_entries': related_entries,
-        'debug_photo_count': photo_count,
+        'photos': photos,
+        'debug_photo_count': len(photos),
         'debug_photo_info': photo_info
     }
 
@@ -421,39 +421,16 @@ def library(request):
         entries = all_entries.filter(tags__name=tag_filter)
         active_tab = 'tags'
         active_filter = tag_filter
-        tagged_entries = entries
     elif mood_filter:
         entries = all_entries.filter(mood=mood_filter)
         active_tab = 'moods'
         active_filter = mood_filter
-        mood_entries = entries
-
-    # Get time periods with minimal database queries
-    time_periods = {}
-    for entry in all_entries:
-        period = entry.get_time_period()
-        if period not in time_periods:
-            time_periods[period] = {
-                'period': period,
-                'count': 0,
-                'entries': [],
-                'first_entry': None,
-                'color': 'sky-700'
-            }
-
-        time_periods[period]['count'] += 1
-        time_periods[period]['entries'].append(entry)
-
-        if time_periods[period]['first_entry'] is None or entry.created_at < time_periods[period]['first_entry'].created_at:
-            time_periods[period]['first_entry'] = entry
-
-    # Assign different colors to time periods
-    colors = ['sky-700', 'indigo-600', 'emerald-600', 'amber-600', 'rose-600']
-    for i, period_key in enumerate(time_periods.keys()):
-        time_periods[period_key]['color'] = colors[i % len(colors)]
 
-    # Sort time periods by most recent first
-    sorted_periods = sorted(time_periods.values(), key=lambda x: x['period'], reverse=True)
+    # Time periods are grouped in the database; only each period's first entry is loaded
+    sorted_periods = Entry.time_period_buckets(request.user, with_first_entries=True)
+    colors = ['sky-700', 'indigo-600', 'emerald-600', 'amber-600', 'rose-600']
+    for i, period in enumerate(sorted_periods):
+        period['color'] = colors[i % len(colors)]
 
     # Get tags with their usage counts
     user_tags = Tag.objects.filter(user=request.user).annotate(
@@ -469,40 +446,37 @@ def library(request):
             'active': tag.name == tag_filter
         })
 
-    # Get moods with counts using Python aggregation
-    moods = []
-    mood_counts = {}
-    for entry in all_entries:
-        if entry.mood:
-            if entry.mood not in mood_counts:
-                mood_counts[entry.mood] = {
-                    'name': entry.mood,
-                    'count': 0,
-                    'emoji': get_mood_emoji(entry.mood),
-                    'active': entry.mood == mood_filter
-                }
-            mood_counts[entry.mood]['count'] += 1
-
-    moods = list(mood_counts.values())
-    moods.sort(key=lambda x: x['count'], reverse=True)
-
-    # If no specific entries are filtered, use all entries
-    if not tag_filter:
-        tagged_entries = all_entries
-    if not mood_filter:
-        mood_entries = all_entries
+    # Get moods with counts using a database GROUP BY
+    mood_rows = Entry.objects.filter(user=request.user).exclude(mood__isnull=True).exclude(mood='').values(
+        'mood'
+    ).annotate(count=Count('id')).order_by('-count')
+
+    moods = [
+        {
+            'name': row['mood'],
+            'count': row['count'],
+            'emoji': get_mood_emoji(row['mood']),
+            'active': row['mood'] == mood_filter
+        }
+        for row in mood_rows
+    ]
 
     # Calculate counts
-    total_entries = len(all_entries)
-    filtered_count = len(entries) if entries != all_entries else total_entries
+    total_entries = sum(period['count'] for period in sorted_periods)
+    filtered_count = entries.count() if entries is not all_entries else total_entries
+
+    # Keyset pagination on (created_at, id) - one page of the active list is loaded
+    entries_page = paginate_by_keyset(
+        entries, request.GET.get('cursor'), parse_page_size(request.GET.get('page_size'))
+    )
 
     context = {
         'time_periods': sorted_periods,
         'tags': tags,
         'moods': moods,
-        'entries': entries,
-        'tagged_entries': tagged_entries if 'tagged_entries' in locals() else all_entries,
-        'mood_entries': mood_entries if 'mood_entries' in locals() else all_entries,
+        'entries': entries_page,
+        'tagged_entries': entries_page if tag_filter else None,
+        'mood_entries': entries_page if mood_filter else None,
         'total_entries': total_entries,
         'filtered_count': filtered_count,
         'active_tab': active_tab,
@@ -515,17 +489,16 @@ def library(request):
 @login_required
 def time_period_view(request, period):
     """View entries for a specific time period"""
-    entries = Entry.objects.filter(
-        user=request.user
-    ).order_by('-created_at')
-
-    # Filter to just this period
-    period_entries = [entry for entry in entries if entry.get_time_period() == period]
+    # Indexed (user, created_at) range query instead of filtering every entry in Python
+    period_entries = Entry.for_period(request.user, period).prefetch_related('tags')
+    entries_page = paginate_by_keyset(
+        period_entries, request.GET.get('cursor'), parse_page_size(request.GET.get('page_size'))
+    )
 
     return render(request, 'diary/time_period.html', {
         'period': period,
-        'entries': period_entries,
-        'total_entries': len(period_entries)
+        'entries': entries_page,
+        'total_entries': period_entries.count()
     })
 
 @login_required
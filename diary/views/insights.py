@@ -6,7 +6,8 @@ from django.contrib import messages
 from django.contrib.auth import get_user_model
 
 from ..models import Entry, Tag, UserInsight
-from ..utils.analytics import get_mood_emoji, get_tag_color, mood_to_numeric_value
+from ..services.analytics_engine import EntryAnalytics
+from ..utils.analytics import get_tag_color
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -163,14 +164,15 @@ def insights(request):
     # Get all user entries
     entries = Entry.objects.filter(user=request.user)
 
-    # Generate mood distribution data
-    mood_distribution = generate_mood_distribution(entries)
+    # Mood distribution and trends come from one pass over the entries' moods
+    analytics = EntryAnalytics.from_queryset(entries, with_text=False)
+    mood_distribution = analytics.mood_distribution()
 
     # Generate tag distribution data
     tag_distribution = generate_tag_distribution(entries)
 
     # Generate time-based mood trend data for the chart
-    mood_trends = generate_mood_trends(entries)
+    mood_trends = analytics.mood_trends()
 
     context = {
         'mood_analysis': mood_analysis,
@@ -197,38 +199,24 @@ def generate_session_insights(anonymous_entries):
     if not anonymous_entries:
         return insights
     
-    # Extract moods and tags from anonymous entries
-    moods = []
+    # Extract tags from anonymous entries; moods and words go through the analytics engine
     all_tags = []
-    total_words = 0
-    
     for entry_id, entry_data in anonymous_entries.items():
-        if 'mood' in entry_data and entry_data['mood']:
-            moods.append(entry_data['mood'])
-        
         if 'tags' in entry_data:
             tags = entry_data.get('tags', [])
             if isinstance(tags, list):
                 all_tags.extend(tags)
             elif isinstance(tags, str):
                 all_tags.extend([t.strip() for t in tags.split(',') if t.strip()])
-        
-        if 'content' in entry_data:
-            total_words += len(entry_data['content'].split())
-    
+
+    analytics = EntryAnalytics(
+        [entry_data.get('content') or '' for entry_data in anonymous_entries.values()],
+        [entry_data.get('mood') for entry_data in anonymous_entries.values()],
+    )
+    total_words = analytics.total_words()
+
     # Generate mood distribution
-    if moods:
-        mood_counts = Counter(moods)
-        total_moods = sum(mood_counts.values())
-        insights['mood_distribution'] = [
-            {
-                'name': mood,
-                'count': count,
-                'percentage': round((count / total_moods) * 100),
-                'emoji': get_mood_emoji(mood)
-            }
-            for mood, count in mood_counts.most_common()
-        ]
+    insights['mood_distribution'] = analytics.mood_distribution()
     
     # Generate tag distribution
     if all_tags:
@@ -260,13 +248,13 @@ def generate_session_insights(anonymous_entries):
         })
     
     # Generate mood analysis
-    if moods:
-        mood_counter = Counter(moods)
-        most_common_mood = mood_counter.most_common(1)[0][0]
-        
+    mood_distribution = insights['mood_distribution']
+    if mood_distribution:
+        most_common_mood = mood_distribution[0]['name']
+
         mood_text = f"Your recent entries show you've been feeling mostly {most_common_mood}. "
-        if len(mood_counter) > 1:
-            mood_text += f"You've experienced {len(mood_counter)} different emotional states, showing emotional awareness and depth."
+        if len(mood_distribution) > 1:
+            mood_text += f"You've experienced {len(mood_distribution)} different emotional states, showing emotional awareness and depth."
         
         insights['mood_analysis'] = {
             'title': 'Your Emotional Journey',
@@ -279,7 +267,7 @@ def generate_session_insights(anonymous_entries):
         'content': 'Your entries are currently stored locally. Create an account to save them permanently, access them from any device, and unlock AI-powered insights.'
     })
     
-    if not moods:
+    if not mood_distribution:
         insights['suggestions'].append({
             'title': 'Track Your Moods',
             'content': 'Add mood tags to your entries to see emotional patterns and trends over time.'
@@ -293,112 +281,83 @@ def generate_fallback_insights(user):
     Generate basic insights when AIService fails.
     This ensures users always have some insights to view.
     """
-    entries = Entry.objects.filter(user=user)
+    analytics = EntryAnalytics.from_queryset(Entry.objects.filter(user=user))
 
-    if not entries.exists():
+    if not analytics.size:
         # Create basic "getting started" insights
-        UserInsight.objects.create(
-            user=user,
-            insight_type='mood_analysis',
-            title='Welcome to Your Insights',
-            content='Start journaling to see personalized insights about your mood patterns, emotional trends, and writing themes. Your insights will become more detailed as you add more entries.'
-        )
-
-        UserInsight.objects.create(
-            user=user,
-            insight_type='suggestion',
-            title='Getting Started',
-            content='Try writing about your day, your feelings, or what you\'re grateful for. The more you write, the better insights you\'ll receive!'
-        )
+        UserInsight.objects.bulk_create([
+            UserInsight(
+                user=user,
+                insight_type='mood_analysis',
+                title='Welcome to Your Insights',
+                content='Start journaling to see personalized insights about your mood patterns, emotional trends, and writing themes. Your insights will become more detailed as you add more entries.'
+            ),
+            UserInsight(
+                user=user,
+                insight_type='suggestion',
+                title='Getting Started',
+                content='Try writing about your day, your feelings, or what you\'re grateful for. The more you write, the better insights you\'ll receive!'
+            ),
+        ])
         return
 
+    insights = []
+
     # Generate mood analysis based on actual entries
-    moods = [entry.mood for entry in entries if entry.mood]
-    if moods:
-        mood_counter = Counter(moods)
-        most_common_mood = mood_counter.most_common(1)[0][0]
+    mood_distribution = analytics.mood_distribution()
+    if mood_distribution:
+        most_common_mood = mood_distribution[0]['name']
 
         mood_analysis_content = f"Based on your recent journal entries, you've been feeling mostly {most_common_mood}. "
 
-        if len(mood_counter) > 1:
-            mood_analysis_content += f"You've experienced {len(mood_counter)} different emotional states, showing a healthy range of emotions. "
+        if len(mood_distribution) > 1:
+            mood_analysis_content += f"You've experienced {len(mood_distribution)} different emotional states, showing a healthy range of emotions. "
 
         mood_analysis_content += "Continue journaling to track how your emotional patterns evolve over time."
     else:
         mood_analysis_content = "You haven't added mood information to your entries yet. Consider tracking your emotions to get deeper insights into your emotional patterns."
 
-    UserInsight.objects.create(
+    insights.append(UserInsight(
         user=user,
         insight_type='mood_analysis',
         title='Mood Analysis',
         content=mood_analysis_content
-    )
+    ))
 
     # Generate basic patterns
-    if len(entries) >= 3:
-        UserInsight.objects.create(
+    if analytics.size >= 3:
+        insights.append(UserInsight(
             user=user,
             insight_type='pattern',
             title='Journaling Consistency',
-            content=f'You have {len(entries)} journal entries, showing commitment to self-reflection and personal growth.'
-        )
+            content=f'You have {analytics.size} journal entries, showing commitment to self-reflection and personal growth.'
+        ))
 
     # Generate basic suggestions
-    recent_entries = entries.order_by('-created_at')[:5]
-    if recent_entries:
-        avg_length = sum(len(entry.content.split()) for entry in recent_entries) / len(recent_entries)
+    avg_length = analytics.average_words(analytics.recent_mask(5))
 
-        if avg_length < 50:
-            suggestion_content = "Consider writing longer entries to capture more details about your thoughts and feelings. Deeper reflection often leads to greater insights."
-        elif avg_length > 200:
-            suggestion_content = "Your detailed entries show great self-awareness. Try experimenting with different writing styles or prompts to explore new aspects of your experiences."
-        else:
-            suggestion_content = "Your entries show a good balance of reflection and detail. Consider adding tags to help categorize your thoughts and track specific themes over time."
+    if avg_length < 50:
+        suggestion_content = "Consider writing longer entries to capture more details about your thoughts and feelings. Deeper reflection often leads to greater insights."
+    elif avg_length > 200:
+        suggestion_content = "Your detailed entries show great self-awareness. Try experimenting with different writing styles or prompts to explore new aspects of your experiences."
+    else:
+        suggestion_content = "Your entries show a good balance of reflection and detail. Consider adding tags to help categorize your thoughts and track specific themes over time."
 
-        UserInsight.objects.create(
-            user=user,
-            insight_type='suggestion',
-            title='Writing Enhancement',
-            content=suggestion_content
-        )
+    insights.append(UserInsight(
+        user=user,
+        insight_type='suggestion',
+        title='Writing Enhancement',
+        content=suggestion_content
+    ))
+
+    UserInsight.objects.bulk_create(insights)
 
 def generate_mood_distribution(entries):
     """
     Analyze entries to extract mood distribution data.
     Returns a list of mood objects with name and percentage.
     """
-    # Skip if no entries
-    if not entries:
-        return []
-
-    # Extract moods from entries
-    moods = []
-    for entry in entries:
-        # Use entry's mood field
-        if entry.mood:
-            moods.append(entry.mood)
-
-    # Count occurrences of each mood
-    mood_counts = Counter(moods)
-
-    # Skip if no moods found
-    if not mood_counts:
-        return []
-
-    # Calculate percentages
-    total_moods = sum(mood_counts.values())
-    mood_distribution = [
-        {
-            'name': mood,
-            'count': count,
-            'percentage': round((count / total_moods) * 100),
-            # Add appropriate emoji for each mood
-            'emoji': get_mood_emoji(mood)
-        }
-        for mood, count in mood_counts.most_common()
-    ]
-
-    return mood_distribution
+    return EntryAnalytics.from_queryset(entries, with_text=False).mood_distribution()
 
 def generate_tag_distribution(entries):
     """
@@ -440,39 +399,7 @@ def generate_mood_trends(entries):
     Generate time-series data for mood trends over the past 30 days.
     Returns data suitable for a chart visualization.
     """
-    from django.utils import timezone
-    from datetime import timedelta
-
-    # Skip if no entries
-    if not entries:
-        return []
-
-    # Get entries from the last 30 days
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    recent_entries = entries.filter(created_at__gte=thirty_days_ago).order_by('created_at')
-
-    # Skip if no recent entries
-    if not recent_entries:
-        return []
-
-    # Extract date and mood data
-    trends_data = []
-    for entry in recent_entries:
-        date_str = entry.created_at.strftime('%Y-%m-%d')
-
-        # Get mood value
-        mood_value = 5  # Default neutral value
-
-        if entry.mood:
-            # Convert mood string to numeric value for chart
-            mood_value = mood_to_numeric_value(entry.mood)
-
-        trends_data.append({
-            'date': date_str,
-            'mood': mood_value
-        })
-
-    return trends_data
+    return EntryAnalytics.from_queryset(entries, with_text=False).mood_trends()
 
 # Keep the original function for reference (you can remove this if not needed)
 def generate_user_insights(user):
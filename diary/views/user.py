@@ -6,7 +6,6 @@ from django.db.models import Count
 from django.utils import timezone
 from django.contrib.auth.signals import user_logged_in
 from django.dispatch import receiver
-from django.db import IntegrityError
 from datetime import timedelta
 
 from django.http import JsonResponse
@@ -14,6 +13,7 @@ from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 
 from ..models import Entry, Tag, UserPreference
+from ..cache import CacheService
 
 logger = logging.getLogger(__name__)
 
@@ -58,21 +58,15 @@ def account_settings(request):
     # Calculate join date
     join_date = request.user.date_joined
 
-    # Simple placeholder for streak (you can implement proper streak calculation later)
+    # Streaks come from the daily activity bitmap
     streak = 0
     longest_streak = 0
-
-    # Try to get some basic streak information if Entry model exists
     try:
-        # Count entries in the last 7 days as a simple "streak" placeholder
-        recent_entries = Entry.objects.filter(
-            user=request.user,
-            created_at__gte=timezone.now() - timedelta(days=7)
-        ).count()
-        streak = min(recent_entries, 7)  # Cap at 7 for now
-        longest_streak = streak  # Simplified version
-    except:
-        pass
+        activity = CacheService.get_activity_map(request.user)
+        streak = activity.current_streak()
+        longest_streak = activity.longest_streak()
+    except Exception as e:
+        logger.error(f"Error loading activity map for user {request.user.id}: {e}")
 
     return render(request, 'diary/account_settings.html', {
         'total_entries': total_entries,
@@ -165,25 +159,14 @@ def save_pending_entry(sender, user, request, **kwargs):
                 tags = auto_generate_tags(entry_data.get('content'), entry_data.get('mood'))
 
             if tags:
-                for tag_name in tags:
-                    tag_name = tag_name.lower().strip()
-                    try:
-                        tag, created = Tag.objects.get_or_create(
-                            name=tag_name,
-                            user=user
-                        )
-                    except IntegrityError:
-                        # If there's an integrity error, try once more
-                        tag = Tag.objects.get(name=tag_name, user=user)
-
-                    entry.tags.add(tag)
-
-            # Optional: generate summary
+                entry.tags.add(*Tag.resolve_names(user, tags))
+
+            # Optional: generate summary in the background
             try:
-                from ..services.ai_service import AIService
-                AIService.generate_entry_summary(entry)
+                from ..tasks import generate_entry_summary_async
+                generate_entry_summary_async.apply_async((entry.id,), retry=False)
             except Exception as e:
-                logger.error(f"Failed to generate summary for pending entry: {str(e)}")
+                logger.error(f"Failed to queue summary for pending entry: {str(e)}")
 
             # Set a flag to indicate entry was saved
             request.session['entry_saved'] = True
@@ -237,13 +237,7 @@ def handle_pending_entry(request, user):
             tags = auto_generate_tags(pending_entry.get('content'), pending_entry.get('mood'))
         
         if tags:
-            for tag_name in tags:
-                if isinstance(tag_name, str) and tag_name.strip():
-                    tag, created = Tag.objects.get_or_create(
-                        name=tag_name.lower().strip(),
-                        user=user
-                    )
-                    entry.tags.add(tag)
+            entry.tags.add(*Tag.resolve_names(user, tags))
         
         # Handle photo if it was mentioned
         if pending_entry.get('had_photo'):
@@ -620,13 +614,7 @@ def anonymous_entry_preview(request, entry_uuid):
                 
                 # Add tags
                 tags = entry_data.get('tags', [])
-                for tag_name in tags:
-                    if tag_name:
-                        tag, created = Tag.objects.get_or_create(
-                            name=tag_name.lower().strip(),
-                            user=request.user
-                        )
-                        entry.tags.add(tag)
+                entry.tags.add(*Tag.resolve_names(request.user, tags))
                 
                 # Remove from anonymous entries
                 del anonymous_entries[entry_uuid_str]